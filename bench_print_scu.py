@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+bench_print_scu.py
+
+مولد حمل لخادم الطباعة: N اتصال متزامن، كل اتصال ينفذ التسلسل الكامل
+FilmSession N-CREATE -> FilmBox N-CREATE -> N-SET لكل صندوق صورة -> N-ACTION
+بأحجام صور وأعماق بت وتنسيقات قابلة للتحديد، ثم يعرض:
+  - زمن كل عملية DIMSE (p50 / p95 / p99)
+  - الصور/الثانية من جهة العميل ومن جهة الخادم (حتى انتهاء الطباعة مع --in-process)
+  - ذاكرة الخادم RSS (القصوى والنهائية)
+
+أمثلة:
+    python bench_print_scu.py --in-process -c 4 -n 25 --size 2048x2048 --bits 12
+    python bench_print_scu.py --host 10.0.0.5 --port 104 --server-pid 1234 --layout 'STANDARD\\2,2'
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+from pydicom.dataset import Dataset
+from pydicom.uid import generate_uid
+from pynetdicom import AE
+from pynetdicom.sop_class import (
+    BasicColorImageBox,
+    BasicColorPrintManagementMeta,
+    BasicFilmBox,
+    BasicFilmSession,
+    BasicGrayscaleImageBox,
+    BasicGrayscalePrintManagementMeta,
+)
+
+from config import load_config
+
+OPERATIONS = ("N-CREATE FilmSession", "N-CREATE FilmBox", "N-SET ImageBox", "N-ACTION FilmBox")
+
+# =================================================================
+#                 بيانات الصور الاصطناعية
+# =================================================================
+
+def parse_size(value):
+    """512 أو 512x384 -> (rows, cols)"""
+    rows, _, cols = value.lower().partition('x')
+    return int(rows), int(cols or rows)
+
+def synthetic_pixels(rows, cols, bits, color=False, seed=0):
+    """تدرج + ضوضاء بعمق bits (8 / 12 / 16) - يُنشأ مرة واحدة لكل حجم قبل القياس"""
+    rng = np.random.default_rng(seed)
+    top = (1 << bits) - 1
+    ramp = np.linspace(0, top, cols, dtype=np.float64)[None, :] * np.linspace(0.25, 1.0, rows)[:, None]
+    noise = rng.normal(0, top * 0.02, (rows, cols))
+    values = np.clip(ramp + noise, 0, top)
+    if color:
+        values = np.stack([values, values[::-1], values[:, ::-1]], axis=-1)
+    return values.astype('u1' if bits <= 8 else '<u2').tobytes()
+
+def image_dataset(pixels, rows, cols, bits, color=False):
+    img = Dataset()
+    img.Rows = rows
+    img.Columns = cols
+    if color:
+        img.SamplesPerPixel = 3
+        img.PhotometricInterpretation = 'RGB'
+        img.PlanarConfiguration = 0
+    else:
+        img.SamplesPerPixel = 1
+        img.PhotometricInterpretation = 'MONOCHROME2'
+    img.BitsAllocated = 8 if bits <= 8 else 16
+    img.BitsStored = bits
+    img.HighBit = bits - 1
+    img.PixelRepresentation = 0
+    img.PixelData = pixels
+    return img
+
+# =================================================================
+#                 القياس
+# =================================================================
+
+class Recorder:
+    """أزمنة كل عملية DIMSE وحالات الفشل - مشتركة بين خيوط العملاء"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {op: [] for op in OPERATIONS}
+        self.failures = {}
+        self.images = 0
+        self.films = 0
+        self.bytes = 0
+
+    def timed(self, op, call):
+        started = time.perf_counter()
+        status, rsp = call()
+        elapsed = time.perf_counter() - started
+        code = getattr(status, 'Status', None)
+        with self._lock:
+            self.latencies[op].append(elapsed)
+            if code != 0x0000:
+                key = f"{op} {'no response' if code is None else hex(code)}"
+                self.failures[key] = self.failures.get(key, 0) + 1
+        return code == 0x0000, rsp
+
+    def add(self, images=0, films=0, nbytes=0):
+        with self._lock:
+            self.images += images
+            self.films += films
+            self.bytes += nbytes
+
+def percentiles(values):
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {'count': len(values), 'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2), 'max_ms': round(arr.max(), 2)}
+
+def read_rss(pid):
+    """RSS بالبايت لعملية - psutil إن توفر وإلا /proc (لينكس)"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f'/proc/{pid}/status') as fp:
+            for line in fp:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class RssSampler(threading.Thread):
+    """أخذ RSS كل interval ثانية وحفظ القيمة القصوى"""
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.start_rss = read_rss(pid)
+        self.peak = self.start_rss or 0
+        self.last = self.start_rss
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            rss = read_rss(self.pid)
+            if rss is None:
+                return
+            self.last = rss
+            self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        rss = read_rss(self.pid)
+        if rss is not None:
+            self.last = rss
+            self.peak = max(self.peak, rss)
+
+# =================================================================
+#                 جلسة طباعة واحدة
+# =================================================================
+
+def run_film(assoc, recorder, meta, image_box_class, sequence_keyword, layout, images):
+    """FilmSession -> FilmBox -> N-SET لكل صندوق -> N-ACTION - تعيد True عند النجاح"""
+    fs_uid = generate_uid()
+    fs = Dataset()
+    fs.NumberOfCopies = 1
+    fs.PrintPriority = 'MED'
+    fs.MediumType = 'PAPER'
+    ok, _ = recorder.timed(OPERATIONS[0], lambda: assoc.send_n_create(fs, BasicFilmSession, fs_uid, meta_uid=meta))
+    if not ok:
+        return False
+
+    fb_uid = generate_uid()
+    fb = Dataset()
+    fb.ImageDisplayFormat = layout
+    fb.FilmOrientation = 'PORTRAIT'
+    fb.FilmSizeID = 'A4'
+    ref = Dataset()
+    ref.ReferencedSOPClassUID = BasicFilmSession
+    ref.ReferencedSOPInstanceUID = fs_uid
+    fb.ReferencedFilmSessionSequence = [ref]
+    ok, rsp = recorder.timed(OPERATIONS[1], lambda: assoc.send_n_create(fb, BasicFilmBox, fb_uid, meta_uid=meta))
+    if not ok or rsp is None or 'ReferencedImageBoxSequence' not in rsp:
+        return False
+
+    sent = 0
+    for position, (box, image) in enumerate(zip(rsp.ReferencedImageBoxSequence, itertools.cycle(images)), 1):
+        ib = Dataset()
+        ib.ImageBoxPosition = position
+        setattr(ib, sequence_keyword, [image])
+        box_uid = box.ReferencedSOPInstanceUID
+        ok, _ = recorder.timed(OPERATIONS[2], lambda: assoc.send_n_set(ib, image_box_class, box_uid, meta_uid=meta))
+        if ok:
+            sent += 1
+            recorder.add(images=1, nbytes=len(image.PixelData))
+
+    ok, _ = recorder.timed(OPERATIONS[3], lambda: assoc.send_n_action(None, 1, BasicFilmBox, fb_uid, meta_uid=meta))
+    if ok:
+        recorder.add(films=1)
+    return ok and sent > 0
+
+def worker(index, args, recorder, images, errors):
+    meta = BasicColorPrintManagementMeta if args.color else BasicGrayscalePrintManagementMeta
+    image_box_class = BasicColorImageBox if args.color else BasicGrayscaleImageBox
+    keyword = 'BasicColorImageSequence' if args.color else 'BasicGrayscaleImageSequence'
+
+    ae = AE(ae_title=args.ae_title)
+    ae.add_requested_context(meta)
+    ae.maximum_pdu_length = args.max_pdu
+    ae.dimse_timeout = args.timeout
+    ae.network_timeout = args.timeout
+    layouts = itertools.cycle(args.layout)
+    # اتصال واحد لكل الأفلام، أو اتصال جديد لكل فيلم مع --reconnect
+    batches = [1] * args.films if args.reconnect else [args.films]
+
+    for films in batches:
+        assoc = ae.associate(args.host, args.port, ae_title=args.called_ae)
+        if not assoc.is_established:
+            errors.append(f"worker {index}: association rejected/aborted")
+            return
+        try:
+            for _ in range(films):
+                run_film(assoc, recorder, meta, image_box_class, keyword, next(layouts), images)
+        finally:
+            if assoc.is_established:
+                assoc.release()
+
+# =================================================================
+#                 خادم داخل نفس العملية (واجهة null)
+# =================================================================
+
+def wait_for_port(host, port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def start_in_process_server(port):
+    """تشغيل dicom_print_scp في خيط بواجهة NullBackend - يعيد الوحدة للاستعلام عن الطابور"""
+    import dicom_print_scp as scp
+    from print_backends import NullBackend, set_backend
+
+    set_backend(NullBackend())
+    scp.print_manager.backend = None
+    scp.config['Port'] = port
+    threading.Thread(target=scp.main, name='bench-scp', daemon=True).start()
+    if not wait_for_port('127.0.0.1', port):
+        raise RuntimeError(f"in-process SCP did not start on port {port}")
+    return scp
+
+def wait_for_jobs(scp, timeout):
+    """انتظار انتهاء كل مهام الطباعة - يعيد وقت الانتهاء"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(job['finished_at'] for job in scp.print_queue.jobs()) and not scp.print_queue.pending():
+            break
+        time.sleep(0.02)
+    return time.perf_counter()
+
+# =================================================================
+#                 التشغيل
+# =================================================================
+
+def build_parser():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="DICOM print SCP load generator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config['Port'])
+    parser.add_argument('--called-ae', default=config['AETitle'])
+    parser.add_argument('--ae-title', default='BENCH_SCU')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='concurrent associations')
+    parser.add_argument('-n', '--films', type=int, default=10, help='films per association')
+    parser.add_argument('--reconnect', action='store_true', help='new association for every film')
+    parser.add_argument('--layout', action='append', help="ImageDisplayFormat, repeatable (default STANDARD\\1,1)")
+    parser.add_argument('--size', action='append', help='image size ROWSxCOLS, repeatable (default 1024x1024)')
+    parser.add_argument('--bits', type=int, choices=(8, 12, 16), default=12)
+    parser.add_argument('--color', action='store_true', help='RGB 8-bit through Basic Color Print Management')
+    parser.add_argument('--max-pdu', type=int, default=0, help='requested max PDU (0 = unlimited)')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--in-process', action='store_true', help='start the SCP in this process with the null backend')
+    parser.add_argument('--server-pid', type=int, help='PID of an external SCP for RSS sampling')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.layout = args.layout or ['STANDARD\\1,1']
+    if args.color:
+        args.bits = 8
+
+    images = []
+    for i, size in enumerate(args.size or ['1024x1024']):
+        rows, cols = parse_size(size)
+        pixels = synthetic_pixels(rows, cols, args.bits, args.color, seed=i)
+        images.append(image_dataset(pixels, rows, cols, args.bits, args.color))
+
+    scp = None
+    if args.in_process:
+        args.host = '127.0.0.1'
+        scp = start_in_process_server(args.port)
+        pid = os.getpid()
+    else:
+        pid = args.server_pid
+    sampler = RssSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+
+    recorder = Recorder()
+    errors = []
+    threads = [
+        threading.Thread(target=worker, args=(i, args, recorder, images, errors), name=f'bench-{i}')
+        for i in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sent = time.perf_counter()
+    finished = wait_for_jobs(scp, args.timeout) if scp else None
+    if sampler:
+        sampler.stop()
+
+    client_seconds = sent - started
+    report = {
+        'concurrency': args.concurrency,
+        'films': recorder.films,
+        'images': recorder.images,
+        'image_sizes': args.size or ['1024x1024'],
+        'bits': args.bits,
+        'color': args.color,
+        'layouts': args.layout,
+        'megabytes': round(recorder.bytes / 1e6, 1),
+        'client_seconds': round(client_seconds, 3),
+        'images_per_sec': round(recorder.images / client_seconds, 2) if client_seconds else 0,
+        'mb_per_sec': round(recorder.bytes / 1e6 / client_seconds, 2) if client_seconds else 0,
+        'latency': {op: percentiles(values) for op, values in recorder.latencies.items()},
+        'failures': recorder.failures,
+        'errors': errors,
+    }
+    if finished is not None:
+        total = finished - started
+        jobs = scp.print_queue.jobs()
+        report['server_seconds'] = round(total, 3)
+        report['printed_images_per_sec'] = round(recorder.images / total, 2) if total else 0
+        report['jobs_failed'] = sum(1 for job in jobs if job['status'] == 'failed')
+    if sampler and sampler.start_rss is not None:
+        report['server_rss_mb'] = {
+            'start': round(sampler.start_rss / 2**20, 1),
+            'peak': round(sampler.peak / 2**20, 1),
+            'end': round(sampler.last / 2**20, 1),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 1 if errors or recorder.failures else 0
+
+def print_report(report):
+    print("========================================")
+    print(f"🏁 {report['films']} فيلم / {report['images']} صورة ({report['megabytes']} MB) "
+          f"عبر {report['concurrency']} اتصال في {report['client_seconds']} ث")
+    print(f"📈 {report['images_per_sec']} صورة/ث - {report['mb_per_sec']} MB/ث (جهة العميل)")
+    if 'server_seconds' in report:
+        print(f"🖨️ حتى انتهاء الطباعة: {report['server_seconds']} ث - "
+              f"{report['printed_images_per_sec']} صورة/ث، مهام فاشلة: {report['jobs_failed']}")
+    print(f"{'DIMSE':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for op, stats in report['latency'].items():
+        if stats:
+            print(f"{op:<22}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                  f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    if 'server_rss_mb' in report:
+        rss = report['server_rss_mb']
+        print(f"🧠 RSS الخادم: بداية {rss['start']} MB، أقصى {rss['peak']} MB، نهاية {rss['end']} MB")
+    for failure, count in report['failures'].items():
+        print(f"❌ {failure}: {count}")
+    for error in report['errors']:
+        print(f"❌ {error}")
+
+if __name__ == "__main__":
+    sys.exit(main())
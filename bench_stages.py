@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+bench_stages.py
+
+قياس دقيق لمراحل الطباعة والتحويل على صور اصطناعية (8 / 12 / 16 بت، من 512² حتى 4096²):
+  decode   create_image_from_pixel_data      (PixelData خام -> صورة PIL بعد النافذة)
+  compose  create_print_job_image            (تصغير لحجم الصفحة + الرأس)
+  fit_cell fit_size + resize_once           (إلى خلية STANDARD\\2,2 على A4 كما في compose_film)
+  normalize converter.normalize_array
+  convert  converter.dicom_to_image          (قراءة ملف DICOM -> JPEG)
+  spill    utils.save_pixel_data             (نسخة احتياطية JPEG)
+
+لكل مرحلة وحجم: الزمن (الوسيط والأدنى من عدة تكرارات) والذاكرة القصوى (tracemalloc، تشمل مصفوفات numpy
+وليس مخازن Pillow الداخلية). النتائج تُحفظ كخط أساس JSON، والتشغيل اللاحق يفشل (exit 1) إن تراجعت مرحلة
+أكثر من --threshold مقارنة بخط الأساس.
+
+أمثلة:
+    python bench_stages.py --save-baseline
+    python bench_stages.py --sizes 512,2048 --bits 12 --threshold 0.2
+"""
+
+import argparse
+import gc
+import json
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+import converter
+import utils
+from dicom_print_scp import create_image_from_pixel_data, create_print_job_image
+from film_compositor import fit_size, layout_cells, resize_once
+
+DEFAULT_BASELINE = "bench_baseline.json"
+DEFAULT_SIZES = (512, 1024, 2048, 4096)
+DEFAULT_BITS = (8, 12, 16)
+# صفحة print_image_advanced الافتراضية (A4 عند 300 DPI)
+PAGE_SIZE = (2480, 3508)
+# خلية film_compositor لمرحلة fit_cell: 1240x1754 تقريبًا، فتُكبَّر 512/1024 وتُصغَّر 2048/4096
+# (التصغير لحجم الصفحة بـ max_scale=1.0 لا يغير صورًا حتى 2480 بكسل فلا يقيس شيئًا)
+CELL_FORMAT = "STANDARD\\2,2"
+# فروق أصغر من هذه لا تُعد تراجعًا مهما كانت النسبة (ضجيج القياس)
+MIN_DELTA_MS = 2.0
+MIN_DELTA_BYTES = 1024 * 1024
+
+# =================================================================
+#                 المدخلات الاصطناعية
+# =================================================================
+
+def synthetic_array(size, bits, seed=0):
+    """تدرج + ضوضاء بعمق bits في uint8 أو uint16"""
+    rng = np.random.default_rng(seed)
+    top = (1 << bits) - 1
+    ramp = np.add.outer(np.arange(size), np.arange(size)) * (top / (2 * size - 2))
+    values = np.clip(ramp + rng.normal(0, top * 0.02, (size, size)), 0, top)
+    return values.astype(np.uint8 if bits <= 8 else np.uint16)
+
+def write_dicom(path, arr, bits):
+    """ملف Secondary Capture صغير لقياس converter.dicom_to_image من القرص"""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.SOPClassUID = SecondaryCaptureImageStorage
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.Rows, ds.Columns = arr.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = arr.dtype.itemsize * 8
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    ds.PixelData = arr.tobytes()
+    try:
+        ds.save_as(path, enforce_file_format=True)  # pydicom >= 3
+    except TypeError:
+        ds.save_as(path, write_like_original=False)
+    return path
+
+# =================================================================
+#                 المراحل
+# =================================================================
+
+def stage_calls(size, bits, workdir):
+    """{اسم المرحلة: دالة بدون معاملات} - التجهيز خارج القياس"""
+    arr = synthetic_array(size, bits)
+    raw = arr.tobytes()
+    bits_allocated = arr.dtype.itemsize * 8
+    image = create_image_from_pixel_data(raw, size, size, bits_allocated, bits_stored=bits)
+    dicom_path = write_dicom(os.path.join(workdir, f"bench_{size}_{bits}.dcm"), arr, bits)
+    spill_bytes = raw[: size * size]
+
+    x0, y0, x1, y1 = layout_cells(CELL_FORMAT, PAGE_SIZE, 8)[0]   # margin الافتراضي في compose_film
+    cell_size = fit_size(image.size, (x1 - x0, y1 - y0))
+
+    return {
+        'decode': lambda: create_image_from_pixel_data(raw, size, size, bits_allocated, bits_stored=bits),
+        'compose': lambda: create_print_job_image(image, {}),
+        'fit_cell': lambda: resize_once(image, cell_size),
+        'normalize': lambda: converter.normalize_array(arr),
+        'convert': lambda: converter.dicom_to_image(dicom_path),
+        'spill': lambda: utils.save_pixel_data(spill_bytes, f"bench_{size}_{bits}"),
+    }
+
+def measure(call, repeat):
+    """(قائمة الأزمنة بالثواني، الذاكرة القصوى بالبايت) - الذاكرة في تشغيل منفصل لأن tracemalloc يبطئ"""
+    call()  # تسخين: الكاش، الاستيراد الكسول، جداول LUT
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+def run(sizes, bits_list, stages, repeat, quiet=False):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="rcp-bench-") as workdir:
+        # المخرجات (JPEG) داخل المجلد المؤقت بدل output/
+        utils.OUTPUT_DIR = pathlib.Path(workdir)
+        for size in sizes:
+            for bits in bits_list:
+                calls = stage_calls(size, bits, workdir)
+                for name, call in calls.items():
+                    if stages and name not in stages:
+                        continue
+                    times, peak = measure(call, repeat)
+                    key = f"{name}/{size}/{bits}"
+                    results[key] = {
+                        'median_ms': round(statistics.median(times) * 1000, 3),
+                        'min_ms': round(min(times) * 1000, 3),
+                        'peak_bytes': peak,
+                    }
+                    if not quiet:
+                        r = results[key]
+                        print(f"{key:<22}{r['median_ms']:>11.2f}{r['min_ms']:>11.2f}{peak / 2**20:>11.1f}")
+    return results
+
+# =================================================================
+#                 خط الأساس والمقارنة
+# =================================================================
+
+def environment():
+    import PIL
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+def compare(results, baseline, threshold):
+    """قائمة التراجعات [(المفتاح، المقياس، القديم، الجديد)]"""
+    regressions = []
+    for key, current in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if (current['median_ms'] > old['median_ms'] * (1 + threshold)
+                and current['median_ms'] - old['median_ms'] > MIN_DELTA_MS):
+            regressions.append((key, 'median_ms', old['median_ms'], current['median_ms']))
+        if (current['peak_bytes'] > old['peak_bytes'] * (1 + threshold)
+                and current['peak_bytes'] - old['peak_bytes'] > MIN_DELTA_BYTES):
+            regressions.append((key, 'peak_bytes', old['peak_bytes'], current['peak_bytes']))
+    return regressions
+
+def parse_list(value, cast=int):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the decode/window/render/spool stages")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='square sizes, e.g. 512,1024')
+    parser.add_argument('--bits', default=','.join(map(str, DEFAULT_BITS)), help='bit depths, e.g. 8,12,16')
+    parser.add_argument('--stages', default='', help='comma separated subset of stages')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown/growth ratio (0.25 = 25%%)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    stages = set(parse_list(args.stages, str))
+    print(f"{'stage/size/bits':<22}{'median ms':>11}{'min ms':>11}{'peak MB':>11}")
+    results = run(parse_list(args.sizes), parse_list(args.bits), stages, max(1, args.repeat))
+    document = {'environment': environment(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fp:
+            json.dump(document, fp, indent=2)
+
+    if args.save_baseline:
+        # دمج مع خط الأساس الحالي حتى لا يضيع ما لم يُقس في هذا التشغيل
+        previous = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as fp:
+                previous = json.load(fp).get('results', {})
+        document['results'] = {**previous, **results}
+        with open(args.baseline, 'w', encoding='utf-8') as fp:
+            json.dump(document, fp, indent=2, sort_keys=True)
+        print(f"💾 تم حفظ خط الأساس: {args.baseline} ({len(document['results'])} قياس)")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ لا يوجد خط أساس ({args.baseline}) - استخدم --save-baseline")
+        return 0
+    with open(args.baseline, encoding='utf-8') as fp:
+        stored = json.load(fp)
+    if stored.get('environment') != document['environment']:
+        print("⚠️ خط الأساس من بيئة مختلفة - المقارنة تقريبية")
+    regressions = compare(results, stored.get('results', {}), args.threshold)
+    if not regressions:
+        print(f"✅ لا تراجع أكثر من {args.threshold:.0%} مقارنة بخط الأساس")
+        return 0
+    for key, metric, old, new in regressions:
+        change = (new - old) / old if old else float('inf')
+        print(f"❌ تراجع {key} {metric}: {old} -> {new} (+{change:.0%})")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# config.py
+# تحميل إعدادات الخادم من print_config.json مع قيم افتراضية لكل مفتاح
+
+import json
+import os
+import pathlib
+
+BASE = pathlib.Path(__file__).parent.resolve()
+CONFIG_PATH = os.environ.get("RCP_CONFIG", str(BASE / "print_config.json"))
+
+DEFAULTS = {
+    "FilmSizeID": "A4",
+    "FilmOrientation": "PORTRAIT",
+    "MagnificationType": "NONE",
+    # طابور الطباعة: الحد الأقصى للمهام المنتظرة وعدد العمال
+    "PrintQueueSize": 32,
+    "PrintWorkers": 2,
+    # واجهة الطباعة: auto / win32 / cups / file / null
+    "PrintBackend": "auto",
+    "PrinterName": None,
+    "PrintOutputDir": "print_output",
+    "PrintOutputFormat": "png",
+    "PrintSpoolDir": None,
+    # عدد الملفات في أمر lp واحد والمهلة القصوى قبل الإرسال
+    "CupsBatchSize": 1,
+    "CupsBatchTimeout": 2.0,
+    # صناديق الصور الأكبر من هذا الحد (بايت) تُنقل لملف مؤقت مُعيَّن في الذاكرة (0 = تعطيل)
+    "PixelSpillThreshold": 16 * 1024 * 1024,
+    "PixelSpillDir": None,
+    # مخزن الجلسات: ميزانية الذاكرة لصناديق الصور (بايت، 0 = بلا حد) ومهلة عدم الاستخدام (ثانية)
+    "SessionMaxBytes": 512 * 1024 * 1024,
+    "SessionTTL": 1800,
+    "SessionSweepInterval": 60,
+    # مجلد حفظ صور C-STORE المستلمة (None = بدون حفظ، الفك يتم في الذاكرة دائمًا)
+    "StoreSpoolDir": None,
+    # مستويات السجل لكل وحدة (rcp.<module> للوحدات الداخلية) - DEBUG لتفاصيل كل خطوة
+    "LogLevels": {"rcp": "INFO", "pynetdicom": "WARNING", "pydicom": "WARNING"},
+    # الشبكة: أقصى حجم PDU نستقبله (0 = بلا حد) ومهل ACSE / DIMSE / الشبكة بالثواني
+    "AETitle": "DICOM_PRINT_SCP",
+    "Port": 11112,
+    "MaxPDULength": 0,
+    "ACSETimeout": 30,
+    "DIMSETimeout": 30,
+    "NetworkTimeout": 60,
+    # صيغ النقل المقبولة لكل SOP Class (الاسم أو UID) بترتيب الأفضلية، و default لبقية الأصناف
+    # صيغ الضغط تُقبل لصناديق الصور عبر Meta SOP Classes وتُستبعد تلقائيًا إن لم تتوفر إضافة لفكها
+    "TransferSyntaxes": {
+        "default": ["ExplicitVRLittleEndian", "ImplicitVRLittleEndian"],
+        "BasicGrayscalePrintManagementMeta": [
+            "ExplicitVRLittleEndian", "ImplicitVRLittleEndian", "RLELossless",
+            "JPEGLosslessSV1", "JPEGLSLossless", "JPEG2000Lossless", "JPEGBaseline8Bit",
+        ],
+        "BasicColorPrintManagementMeta": [
+            "ExplicitVRLittleEndian", "ImplicitVRLittleEndian", "RLELossless",
+            "JPEGLosslessSV1", "JPEGLSLossless", "JPEG2000Lossless", "JPEGBaseline8Bit",
+        ],
+    },
+    # عدد عمليات فك PixelData المضغوط (0 = الفك في خيط عامل الطباعة)
+    "DecodeWorkers": 2,
+    # عدد عمليات التحويل الجماعي في converter.py (0 = عدد المعالجات)
+    "ConvertWorkers": 0,
+    # كاش التحويل (sha256 للمحتوى + المعاملات): المجلد (None = تعطيل) والحد الأقصى بالبايت
+    "ConversionCacheDir": "conversion_cache",
+    "ConversionCacheMaxBytes": 2 * 1024 * 1024 * 1024,
+    # تحويل النص إلى PDF بالتدفق: أقصى عدد صفحات لكل مهمة (0 = بلا حد) وتقسيم كل N صفحة لملف (0 = ملف واحد)
+    "TextPdfMaxPages": 500,
+    "TextPdfChunkPages": 0,
+    # رفع HTTP: مجلد الاستقبال (None = received)، الحد الأقصى للملف، حجم القطعة، وطابور التحويل والطباعة
+    "UploadSpoolDir": None,
+    "UploadMaxBytes": 512 * 1024 * 1024,
+    "UploadChunkBytes": 1024 * 1024,
+    "UploadQueueSize": 16,
+    "UploadWorkers": 2,
+    # إبقاء الملف المرفوع ومخرجات تحويله (<الملف>.out) بعد انتهاء المهمة - للتشخيص فقط، وإلا تُحذف
+    "UploadKeepFiles": False,
+    # تتبع مراحل كل مهمة (سطر سجل منظم عند انتهائها) وملف Chrome Trace اختياري (None = بدون ملف)
+    "Tracing": True,
+    "TraceFile": None,
+    # وضع القياس: تسجيل البايتات/الثانية لكل اتصال عند انتهائه
+    "MeasureThroughput": False,
+    # service.py: عنوان واجهة HTTP بجانب DICOM، ومهلة الإغلاق المرتب (ثوانٍ لإنهاء الاتصالات والمهام الجارية)
+    "HttpHost": "0.0.0.0",
+    "HttpPort": 8080,
+    "ShutdownTimeout": 60,
+    # خادم HTTP: auto (waitress إن وُجد وإلا werkzeug متعدد الخيوط) / waitress / werkzeug، عدد الخيوط،
+    # مهلة خمول اتصال keep-alive بالثواني، و X-Sendfile لتسليم الملفات عبر خادم أمامي (Apache / lighttpd)
+    "HttpServer": "auto",
+    "HttpThreads": 8,
+    "HttpKeepAlive": 30,
+    "HttpXSendfile": False,
+    # main.py: حفظ نسخة PNG للمعاينة بجانب كل PDF (من نفس الصورة المحوَّلة، بدون فك ثانٍ)
+    "SavePngPreview": True,
+}
+
+def load_config(path=None):
+    """قراءة ملف الإعدادات ودمجه فوق القيم الافتراضية"""
+    cfg = dict(DEFAULTS)
+    path = path or CONFIG_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            cfg.update(json.load(fp))
+    except FileNotFoundError:
+        pass
+    return cfg
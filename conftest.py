@@ -0,0 +1,5 @@
+# conftest.py
+# إعداد pytest: الاختبارات في tests/ وتستورد الوحدات من جذر المستودع
+# سكربتات SCU القديمة تتصل بخادم فعلي عند استيرادها فلا تُجمع كاختبارات
+
+collect_ignore = ["test_scu.py", "test_print_scu.py"]
@@ -0,0 +1,231 @@
+# conversion_cache.py
+# كاش التحويل: المفتاح = sha256 لمحتوى الملف + معاملات التحويل (النافذة، الصيغة، الحجم)
+# كل مدخل مجلد داخل ConversionCacheDir، والإخلاء LRU حسب آخر استخدام عند تجاوز الحد
+# المدخل المستخدم (pinned) لا يُخلى، و checkout يعطي المستدعي روابط صلبة يملكها فلا يحذفها الإخلاء أثناء الطباعة
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from config import BASE, load_config
+from log import safe_print
+from metrics import register_gauge
+
+# يُرفع عند تغيير مخرجات المحولات أو طريقة اشتقاق المفتاح حتى لا تُعاد مخرجات قديمة
+CACHE_VERSION = 2
+HASH_CHUNK = 1024 * 1024
+TMP_PREFIX = ".tmp-"
+STALE_TMP_SECONDS = 3600
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class ConversionCache:
+    """مخزن مخرجات التحويل على القرص - آمن بين الخيوط، والعمليات تتشارك المجلد نفسه"""
+
+    def __init__(self, directory, max_bytes=0):
+        self.directory = str(directory)
+        self.max_bytes = int(max_bytes or 0)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # OrderedDict key -> bytes (الأقدم استخدامًا أولًا)
+        self._bytes = 0
+        self._pins = Counter()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def content_hash(source):
+        """sha256 للمحتوى (مسار أو ملف مفتوح يُعاد مؤشره لمكانه)"""
+        digest = hashlib.sha256()
+        if hasattr(source, 'read'):
+            pos = source.tell()
+            source.seek(0)
+            for chunk in iter(lambda: source.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+            source.seek(pos)
+        else:
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def make_key(cls, source, params, content_hash=None):
+        """مفتاح المدخل: sha256 للمحتوى + المعاملات
+
+        content_hash يتجنب قراءة الملف مرة ثانية إن كان محسوبًا مسبقًا (مثل رفع HTTP).
+        """
+        digest = hashlib.sha256((content_hash or cls.content_hash(source)).encode())
+        digest.update(json.dumps({'v': CACHE_VERSION, **params}, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load_index(self):
+        """مسح المجلد مرة واحدة: ترتيب المدخلات حسب mtime وحذف المجلدات المؤقتة اليتيمة"""
+        if self._index is not None:
+            return
+        entries = []
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if not item.is_dir():
+                    continue
+                mtime = item.stat().st_mtime
+                if item.name.startswith(TMP_PREFIX):
+                    if now - mtime > STALE_TMP_SECONDS:
+                        shutil.rmtree(item.path, ignore_errors=True)
+                    continue
+                entries.append((mtime, item.name, _dir_size(item.path)))
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._bytes = sum(self._index.values())
+
+    def lookup(self, key):
+        """مسارات المخرجات المحفوظة (مرتبة) أو None"""
+        entry = self._entry(key)
+        try:
+            names = sorted(os.listdir(entry))
+        except OSError:
+            names = []
+        with self._lock:
+            self._load_index()
+            if not names:
+                self.misses += 1
+                if key in self._index:
+                    self._bytes -= self._index.pop(key)
+                return None
+            self.hits += 1
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return [os.path.join(entry, n) for n in names]
+
+    def store(self, key, build):
+        """تشغيل build(out_dir) في مجلد مؤقت ثم نقله ذريًا إلى مدخل الكاش
+
+        build يعيد قائمة المسارات التي كتبها؛ القائمة الفارغة (فشل) لا تُحفظ.
+        """
+        tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=self.directory)
+        try:
+            outputs = build(tmp_dir)
+            if not outputs:
+                return []
+            entry = self._entry(key)
+            try:
+                os.rename(tmp_dir, entry)
+            except OSError:
+                # عملية أو خيط آخر حفظ نفس المفتاح أولًا
+                if not os.path.isdir(entry):
+                    raise
+                return self.lookup(key) or []
+            size = _dir_size(entry)
+            with self._lock:
+                # أول تحميل للفهرس قد يكون رأى المدخل الجديد بالفعل - لا نحسبه مرتين
+                self._load_index()
+                self._bytes += size - self._index.get(key, 0)
+                self._index[key] = size
+            self.evict()
+            return [os.path.join(entry, os.path.basename(p)) for p in outputs]
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @contextmanager
+    def pinned(self, key):
+        """منع إخلاء المدخل داخل هذا السياق (بين lookup/store و checkout) - داخل هذه العملية فقط"""
+        with self._lock:
+            self._pins[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if self._pins[key] <= 0:
+                    del self._pins[key]
+
+    @staticmethod
+    def checkout(paths, dest_dir):
+        """روابط صلبة (أو نسخ عبر أنظمة ملفات مختلفة) للمخرجات في dest_dir
+
+        الملفات الناتجة ملك المستدعي: إخلاء المدخل يحذف اسمه في الكاش فقط ويبقى المحتوى للقارئ (lp، الطباعة).
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        copies = []
+        for path in paths:
+            dest = os.path.join(dest_dir, os.path.basename(path))
+            try:
+                if os.path.exists(dest):
+                    os.remove(dest)
+                os.link(path, dest)
+            except OSError:
+                shutil.copy2(path, dest)
+            copies.append(dest)
+        return copies
+
+    def evict(self):
+        """حذف الأقدم استخدامًا حتى يعود الحجم تحت max_bytes (المدخلات المثبتة تُتخطى)"""
+        if not self.max_bytes:
+            return 0
+        removed = []
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                if self._bytes <= self.max_bytes or len(self._index) <= 1:
+                    break
+                if self._pins.get(key):
+                    continue
+                self._bytes -= self._index.pop(key)
+                removed.append(key)
+        for key in removed:
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+        if removed:
+            safe_print(f"🧹 إخلاء {len(removed)} مدخل من كاش التحويل", bytes=self._bytes)
+        return len(removed)
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {'entries': len(self._index), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """الكاش المشترك حسب الإعدادات - None إن كان ConversionCacheDir فارغًا"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = load_config()
+            directory = config["ConversionCacheDir"]
+            if not directory:
+                return None
+            if not os.path.isabs(directory):
+                directory = os.path.join(BASE, directory)
+            _cache = ConversionCache(directory, config["ConversionCacheMaxBytes"])
+        return _cache
+
+def _cache_stats():
+    if _cache is None:
+        raise LookupError("conversion cache not initialised")
+    return _cache.stats()
+
+register_gauge('rcp_conversion_cache', 'Conversion cache entries, bytes, hits and misses', _cache_stats, ('field',))
@@ -1,150 +1,414 @@
 # converter.py
 # دالة convert_file(path) تعيد مسار الملف النهائي القابل للطباعة أو None
+# convert_batch / سطر الأوامر: تحويل مجلد أو نمط glob كاملًا (كل الإطارات) عبر مجموعة عمليات
 
 from PIL import Image
 from pydicom import dcmread
 from pydicom.pixel_data_handlers.util import convert_color_space
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import fnmatch
+import glob
+import io
 import os
+import sys
+import time
 import numpy as np
-from log import safe_print
-from fpdf import FPDF
+from config import load_config
+from conversion_cache import get_cache
+from log import debug_print, safe_print
+from pdf_stream import text_to_pdf_stream
+from windowing import window_array, window_dataset
 
 def normalize_array(arr):
-    arr = arr.astype(np.float32)
-    arr -= arr.min()
-    if arr.max() > 0:
-        arr = arr / arr.max() * 255.0
-    return arr.astype(np.uint8)
-
-def dicom_to_image(dicom_path):
-    if not os.path.exists(dicom_path):
-        safe_print(f"❌ الملف غير موجود: {dicom_path}")
+    """تمديد المدى الفعلي إلى uint8 عبر LUT (بدون مصفوفات float)"""
+    return window_array(arr)
+
+def read_dicom(source):
+    """قراءة DICOM مرة واحدة (مع PixelData) من مسار أو ملف مفتوح - None إن لم يكن DICOM"""
+    try:
+        ds = dcmread(source, force=True)
+    except Exception:
+        return None
+    if 'SOPClassUID' not in ds and 'PixelData' not in ds:
         return None
+    return ds
+
+def frame_images(ds, arr):
+    """قائمة صور PIL لكل إطار بعد النافذة (صورة واحدة لملف إطار واحد)"""
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    samples = int(ds.get('SamplesPerPixel', 1) or 1)
+
+    if arr.ndim == 2:
+        return [Image.fromarray(arr).convert("L")]
+    if arr.ndim == 3 and (samples > 1 or frames == 1) and arr.shape[2] in [3, 4]:
+        return [Image.fromarray(arr[:, :, :3]).convert("RGB")]
+    if arr.ndim == 3:
+        return [Image.fromarray(frame).convert("L") for frame in arr]
+    if arr.ndim == 4 and arr.shape[3] in [3, 4]:
+        return [Image.fromarray(frame[:, :, :3]).convert("RGB") for frame in arr]
+    safe_print(f"❌ شكل غير مدعوم: {arr.shape}")
+    return []
+
+def output_stem(path, out_dir=None):
+    """اسم الملف الناتج بدون امتداد - بجانب المصدر أو داخل out_dir (مدخل الكاش)"""
+    stem = os.path.splitext(path)[0]
+    return os.path.join(out_dir, os.path.basename(stem)) if out_dir else stem
+
+def fit_max_size(image, max_size=None):
+    """تصغير الصورة لتتسع داخل max_size×max_size مع الحفاظ على النسبة"""
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return image
+
+def dicom_to_images(dicom_path, ds=None, all_frames=True, out_dir=None, window=None,
+                    image_format='jpg', max_size=None):
+    """تحويل كل إطارات DICOM إلى JPEG - تعيد قائمة المسارات
+
+    ملف الإطار الواحد يُحفظ كـ <name>.jpg كما في السابق، والملفات متعددة الإطارات
+    كـ <name>_f0001.jpg ... ؛ all_frames=False يحفظ الإطار الأول فقط باسم <name>.jpg.
+    window = (center, width) يتجاوز نافذة الملف، و image_format / max_size يحددان صيغة وحجم المخرجات.
+    """
+    if ds is None and not os.path.exists(dicom_path):
+        safe_print(f"❌ الملف غير موجود: {dicom_path}")
+        return []
     try:
-        ds = dcmread(dicom_path, force=True)
-        safe_print(f"📏 BitsAllocated: {ds.get('BitsAllocated', 'غير محدد')}")
-        safe_print(f"🧪 PhotometricInterpretation: {ds.get('PhotometricInterpretation', '')}")
+        if ds is None:
+            ds = dcmread(dicom_path, force=True)
+        debug_print(f"📏 BitsAllocated: {ds.get('BitsAllocated', 'غير محدد')}")
+        debug_print(f"🧪 PhotometricInterpretation: {ds.get('PhotometricInterpretation', '')}")
 
         if not hasattr(ds, 'PixelData'):
             safe_print("⚠️ لا يوجد PixelData في DICOM")
-            return None
+            return []
 
-        try:
-            ds.decompress()
-        except Exception as e:
-            safe_print(f"⚠️ فشل فك الضغط (إن وُجد): {e}")
+        transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+        if transfer_syntax is not None and transfer_syntax.is_compressed:
+            try:
+                ds.decompress()
+            except Exception as e:
+                safe_print(f"⚠️ فشل فك الضغط: {e}")
 
         try:
             arr = ds.pixel_array
         except Exception as e:
             safe_print(f"❌ فشل استخراج pixel_array: {e}")
-            return None
+            return []
 
-        safe_print(f"📊 شكل: {arr.shape} dtype={arr.dtype} | min={arr.min()} max={arr.max()}")
+        debug_print(f"📊 شكل: {arr.shape} dtype={arr.dtype}")
 
-        if arr.dtype != np.uint8:
-            arr = normalize_array(arr)
-            safe_print("🔧 تطبيع إلى uint8")
+        # النافذة + Rescale + VOI LUT + عكس MONOCHROME1 في جدول واحد لكل الإطارات
+        arr = window_dataset(ds, arr, window=window)
+        debug_print("🔧 تطبيق النافذة -> uint8")
 
         interp = ds.get("PhotometricInterpretation", "")
         if interp in ["YBR_FULL", "YBR_FULL_422"]:
             try:
                 arr = convert_color_space(arr, interp, "RGB")
-                safe_print(f"🔄 تحويل {interp} -> RGB")
+                debug_print(f"🔄 تحويل {interp} -> RGB")
             except Exception as e:
                 safe_print(f"⚠️ فشل تحويل الألوان: {e}")
-        elif interp == "MONOCHROME1":
-            arr = np.invert(arr)
-            safe_print("🔄 MONOCHROME1 -> invert")
-
-        if arr.ndim == 2:
-            image = Image.fromarray(arr).convert("L")
-        elif arr.ndim == 3 and arr.shape[2] in [3,4]:
-            image = Image.fromarray(arr[:, :, :3]).convert("RGB")
-        elif arr.ndim == 3:
-            image = Image.fromarray(arr[0]).convert("L")
-        else:
-            safe_print(f"❌ شكل غير مدعوم: {arr.shape}")
-            return None
 
-        out = os.path.splitext(dicom_path)[0] + ".jpg"
-        image.save(out)
-        safe_print(f"🖼️ تم حفظ: {out}")
-        return out
+        images = frame_images(ds, arr)
+        if not all_frames:
+            images = images[:1]
+
+        stem = output_stem(dicom_path, out_dir)
+        outputs = []
+        for index, image in enumerate(images, 1):
+            suffix = f"_f{index:04d}" if len(images) > 1 else ""
+            out = f"{stem}{suffix}.{image_format}"
+            fit_max_size(image, max_size).save(out)
+            outputs.append(out)
+        safe_print(f"🖼️ تم حفظ: {outputs[0]}" + (f" (+{len(outputs) - 1} إطار)" if len(outputs) > 1 else ""))
+        return outputs
 
     except Exception as e:
         safe_print(f"❌ خطأ في dicom_to_image: {e}")
-        return None
+        return []
+
+def dicom_to_image(dicom_path, ds=None):
+    """الإطار الأول فقط كـ JPEG - المسار أو None"""
+    outputs = dicom_to_images(dicom_path, ds=ds, all_frames=False)
+    return outputs[0] if outputs else None
+
+def text_to_pdfs(input_path, handle=None, out_dir=None, max_pages=None, chunk_pages=None):
+    """تحويل نص إلى PDF بالتدفق - صفحة بصفحة على القرص، وتعيد قائمة الملفات
+
+    max_pages / chunk_pages من TextPdfMaxPages / TextPdfChunkPages إن لم تُحدد؛
+    مع التقسيم تُكتب الأجزاء كـ <name>.part001.pdf ...
+    """
+    config = load_config()
+    max_pages = config["TextPdfMaxPages"] if max_pages is None else max_pages
+    chunk_pages = config["TextPdfChunkPages"] if chunk_pages is None else chunk_pages
+    base = os.path.join(out_dir, os.path.basename(input_path)) if out_dir else input_path
+
+    def out_path(index):
+        return f"{base}.part{index:03d}.pdf" if chunk_pages else base + '.pdf'
 
-def text_to_pdf(input_path):
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font('Arial', size=12)
-        with open(input_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                pdf.multi_cell(0, 6, line.rstrip('\n'))
-        out = input_path + '.pdf'
-        pdf.output(out)
-        safe_print(f"📄 تحويل نص -> PDF: {out}")
-        return out
+        if handle is not None:
+            # الملف مفتوح مسبقًا (ثنائي) من مرحلة التعرف على النوع
+            f = io.TextIOWrapper(handle, encoding='utf-8', errors='ignore')
+        else:
+            f = open(input_path, 'r', encoding='utf-8', errors='ignore')
+        with f:
+            outputs, pages, truncated = text_to_pdf_stream(f, out_path, max_pages=max_pages, chunk_pages=chunk_pages)
+        if truncated:
+            safe_print(f"⚠️ تم قطع النص بعد {pages} صفحة (TextPdfMaxPages)", path=input_path)
+        safe_print(f"📄 تحويل نص -> PDF: {outputs[0]}", pages=pages, files=len(outputs))
+        return outputs
     except Exception as e:
         safe_print(f"❌ خطأ تحويل نص -> PDF: {e}")
-        return None
+        return []
 
-def image_rewrite(path):
+def text_to_pdf(input_path, handle=None, out_dir=None):
+    """PDF الأول فقط - المسار أو None"""
+    outputs = text_to_pdfs(input_path, handle=handle, out_dir=out_dir)
+    return outputs[0] if outputs else None
+
+def image_rewrite(path, img=None, out_dir=None, image_format='jpg', max_size=None):
     try:
-        img = Image.open(path)
-        img = img.convert("RGB")
-        out = os.path.splitext(path)[0] + ".printable.jpg"
-        img.save(out, format="JPEG")
+        if img is None:
+            img = Image.open(path)
+        img = fit_max_size(img.convert("RGB"), max_size)
+        out = f"{output_stem(path, out_dir)}.printable.{image_format}"
+        img.save(out, format="PNG" if image_format == 'png' else "JPEG")
         safe_print(f"🖼️ إعادة حفظ الصورة: {out}")
         return out
     except Exception as e:
         safe_print(f"❌ خطأ إعادة حفظ الصورة: {e}")
         return None
 
-def convert_file(path):
-    """ترجع المسار النهائي القابل للطباعة أو None"""
-    if not os.path.exists(path):
-        safe_print(f"❌ الملف غير موجود: {path}")
-        return None
+# =================================================================
+#                 التعرف على نوع الملف (قراءة أول بضعة KB فقط)
+# =================================================================
 
-    ext = os.path.splitext(path)[1].lower()
+SNIFF_BYTES = 4096
 
-    # لو امتداد dcm -> محاول DICOM
-    if ext == '.dcm':
-        out = dicom_to_image(path)
-        if out:
-            return out
+# أنواع الملفات التي يعرفها convert_file
+FILE_DICOM = 'dicom'
+FILE_PDF = 'pdf'
+FILE_IMAGE = 'image'
+FILE_TEXT = 'text'
+FILE_UNKNOWN = 'unknown'
 
-    # محاولة قراءة DICOM حتى بدون امتداد
+IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',          # JPEG
+    b'GIF87a', b'GIF89a',
+    b'II*\x00', b'MM\x00*',     # TIFF
+)
+DICOM_EXTENSIONS = {'.dcm', '.dicom'}
+TEXT_EXTENSIONS = {'.txt', '.json', '.csv', '.log'}
+# BMP: 'BM' وحدها تطابق أي نص يبدأ بهما - نتحقق من الحقول المحجوزة (صفر) وطول ترويسة DIB المعروف
+BMP_DIB_HEADER_SIZES = {12, 40, 52, 56, 64, 108, 124}
+
+try:
+    import magic  # python-magic (اختياري: يحتاج libmagic)
+except (ImportError, OSError):
+    magic = None
+
+def _magic_type(head):
+    """تصنيف احتياطي عبر libmagic للملفات التي لا تطابق التواقيع المعروفة"""
+    if magic is None:
+        return FILE_UNKNOWN
     try:
-        ds = dcmread(path, stop_before_pixels=True, force=True)
-        if getattr(ds, 'SOPClassUID', None) is not None:
-            out = dicom_to_image(path)
-            if out:
-                return out
+        mime = magic.from_buffer(head, mime=True)
     except Exception:
-        pass
+        return FILE_UNKNOWN
+    if mime == 'application/dicom':
+        return FILE_DICOM
+    if mime == 'application/pdf':
+        return FILE_PDF
+    if mime.startswith('image/'):
+        return FILE_IMAGE
+    if mime.startswith('text/'):
+        return FILE_TEXT
+    return FILE_UNKNOWN
+
+def _is_bmp(head):
+    """ترويسة BMP صحيحة: 'BM'، حجم ملف >= 26، حقلان محجوزان = 0، وطول ترويسة DIB معروف"""
+    if len(head) < 18 or not head.startswith(b'BM'):
+        return False
+    file_size = int.from_bytes(head[2:6], 'little')
+    dib_size = int.from_bytes(head[14:18], 'little')
+    return file_size >= 26 and head[6:10] == b'\x00' * 4 and dib_size in BMP_DIB_HEADER_SIZES
+
+def detect_file_type(head, ext=''):
+    """نوع الملف من أول SNIFF_BYTES بايت (والامتداد كتلميح)"""
+    if head[128:132] == b'DICM':
+        return FILE_DICOM
+    if head.startswith(b'%PDF'):
+        return FILE_PDF
+    if head.startswith(IMAGE_SIGNATURES) or _is_bmp(head):
+        return FILE_IMAGE
+    # DICOM بدون Preamble: يبدأ مباشرة بعنصر من المجموعة 0002 أو 0008 (Little Endian)
+    if ext in DICOM_EXTENSIONS or head[:2] in (b'\x02\x00', b'\x08\x00'):
+        return FILE_DICOM
+    if ext in TEXT_EXTENSIONS:
+        return FILE_TEXT
+    return _magic_type(head)
+
+def sniff_file(path):
+    """نوع الملف بقراءة أول بضعة KB فقط"""
+    with open(path, 'rb') as f:
+        return detect_file_type(f.read(SNIFF_BYTES), os.path.splitext(path)[1].lower())
+
+def _convert_kind(path, handle, kind, out_dir=None, all_frames=False, window=None,
+                  image_format='jpg', max_size=None):
+    """تشغيل المحوّل الوحيد المناسب للنوع على المقبض المفتوح"""
+    if kind == FILE_DICOM:
+        ds = read_dicom(handle)
+        if ds is None:
+            safe_print(f"❌ ليس ملف DICOM صالحًا: {path}")
+            return []
+        return dicom_to_images(path, ds=ds, all_frames=all_frames, out_dir=out_dir, window=window,
+                               image_format=image_format, max_size=max_size)
+
+    if kind == FILE_IMAGE:
+        try:
+            img = Image.open(handle)
+        except Exception as e:
+            safe_print(f"❌ خطأ قراءة الصورة: {e}")
+            return []
+        out = image_rewrite(path, img=img, out_dir=out_dir, image_format=image_format, max_size=max_size)
+        return [out] if out else []
+
+    return text_to_pdfs(path, handle=handle, out_dir=out_dir)
+
+def convert_outputs(path, all_frames=False, window=None, image_format='jpg', max_size=None, use_cache=True,
+                    content_hash=None, out_dir=None):
+    """تحويل ملف واحد - قائمة المسارات القابلة للطباعة (فارغة عند الفشل)
+
+    الملف يُفتح مرة واحدة: أول بضعة KB تحدد النوع، ثم يُمرر نفس المقبض لمحوّل واحد فقط.
+    مع الكاش (ConversionCacheDir) تُكتب المخرجات داخل مجلد الكاش بدل بجانب المصدر،
+    وإعادة إرسال نفس المحتوى بنفس المعاملات تعيد المخرجات المحفوظة مباشرة.
+    content_hash: sha256 المحسوب أثناء الرفع حتى لا يُقرأ الملف مرتين لحساب المفتاح.
+    out_dir: مجلد يملكه المستدعي - المخرجات تُكتب فيه، ومع الكاش تُربط فيه (checkout) حتى لا يحذفها
+    الإخلاء قبل أن تقرأها الطباعة. بدونه تُعاد مسارات الكاش نفسها (التحويل الجماعي).
+    """
+    if not os.path.exists(path):
+        safe_print(f"❌ الملف غير موجود: {path}")
+        return []
+
+    with open(path, 'rb') as handle:
+        kind = detect_file_type(handle.read(SNIFF_BYTES), os.path.splitext(path)[1].lower())
+        handle.seek(0)
+        debug_print(f"🔎 نوع الملف: {kind}", path=path)
+
+        if kind == FILE_PDF:
+            safe_print("📄 ملف PDF — يبقى كما هو")
+            return [path]
+        if kind == FILE_UNKNOWN:
+            safe_print("ℹ️ نوع غير محدد — سنعيد المسار كما هو (قد لا يطبع بشكل صحيح)")
+            return [path]
 
-    # PDF
-    if ext == '.pdf':
-        safe_print("📄 ملف PDF — يبقى كما هو")
-        return path
+        options = {
+            'all_frames': all_frames,
+            'window': window,
+            'image_format': image_format,
+            'max_size': max_size,
+        }
+        cache = get_cache() if use_cache else None
+        if cache is None:
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            return _convert_kind(path, handle, kind, out_dir=out_dir, **options)
 
-    # صور
+        params = {'kind': kind, **options}
+        if kind == FILE_TEXT:
+            config = load_config()
+            params['pages'] = (config["TextPdfMaxPages"], config["TextPdfChunkPages"])
+        key = cache.make_key(handle, params, content_hash)
+        with cache.pinned(key):
+            outputs = cache.lookup(key)
+            if outputs:
+                safe_print(f"⚡ من كاش التحويل: {outputs[0]}", path=path, outputs=len(outputs))
+            else:
+                outputs = cache.store(key, lambda entry: _convert_kind(path, handle, kind, out_dir=entry, **options))
+            if outputs and out_dir:
+                outputs = cache.checkout(outputs, out_dir)
+        return outputs
+
+def convert_file(path):
+    """ترجع المسار النهائي القابل للطباعة أو None"""
+    outputs = convert_outputs(path)
+    return outputs[0] if outputs else None
+
+# =================================================================
+#                 التحويل الجماعي (مجلد / نمط glob)
+# =================================================================
+
+def expand_sources(sources, pattern='*'):
+    """قائمة الملفات من مجلدات (بشكل متكرر مع pattern) وأنماط glob ومسارات مباشرة"""
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, names in os.walk(source):
+                files.extend(os.path.join(root, n) for n in sorted(names) if fnmatch.fnmatch(n, pattern))
+        elif glob.has_magic(source):
+            files.extend(p for p in sorted(glob.glob(source, recursive=True)) if os.path.isfile(p))
+        else:
+            files.append(source)
+    # بدون تكرار مع الحفاظ على الترتيب
+    return list(dict.fromkeys(files))
+
+def _convert_timed(path, use_cache=True):
+    """عامل التحويل الجماعي - كل الإطارات مع زمن التحويل"""
+    started = time.perf_counter()
     try:
-        img = Image.open(path)
-        img.verify()
-        return image_rewrite(path)
-    except Exception:
-        pass
+        outputs = convert_outputs(path, all_frames=True, use_cache=use_cache)
+        error = None if outputs else "فشل التحويل"
+    except Exception as e:
+        outputs, error = [], str(e)
+    return {'path': path, 'outputs': outputs, 'seconds': time.perf_counter() - started, 'error': error}
+
+def convert_batch(sources, workers=None, pattern='*', use_cache=True):
+    """تحويل مجموعة ملفات عبر مجموعة عمليات - قائمة نتائج {path, outputs, seconds, error}
+
+    workers=None يأخذ ConvertWorkers من الإعدادات (0 = عدد المعالجات)، و 1 = بدون عمليات فرعية.
+    """
+    files = expand_sources([sources] if isinstance(sources, str) else sources, pattern)
+    if workers is None:
+        workers = load_config()["ConvertWorkers"]
+    workers = int(workers or os.cpu_count() or 1)
+    safe_print(f"📦 تحويل {len(files)} ملف باستخدام {workers} عامل")
+
+    started = time.perf_counter()
+    results = []
+
+    def report(result):
+        results.append(result)
+        if result['error']:
+            safe_print(f"❌ {result['path']}: {result['error']}", ms=round(result['seconds'] * 1000, 1))
+        else:
+            safe_print(f"✅ {result['path']}", outputs=len(result['outputs']), ms=round(result['seconds'] * 1000, 1))
+
+    if workers == 1 or len(files) <= 1:
+        for path in files:
+            report(_convert_timed(path, use_cache))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(_convert_timed, path, use_cache) for path in files]):
+                report(future.result())
+
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if r['error'])
+    frames = sum(len(r['outputs']) for r in results)
+    safe_print("📊 انتهى التحويل الجماعي", files=len(results), frames=frames, failed=failed,
+               seconds=round(elapsed, 2), files_per_sec=round(len(results) / elapsed, 2) if elapsed else 0)
+    return results
 
-    # نصوص
-    if ext in ['.txt', '.json', '.csv', '.log']:
-        return text_to_pdf(path)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تحويل ملفات DICOM / صور / نصوص إلى ملفات قابلة للطباعة")
+    parser.add_argument("sources", nargs="+", help="مجلد أو نمط glob أو ملف")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="عدد العمليات (0 = عدد المعالجات)")
+    parser.add_argument("-p", "--pattern", default="*", help="تصفية الملفات داخل المجلدات (مثل *.dcm)")
+    parser.add_argument("--no-cache", action="store_true", help="الكتابة بجانب الملفات المصدر بدل كاش التحويل")
+    args = parser.parse_args(argv)
+    results = convert_batch(args.sources, workers=args.workers, pattern=args.pattern, use_cache=not args.no_cache)
+    return 1 if any(r['error'] for r in results) else 0
 
-    safe_print("ℹ️ نوع غير محدد — سنعيد المسار كما هو (قد لا يطبع بشكل صحيح)")
-    return path
+if __name__ == "__main__":
+    sys.exit(main())
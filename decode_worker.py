@@ -0,0 +1,32 @@
+# decode_worker.py
+# نقطة دخول عمليات فك PixelData (DecodePool في pixel_decoder): تستورد pixel_decoder فقط -
+# لا إعدادات الخادم ولا طوابيره ولا مقابسه، بخلاف spawn الذي يعيد استيراد __main__ في كل عملية
+# البروتوكول: طلب pickle (args, kwargs) على stdin، ورد pickle (نجاح، المصفوفة أو رسالة الخطأ) على stdout
+
+import os
+import pickle
+import sys
+
+def main():
+    requests = sys.stdin.buffer
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    # أي طباعة عرضية (من pydicom أو الإضافات) تذهب لـ stderr ولا تفسد الردود
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    from pixel_decoder import decode_pixel_data
+
+    while True:
+        try:
+            args, kwargs = pickle.load(requests)
+        except EOFError:
+            return
+        try:
+            reply = (True, decode_pixel_data(*args, **kwargs))
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}")
+        pickle.dump(reply, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+if __name__ == "__main__":
+    main()
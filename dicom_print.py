@@ -5,6 +5,7 @@ from PIL import Image, ImageDraw
 import os
 import threading
 from printer import print_image  # تأكد من وجود هذا في أعلى الملف
+from film_compositor import parse_image_display_format
 
 
 # SOP Classes
@@ -18,29 +19,6 @@ BasicColorPrintManagementMetaSOPClass = UID("1.2.840.10008.5.1.1.18")
 FAKE_INSTANCE_UID = "1.2.826.0.1.3680043.8.999.1.999999.1.1"
 filmbox_store = {}
 
-def parse_image_display_format(format_str):
-    boxes = []
-    if not format_str:
-        return boxes
-    parts = format_str.split('\\')
-    mode = parts[0]
-    if mode == "STANDARD" and len(parts) == 2:
-        try:
-            cols, rows = map(int, parts[1].split(','))
-            for r in range(rows):
-                for c in range(cols):
-                    boxes.append((r, c))
-        except: pass
-    elif mode in ["ROW", "COL"] and len(parts) == 2:
-        try:
-            counts = list(map(int, parts[1].split(',')))
-            for i, count in enumerate(counts):
-                for j in range(count):
-                    if mode == "ROW": boxes.append((i, j))
-                    else: boxes.append((j, i))
-        except: pass
-    return boxes
-
 def generate_image_boxes(film_box_uid, format_str):
     box_positions = parse_image_display_format(format_str)
     boxes = []
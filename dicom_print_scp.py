@@ -1,19 +1,13 @@
 import logging
 import os
-import tempfile
-import atexit
-import subprocess
 from datetime import datetime
-import io
 import threading
-from collections import deque
-import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-import win32print
-import win32ui
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
-from pynetdicom import AE, evt, debug_logger
+from pynetdicom import AE, evt
 from pynetdicom.sop_class import (
     BasicFilmSession, BasicFilmBox, Printer, 
     BasicGrayscaleImageBox, BasicColorImageBox,
@@ -22,12 +16,20 @@ from pynetdicom.sop_class import (
 )
 from pydicom.uid import UID, generate_uid
 from pydicom.dataset import Dataset
-from pydicom import dcmread
-from pydicom.pixel_data_handlers.util import convert_color_space
 import pydicom
 
-# تفعيل التسجيل التفصيلي
-debug_logger()
+from config import load_config
+from log import configure_logging, debug_print, safe_print
+from metrics import register_gauge, stage, track_dimse
+from print_queue import PrintJobQueue, set_stage
+from print_backends import get_backend
+from pixel_buffer import ingest_pixel_data
+from pixel_decoder import DecodePool, can_decode, is_encapsulated
+from session_store import PrintSessionStore
+from windowing import window_array, window_dataset
+from throughput import ThroughputMeter
+import tracing
+from film_compositor import compose_film, fit_size, page_size_pixels, parse_image_display_format, resize_once
 
 # تعريف الـ Meta SOP Classes المطلوبة - مطابقة لـ Weasis
 BASIC_GRAYSCALE_PRINT_META_SOP_CLASS = UID('1.2.840.10008.5.1.1.9')
@@ -37,76 +39,171 @@ BASIC_COLOR_PRINT_META_SOP_CLASS = UID('1.2.840.10008.5.1.1.18')
 #                 إعدادات التسجيل والطباعة
 # =================================================================
 
-logging.basicConfig(
-    level=logging.DEBUG, 
-    format="[%(asctime)s] %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
+# السجل يمر عبر log.py (طابور + كاتب خلفي، مستويات لكل وحدة من LogLevels)
+# لم نعد نفعّل debug_logger() لـ pynetdicom: تفريغ كل PDU يُفعَّل عند الحاجة عبر set_level('pynetdicom', 'DEBUG')
+
+# =================================================================
+#                 تخزين الحالة العالمية
+# =================================================================
+
+config = load_config()
+configure_logging(config["LogLevels"])
+
+# تخزين الكائنات: film_sessions / film_boxes / image_boxes / print_jobs
+# مرتبطة بالاتصال الذي أنشأها ومحدودة بميزانية ذاكرة ومهلة
+state = PrintSessionStore(
+    max_bytes=config["SessionMaxBytes"],
+    ttl=config["SessionTTL"],
 )
-logger = logging.getLogger('pynetdicom')
 
-def safe_print(message):
-    """طباعة آمنة للرسائل"""
-    logger.info(message)
+register_gauge('rcp_session_store', 'Print session store entries and bytes held', state.stats, ('kind',))
+
+def association_key(event):
+    """معرف الاتصال المالك للعناصر المخزنة"""
+    return id(event.assoc)
+
+def handle_association_closed(event):
+    """تحرير صناديق الصور وبقية العناصر عند انتهاء الاتصال أو قطعه"""
+    state.release_owner(association_key(event))
+    debug_print(f"📊 حالة المخزن: {state.stats()}")
 
 # =================================================================
-#                 تخزين الحالة العالمية
+#                 طابور الطباعة غير المتزامن
 # =================================================================
 
-# تخزين الكائنات
-film_sessions = {}
-film_boxes = {}
-image_boxes = {}
-current_print_jobs = {}
+# Resource limitation - يعاد عند امتلاء الطابور بدل حجز الاتصال
+STATUS_RESOURCE_LIMITATION = 0x0213
+# Out of resources - ما يقابلها في C-STORE
+STATUS_OUT_OF_RESOURCES = 0xA700
+# N-ACTION على Film Session لا تحتوي أي Film Box (PS3.4 H.4.1.2.1)
+STATUS_NO_FILM_BOXES = 0xC600
+
+print_queue = PrintJobQueue(
+    "dicom-print",
+    maxsize=config["PrintQueueSize"],
+    workers=config["PrintWorkers"],
+)
+
+# فك PixelData المضغوط في عمليات منفصلة (تُنشأ عند أول صندوق مضغوط)
+decode_pool = DecodePool(config["DecodeWorkers"])
+
+def queue_trace(uid):
+    """بدء span الانتظار في الطابور لتتبع الكائن (قبل submit حتى لا يسبقه العامل)"""
+    trace = tracing.get(uid)
+    if trace is not None:
+        trace.begin('queue')
+    return trace
+
+def tag_trace(trace, job_id):
+    if trace is not None:
+        trace.fields['job'] = job_id
+
+# الإضافة للطابور وتسجيلها في المخزن (disown + print_jobs) خطوة واحدة بالنسبة لتنظيف finish_job:
+# عامل سريع لا ينظف قبل اكتمال التسجيل فيبقى عنصر مسلَّم للطابور بعد انتهاء مهمته
+enqueue_lock = threading.Lock()
+
+def finish_job(uid, success, film_box=False):
+    """تنظيف ما سجله الإدراج بعد انتهاء المهمة
+
+    print_jobs يُحذف دائمًا؛ الفيلم المطبوع يُحذف (لا مالك له فلا يحرره انتهاء الاتصال)،
+    والفاشل يبقى لإعادة المحاولة بـ N-ACTION وتعود له المهلة.
+    """
+    with enqueue_lock:
+        state.pop('print_jobs', uid)
+        if not film_box:
+            return
+        if success:
+            state.delete(uid)
+        else:
+            state.unqueue('film_boxes', uid)
+
+def enqueue_print_job(sop_instance_uid):
+    """إضافة مهمة طباعة للطابور - تعيد معرف المهمة أو None عند الامتلاء"""
+    with enqueue_lock:
+        return _enqueue_print_job(sop_instance_uid)
+
+def _enqueue_print_job(sop_instance_uid):
+    trace = queue_trace(sop_instance_uid)
+    job_id = print_queue.submit(process_print_job, sop_instance_uid)
+    if job_id:
+        tag_trace(trace, job_id)
+        # المهمة أصبحت مالكة البيانات - لا تُحرر بانتهاء الاتصال
+        state.disown('image_boxes', sop_instance_uid)
+        state.put('print_jobs', sop_instance_uid, job_id)
+        print_queue.annotate(job_id, kind='image_box', uid=sop_instance_uid)
+        safe_print("📬 تمت إضافة المهمة للطابور", job=job_id, uid=sop_instance_uid, pending=print_queue.pending())
+    return job_id
+
+def find_film_box(image_box_uid):
+    """Film Box الذي يحتوي صندوق الصورة وموضعه فيه - (None, 0) إن لم يوجد"""
+    for film_box_uid, film_box in state.items('film_boxes'):
+        position = film_box['image_boxes'].get(image_box_uid)
+        if position:
+            return film_box_uid, position
+    return None, 0
+
+def enqueue_film_boxes(film_box_uids):
+    """إضافة أفلام (صفحة لكل Film Box) للطابور معًا أو لا شيء
+
+    تعيد قائمة معرفات المهام، أو None إذا لم يتسع الطابور لها كلها - فلا يُطبع جزء من الجلسة
+    ثم يُطبع مرة ثانية عند إعادة المحاولة.
+    """
+    with enqueue_lock:
+        return _enqueue_film_boxes(film_box_uids)
+
+def _enqueue_film_boxes(film_box_uids):
+    traces = [queue_trace(uid) for uid in film_box_uids]
+    job_ids = print_queue.submit_many(process_film_box_job, [(uid,) for uid in film_box_uids])
+    if job_ids is None:
+        return None
+    for film_box_uid, trace, job_id in zip(film_box_uids, traces, job_ids):
+        tag_trace(trace, job_id)
+        # المهمة أصبحت مالكة الصناديق - لا تُحرر بانتهاء الاتصال
+        state.disown('film_boxes', film_box_uid)
+        for box_uid in state.get('film_boxes', film_box_uid, {}).get('image_boxes', {}):
+            state.disown('image_boxes', box_uid)
+        state.put('print_jobs', film_box_uid, job_id)
+        print_queue.annotate(job_id, kind='film_box', uid=film_box_uid)
+        safe_print("📬 تمت إضافة الفيلم للطابور", job=job_id, uid=film_box_uid, pending=print_queue.pending())
+    return job_ids
 
 # =================================================================
 #                 نظام الطباعة المتقدم - مشابه للخادم الناجح
 # =================================================================
 
 class AdvancedPrintManager:
-    """مدير طباعة متقدم - محاكاة للخادم الناجح"""
+    """مدير طباعة متقدم - يحسب أبعاد الصفحة ويرسل للواجهة المحددة في الإعدادات"""
     
-    def __init__(self):
-        self.printer_name = None
+    def __init__(self, backend=None):
+        self.backend = backend
         self.paper_size = "A4"
         self.dpi = 300
         self.color_type = 1  # 1 للرمادي، 2 للألوان
         self.border_color = "black"
         self.background_color = "white"
+    
+    @property
+    def printer_name(self):
+        return self.backend.printer_name if self.backend else None
+    
+    def get_backend(self):
+        """الواجهة الحالية - تنشأ عند أول استخدام ويعاد استخدامها بين المهام"""
+        if self.backend is None:
+            self.backend = get_backend()
+        return self.backend
         
     def get_default_printer(self):
-        """الحصول على الطابعة الافتراضية"""
-        try:
-            printer = win32print.GetDefaultPrinter()
-            if printer:
-                self.printer_name = printer
-                safe_print(f"🖨️ الطابعة الافتراضية: {printer}")
-                return printer
-        except Exception as e:
-            safe_print(f"❌ فشل في الحصول على الطابعة: {e}")
-        return None
-    
-    def setup_printer_properties(self, printer_name):
-        """إعداد خصائص الطابعة - مشابه للخادم الناجح"""
+        """اسم الطابعة للعرض - None فقط إذا فشل فتح الواجهة
+
+        واجهة بلا اسم طابعة (CUPS بدون PrinterName) تطبع على الطابعة الافتراضية للنظام.
+        """
         try:
-            hprinter = win32print.OpenPrinter(printer_name)
-            try:
-                # الحصول على إعدادات الطابعة
-                printer_info = win32print.GetPrinter(hprinter, 2)
-                
-                # إعداد حجم الورق A4
-                safe_print(f"📄 إعداد حجم الورق إلى: {self.paper_size}")
-                
-                # إعداد نوع اللون (رمادي/ملون)
-                safe_print(f"🎨 إعداد نوع اللون إلى: {self.color_type}")
-                
-                return True
-                
-            finally:
-                win32print.ClosePrinter(hprinter)
-                
+            backend = self.get_backend()
+            backend.open()
         except Exception as e:
-            safe_print(f"⚠️ فشل في إعداد خصائص الطابعة: {e}")
-            return False
+            safe_print(f"❌ فشل في الحصول على الطابعة: {e}", level=logging.ERROR)
+            return None
+        return backend.printer_name or getattr(backend, "default_name", None) or "system default"
     
     def calculate_print_dimensions(self, image_width, image_height):
         """حساب أبعاد الطباعة - مشابه للخادم الناجح"""
@@ -122,82 +219,50 @@ class AdvancedPrintManager:
             page_width = 2480
             page_height = 3508
         
-        safe_print(f"📏 أبعاد الصورة المطبوع: {image_width}x{image_height}, DPI المحدد: {dpi}")
-        safe_print(f"📄 أبعاد الصفحة: {page_width}x{page_height}")
+        debug_print(f"📏 أبعاد الصورة المطبوع: {image_width}x{image_height}, DPI المحدد: {dpi}")
+        debug_print(f"📄 أبعاد الصفحة: {page_width}x{page_height}")
         
         return page_width, page_height
     
-    def print_image_advanced(self, image, job_name="DICOM Print"):
-        """طباعة متقدمة - محاكاة للخادم الناجح"""
+    def print_image_advanced(self, image, job_name="DICOM Print", page_size=None):
+        """طباعة متقدمة - page_size يحدد أبعاد الصفحة (مثلًا فيلم أفقي)"""
         try:
             printer_name = self.get_default_printer()
             if not printer_name:
                 return False
             
-            safe_print(f"🖨️ بدء الطباعة على: {printer_name}")
-            
-            # إعداد خصائص الطابعة
-            self.setup_printer_properties(printer_name)
+            debug_print(f"🖨️ بدء الطباعة على: {printer_name}")
             
-            hprinter = win32print.OpenPrinter(printer_name)
-            try:
-                hdc = win32ui.CreateDC()
-                hdc.CreatePrinterDC(printer_name)
-                hdc.StartDoc(job_name)
-                hdc.StartPage()
-                
-                # تحويل الصورة إلى RGB إذا لزم الأمر
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # حساب أبعاد الطباعة
-                img_width, img_height = image.size
+            # حساب أبعاد الطباعة (الصورة تبقى L حتى الواجهة - لا تحويل RGB)
+            img_width, img_height = image.size
+            if page_size:
+                page_width, page_height = page_size
+            else:
                 page_width, page_height = self.calculate_print_dimensions(img_width, img_height)
-                
-                # حساب التحجيم المناسب
-                scale_x = page_width / img_width
-                scale_y = page_height / img_height
-                scale = min(scale_x, scale_y, 1.0)  # لا نكبر الصورة أكثر من حجمها الأصلي
-                
-                new_width = int(img_width * scale)
-                new_height = int(img_height * scale)
-                
-                safe_print(f"📐 التحجيم: {scale:.2f}, الأبعاد الجديدة: {new_width}x{new_height}")
-                
-                # تغيير حجم الصورة إذا لزم الأمر
-                if new_width != img_width or new_height != img_height:
-                    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    safe_print("🔄 تم تغيير حجم الصورة للطباعة")
-                
-                # حساب المركز للطباعة
-                x = (page_width - new_width) // 2
-                y = (page_height - new_height) // 2
-                
-                safe_print(f"📍 موضع الطباعة: ({x}, {y})")
-                
-                # الطباعة باستخدام ImageWin
-                from PIL import ImageWin
-                dib = ImageWin.Dib(image)
-                
-                # رسم الصورة
-                safe_print("🎨 بدء رسم الصورة...")
-                dib.draw(hdc.GetHandleOutput(), (x, y, x + new_width, y + new_height))
-                safe_print("✅ تم رسم الصورة بنجاح")
-                
-                hdc.EndPage()
-                hdc.EndDoc()
-                
-                safe_print("✅ تمت الطباعة المتقدمة بنجاح")
-                return True
-                
-            except Exception as e:
-                safe_print(f"❌ فشل في الطباعة المتقدمة: {e}")
-                return False
-            finally:
-                win32print.ClosePrinter(hprinter)
+            
+            # لا نكبر الصورة أكثر من حجمها الأصلي
+            new_width, new_height = fit_size(image.size, (page_width, page_height), max_scale=1.0)
+            
+            # تغيير الحجم (إن لزم) بخطوة واحدة: reduce ثم فلتر نهائي
+            # الصور القادمة من create_print_job_image مجهزة مسبقًا بحجم الصفحة فلا يحدث شيء هنا
+            if (new_width, new_height) != image.size:
+                with tracing.span('resize'):
+                    image = resize_once(image, (new_width, new_height))
+                debug_print(f"🔄 تم تغيير حجم الصورة للطباعة: {new_width}x{new_height}")
+            
+            # حساب المركز للطباعة
+            x = (page_width - new_width) // 2
+            y = (page_height - new_height) // 2
+            
+            debug_print(f"📍 موضع الطباعة: ({x}, {y})")
+            
+            success = self.backend.print_image(image, job_name, box=(x, y, x + new_width, y + new_height))
+            if success:
+                debug_print("✅ تمت الطباعة المتقدمة بنجاح")
+            return success
                 
         except Exception as e:
-            safe_print(f"❌ خطأ في إعداد الطباعة المتقدمة: {e}")
+            safe_print(f"❌ فشل في الطباعة المتقدمة: {e}", level=logging.ERROR)
             return False
 
 # إنشاء مدير الطباعة المتقدم
@@ -207,392 +272,657 @@ print_manager = AdvancedPrintManager()
 #                 معالجات DICOM المتوافقة مع Weasis - الإصدار المحسن
 # =================================================================
 
+@track_dimse('N-CREATE')
 def handle_n_create(event):
     """معالجة N-CREATE - متوافقة مع Weasis"""
     try:
         req = event.request
         sop_class_uid = req.AffectedSOPClassUID
-        sop_instance_uid = req.AffectedSOPInstanceUID
+        sop_instance_uid = req.AffectedSOPInstanceUID or generate_uid()
         
-        safe_print(f"🔍 [N-CREATE] SOP Class: {sop_class_uid}")
-        safe_print(f"📋 SOP Instance: {sop_instance_uid}")
+        debug_print(f"🔍 [N-CREATE] SOP Class: {sop_class_uid}")
+        debug_print(f"📋 SOP Instance: {sop_instance_uid}")
         
         rsp = Dataset()
         rsp.Status = 0x0000
+        if req.AffectedSOPInstanceUID is None:
+            # pynetdicom ينقلها إلى الرد عندما لا يحددها الطالب
+            rsp.AffectedSOPInstanceUID = sop_instance_uid
+        
+        # AttributeList في الطلب مشفر (BytesIO) - نستخدم النسخة المفكوكة
+        attrs = event.attribute_list or Dataset()
         
         # Film Session
         if sop_class_uid == BasicFilmSession:
-            film_sessions[sop_instance_uid] = {
+            state.put('film_sessions', sop_instance_uid, {
                 'created_at': datetime.now(),
                 'number_of_films': 1,
                 'print_priority': 'MED'
-            }
+            }, owner=association_key(event))
             rsp.NumberOfCopies = 1
             rsp.PrintPriority = 'MED'
             rsp.MediumType = 'PAPER'
             rsp.FilmDestination = 'PROCESSOR'
-            safe_print("🎞️ تم إنشاء Film Session")
+            debug_print("🎞️ تم إنشاء Film Session")
         
         # Film Box  
         elif sop_class_uid == BasicFilmBox:
             # الحصول على Image Display Format من الطلب إذا كان موجودًا
-            image_display_format = "STANDARD\\1,1"
-            if hasattr(req, 'AttributeList') and req.AttributeList:
-                for elem in req.AttributeList:
-                    if elem.tag == (0x2010, 0x0010):  # ImageDisplayFormat
-                        image_display_format = elem.value
-                        break
+            image_display_format = attrs.get('ImageDisplayFormat') or "STANDARD\\1,1"
+            film_orientation = attrs.get('FilmOrientation') or 'PORTRAIT'
+            film_size_id = attrs.get('FilmSizeID') or 'A4'
+            session_uid = None
+            if attrs.get('ReferencedFilmSessionSequence'):
+                session_uid = attrs.ReferencedFilmSessionSequence[0].ReferencedSOPInstanceUID
+            
+            # صندوق صورة لكل خلية في التنسيق
+            meta_uid = getattr(getattr(event, 'context', None), 'abstract_syntax', None)
+            image_box_class = BasicColorImageBox if meta_uid == BASIC_COLOR_PRINT_META_SOP_CLASS else BasicGrayscaleImageBox
+            cell_count = len(parse_image_display_format(image_display_format)) or 1
+            image_box_uids = {generate_uid(): position for position in range(1, cell_count + 1)}
             
-            film_boxes[sop_instance_uid] = {
-                'session_uid': req.AffectedSOPInstanceUID,
+            tracing.start(sop_instance_uid, 'film_box', uid=sop_instance_uid, session=session_uid,
+                          layout=image_display_format, assoc=association_key(event))
+            state.put('film_boxes', sop_instance_uid, {
+                'session_uid': session_uid,
                 'image_display_format': image_display_format,
-                'film_orientation': 'PORTRAIT'
-            }
+                'film_orientation': film_orientation,
+                'film_size_id': film_size_id,
+                'image_boxes': image_box_uids,
+            }, owner=association_key(event))
             rsp.ImageDisplayFormat = image_display_format
-            rsp.FilmOrientation = 'PORTRAIT'
-            rsp.FilmSizeID = 'A4'
+            rsp.FilmOrientation = film_orientation
+            rsp.FilmSizeID = film_size_id
             rsp.MagnificationType = 'NONE'
             rsp.MaxDensity = 0
-            safe_print(f"🎯 تم إنشاء Film Box مع تنسيق: {image_display_format}")
+            rsp.ReferencedImageBoxSequence = []
+            for box_uid in image_box_uids:
+                ref = Dataset()
+                ref.ReferencedSOPClassUID = image_box_class
+                ref.ReferencedSOPInstanceUID = box_uid
+                rsp.ReferencedImageBoxSequence.append(ref)
+            safe_print(f"🎯 تم إنشاء Film Box مع تنسيق: {image_display_format} ({cell_count} صندوق)")
+        
+        # Image Box منشأ صراحة (بعض العملاء) - ربطه بالـ Film Box المرجعي
+        elif sop_class_uid in (BasicGrayscaleImageBox, BasicColorImageBox):
+            if attrs.get('ReferencedFilmBoxSequence'):
+                film_box_uid = attrs.ReferencedFilmBoxSequence[0].ReferencedSOPInstanceUID
+                film_box = state.get('film_boxes', film_box_uid)
+                if film_box is not None:
+                    position = int(attrs.get('ImageBoxPosition', 0) or 0) or len(film_box['image_boxes']) + 1
+                    film_box['image_boxes'][sop_instance_uid] = position
+                    debug_print(f"🖼️ ربط Image Box بالموضع {position} في {film_box_uid}")
         
         # Printer
         elif sop_class_uid == Printer:
             rsp.PrinterStatus = 'NORMAL'
             rsp.PrinterStatusInfo = 'READY'
-            safe_print("🖨️ تم إنشاء Printer Object")
+            debug_print("🖨️ تم إنشاء Printer Object")
         
         return 0x0000, rsp
         
     except Exception as e:
-        safe_print(f"❌ خطأ في N-CREATE: {e}")
+        safe_print(f"❌ خطأ في N-CREATE: {e}", level=logging.ERROR)
         return 0x0110, None
 
+@track_dimse('N-SET')
 def handle_n_set(event):
     """معالجة N-SET - متوافقة مع Weasis"""
     try:
+        received_ns = tracing.now()
         req = event.request
         sop_class_uid = req.RequestedSOPClassUID
         sop_instance_uid = req.RequestedSOPInstanceUID
         
-        safe_print(f"📥 [N-SET] لـ: {sop_instance_uid}")
-        safe_print(f"🎯 SOP Class: {sop_class_uid}")
+        debug_print(f"📥 [N-SET] لـ: {sop_instance_uid}")
+        debug_print(f"🎯 SOP Class: {sop_class_uid}")
         
-        if not hasattr(req, 'ModificationList') or not req.ModificationList:
-            safe_print("ℹ️ N-SET بدون بيانات تعديل")
+        # ModificationList في الطلب مشفر (BytesIO) - نستخدم النسخة المفكوكة
+        mod = event.modification_list
+        if mod is None or len(mod) == 0:
+            debug_print("ℹ️ N-SET بدون بيانات تعديل")
             return 0x0000, None
         
+        # بيانات الصورة داخل BasicGrayscale/ColorImageSequence حسب المعيار، أو مباشرة في القائمة
+        image = mod
+        for keyword in ('BasicGrayscaleImageSequence', 'BasicColorImageSequence'):
+            if mod.get(keyword):
+                image = mod[keyword][0]
+                break
+        
         # معالجة بيانات الصورة
-        pixel_data = None
-        rows = cols = bits_allocated = 0
+        pixel_data = image.get('PixelData')
+        rows = int(image.get('Rows', 0) or 0)
+        cols = int(image.get('Columns', 0) or 0)
+        bits_allocated = int(image.get('BitsAllocated', 0) or 0)
+        bits_stored = int(image.get('BitsStored', 0) or 0) or None
+        pixel_representation = int(image.get('PixelRepresentation', 0) or 0)
+        photometric = image.get('PhotometricInterpretation', 'MONOCHROME2')
+        samples_per_pixel = int(image.get('SamplesPerPixel', 1) or 1)
         
-        for elem in req.ModificationList:
-            tag = (elem.tag.group, elem.tag.element)
-            
-            if tag == (0x7FE0, 0x0010):  # PixelData
-                pixel_data = elem.value
-                safe_print(f"📸 تم استلام PixelData - النوع: {type(pixel_data)}")
-                
-            elif tag == (0x0028, 0x0010):  # Rows
-                rows = elem.value
-            elif tag == (0x0028, 0x0011):  # Columns  
-                cols = elem.value
-            elif tag == (0x0028, 0x0100):  # BitsAllocated
-                bits_allocated = elem.value
-        
-        # حفظ بيانات الصورة
+        # الموضع في الفيلم من الطلب أو من Film Box الذي أنشأ الصندوق
+        film_box_uid, position = find_film_box(sop_instance_uid)
+        position = int(mod.get('ImageBoxPosition', 0) or 0) or position
+        
+        # حفظ بيانات الصورة بدون نسخ (والصناديق الكبيرة في ملف مؤقت)
         if pixel_data and rows > 0 and cols > 0:
-            image_boxes[sop_instance_uid] = {
-                'pixel_data': pixel_data,
+            buffer = ingest_pixel_data(
+                pixel_data,
+                spill_threshold=config["PixelSpillThreshold"],
+                spill_dir=config["PixelSpillDir"],
+            )
+            nbytes = len(buffer)
+            
+            # PixelData مضغوط: يبدأ الفك فورًا في مجموعة العمليات بينما يستمر الاتصال
+            transfer_syntax = event.context.transfer_syntax
+            decoded = None
+            if is_encapsulated(transfer_syntax):
+                decoded = decode_pool.submit(
+                    buffer.view, transfer_syntax, rows, cols, bits_allocated, bits_stored,
+                    pixel_representation, photometric, samples_per_pixel,
+                )
+                nbytes += rows * cols * samples_per_pixel * max(1, bits_allocated // 8)
+            
+            stored = state.put('image_boxes', sop_instance_uid, {
+                'pixel_data': buffer,
                 'rows': rows,
                 'cols': cols,
                 'bits_allocated': bits_allocated,
+                'bits_stored': bits_stored,
+                'pixel_representation': pixel_representation,
+                'photometric': photometric,
+                'samples_per_pixel': samples_per_pixel,
+                'film_box_uid': film_box_uid,
+                'position': position,
+                'transfer_syntax': transfer_syntax,
+                'decoded': decoded,
+                'nbytes': nbytes,
                 'received_at': datetime.now()
-            }
-            safe_print(f"💾 تم حفظ بيانات الصورة: {rows}x{cols}, {bits_allocated} بت")
+            }, owner=association_key(event), nbytes=nbytes)
+            del pixel_data, image, mod
+            if not stored:
+                # الميزانية محجوزة بصناديق في طابور الطباعة - لا نخلي ما وُعد المرسل بطباعته
+                safe_print("⛔ ذاكرة الجلسات ممتلئة بمهام منتظرة - رفض N-SET", level=logging.WARNING,
+                           uid=sop_instance_uid, bytes=nbytes, queued_bytes=state.queued_bytes())
+                buffer.close()
+                if decoded is not None:
+                    decoded.cancel()
+                return STATUS_OUT_OF_RESOURCES, None
+            # الصندوق المستقل له تتبعه الخاص؛ صناديق Film Box تُضاف لتتبع الفيلم
+            trace = tracing.get(film_box_uid) if film_box_uid else tracing.get_or_start(
+                sop_instance_uid, 'image_box', uid=sop_instance_uid, assoc=association_key(event))
+            if trace is not None:
+                trace.add('n_set', received_ns, position=position, bytes=len(buffer), compressed=decoded is not None)
+            safe_print("💾 تم حفظ بيانات الصورة", uid=sop_instance_uid, assoc=association_key(event),
+                       size=f"{rows}x{cols}", bits=bits_allocated, bytes=len(buffer), spilled=buffer.spilled,
+                       compressed=decoded is not None)
             
-            # محاولة الطباعة الفورية
-            process_print_job(sop_instance_uid)
+            # صندوق تابع لـ Film Box ينتظر N-ACTION لتُطبع الصفحة كاملة؛
+            # الصندوق المستقل (بدون Film Box معروف) يُطبع فورًا كما في السابق
+            if film_box_uid is None and not enqueue_print_job(sop_instance_uid):
+                return STATUS_RESOURCE_LIMITATION, None
         else:
-            safe_print("ℹ️ N-SET بدون PixelData كامل - قد يكون تهيئة أولية")
+            debug_print("ℹ️ N-SET بدون PixelData كامل - قد يكون تهيئة أولية")
         
         return 0x0000, None
         
     except Exception as e:
-        safe_print(f"❌ خطأ في N-SET: {e}")
+        safe_print(f"❌ خطأ في N-SET: {e}", level=logging.ERROR)
         return 0x0000, None  # نعود بنجاح للحفاظ على الاتصال
 
+@track_dimse('N-ACTION')
 def handle_n_action(event):
     """معالجة N-ACTION - متوافقة مع Weasis"""
     try:
         req = event.request
         sop_instance_uid = req.RequestedSOPInstanceUID
         
-        safe_print(f"🖨️ [N-ACTION] بدء الطباعة لـ: {sop_instance_uid}")
+        safe_print("🖨️ [N-ACTION] بدء الطباعة", uid=sop_instance_uid, assoc=association_key(event))
         
-        # معالجة طلب الطباعة
-        success = process_print_job(sop_instance_uid)
+        # Film Box -> صفحة واحدة؛ Film Session -> صفحة لكل Film Box؛ غير ذلك صندوق صورة مفرد
+        if state.get('film_boxes', sop_instance_uid) is not None:
+            film_box_uids = [sop_instance_uid]
+        elif state.get('film_sessions', sop_instance_uid) is not None:
+            film_box_uids = [uid for uid, box in state.items('film_boxes') if box['session_uid'] == sop_instance_uid]
+        else:
+            film_box_uids = None
         
-        if success:
-            safe_print("✅ تمت معالجة N-ACTION بنجاح")
+        # مرحلة الاستقبال: من N-CREATE (أو أول N-SET) حتى N-ACTION
+        for uid in film_box_uids if film_box_uids is not None else [sop_instance_uid]:
+            trace = tracing.get(uid)
+            if trace is not None:
+                trace.add('receive', trace.start_ns)
+        
+        if film_box_uids == []:
+            safe_print("⚠️ Film Session بدون Film Box - لا شيء للطباعة", level=logging.WARNING, uid=sop_instance_uid)
+            return STATUS_NO_FILM_BOXES, None
+        
+        # إضافة طلب الطباعة للطابور (كل أفلام الجلسة أو لا شيء)
+        if film_box_uids is None:
+            queued = enqueue_print_job(sop_instance_uid)
         else:
-            safe_print("❌ فشل في معالجة N-ACTION")
+            queued = enqueue_film_boxes(film_box_uids)
+        if not queued:
+            safe_print("⛔ الطابور ممتلئ - رفض N-ACTION", level=logging.WARNING)
+            return STATUS_RESOURCE_LIMITATION, None
         
+        debug_print("✅ تمت إضافة N-ACTION للطابور")
         return 0x0000, None
         
     except Exception as e:
-        safe_print(f"❌ خطأ في N-ACTION: {e}")
+        safe_print(f"❌ خطأ في N-ACTION: {e}", level=logging.ERROR)
         return 0x0000, None
 
+@track_dimse('N-DELETE')
 def handle_n_delete(event):
     """معالجة N-DELETE - متوافقة مع Weasis"""
     try:
         req = event.request
         sop_instance_uid = req.RequestedSOPInstanceUID
         
-        safe_print(f"🗑️ [N-DELETE] حذف: {sop_instance_uid}")
+        safe_print("🗑️ [N-DELETE] حذف", uid=sop_instance_uid, assoc=association_key(event))
         
-        # تنظيف البيانات
-        if sop_instance_uid in film_sessions:
-            del film_sessions[sop_instance_uid]
-        if sop_instance_uid in film_boxes:
-            del film_boxes[sop_instance_uid]
-        if sop_instance_uid in image_boxes:
-            del image_boxes[sop_instance_uid]
+        # تنظيف البيانات (مع صناديق الصور التابعة لـ Film Box)
+        film_box = state.get('film_boxes', sop_instance_uid)
+        if film_box is not None:
+            for box_uid in film_box['image_boxes']:
+                state.delete(box_uid)
+        state.delete(sop_instance_uid)
         
-        safe_print("✅ تم التنظيف بنجاح")
+        debug_print("✅ تم التنظيف بنجاح")
         return 0x0000
         
     except Exception as e:
-        safe_print(f"❌ خطأ في N-DELETE: {e}")
+        safe_print(f"❌ خطأ في N-DELETE: {e}", level=logging.ERROR)
         return 0x0000
 
 # =================================================================
 #                 وظائف معالجة الطباعة - الإصدار المحسن
 # =================================================================
 
-def bytesio_to_bytes(bytesio_obj):
-    """تحويل BytesIO إلى bytes"""
-    try:
-        if hasattr(bytesio_obj, 'getvalue'):
-            return bytesio_obj.getvalue()
-        elif hasattr(bytesio_obj, 'read'):
-            current_pos = bytesio_obj.tell()
-            bytesio_obj.seek(0)
-            data = bytesio_obj.read()
-            bytesio_obj.seek(current_pos)
-            return data
-        return bytes(bytesio_obj)
-    except Exception as e:
-        safe_print(f"❌ فشل في تحويل BytesIO: {e}")
-        return None
-
-def create_image_from_pixel_data(pixel_data, rows, cols, bits_allocated=8):
+def create_image_from_pixel_data(pixel_data, rows, cols, bits_allocated=8,
+                                 bits_stored=None, pixel_representation=0, photometric='MONOCHROME2',
+                                 samples_per_pixel=1):
     """إنشاء صورة من بيانات البكسل - متوافق مع Weasis"""
     try:
-        safe_print(f"🎨 إنشاء صورة: {rows}x{cols}, {bits_allocated} بت")
+        debug_print(f"🎨 إنشاء صورة: {rows}x{cols}, {bits_allocated} بت")
         
-        # تحويل البيانات إذا كانت BytesIO
-        if hasattr(pixel_data, 'getvalue') or hasattr(pixel_data, 'read'):
-            pixel_data = bytesio_to_bytes(pixel_data)
-            if pixel_data is None:
-                return None
+        # غلاف بدون نسخ فوق bytes / BytesIO / memmap
+        buffer = ingest_pixel_data(pixel_data)
         
-        if not pixel_data or rows <= 0 or cols <= 0:
-            safe_print("❌ بيانات غير صالحة لإنشاء الصورة")
+        if not len(buffer) or rows <= 0 or cols <= 0:
+            safe_print("❌ بيانات غير صالحة لإنشاء الصورة", level=logging.ERROR)
             return None
         
         # حساب الحجم المطلوب
-        total_pixels = rows * cols
+        total_pixels = rows * cols * samples_per_pixel
+        dtype = np.uint16 if bits_allocated == 16 else np.uint8
+        available = len(buffer) // np.dtype(dtype).itemsize
         
-        if bits_allocated == 16:
-            dtype = np.uint16
-            bytes_needed = total_pixels * 2
-        else:
-            dtype = np.uint8
-            bytes_needed = total_pixels
-        
-        # التأكد من كفاية البيانات
-        if len(pixel_data) < bytes_needed:
-            safe_print(f"⚠️ بيانات غير كافية: {len(pixel_data)} < {bytes_needed}")
-            bytes_needed = min(len(pixel_data), bytes_needed)
-        
-        # إنشاء المصفوفة
-        array = np.frombuffer(pixel_data[:bytes_needed], dtype=dtype)
-        
-        # إعادة التشكيل
-        if len(array) >= total_pixels:
-            array = array[:total_pixels].reshape((rows, cols))
+        # إنشاء المصفوفة فوق نفس الذاكرة (count بدل التقطيع)
+        if available >= total_pixels:
+            array = buffer.as_array(dtype, count=total_pixels)
         else:
             # تمديد البيانات إذا كانت غير كافية
-            safe_print(f"⚠️ تمديد البيانات: {len(array)} من {total_pixels} بيكسل")
-            temp_array = np.zeros(total_pixels, dtype=dtype)
-            temp_array[:len(array)] = array
-            array = temp_array.reshape((rows, cols))
-        
-        # تطبيع بيانات 16-bit
-        if bits_allocated == 16:
-            if array.max() > 0:
-                array = (array.astype(np.float32) / array.max() * 255).astype(np.uint8)
-            else:
-                array = array.astype(np.uint8)
+            safe_print(f"⚠️ تمديد البيانات: {available} من {total_pixels} بيكسل", level=logging.WARNING)
+            array = np.zeros(total_pixels, dtype=dtype)
+            array[:available] = buffer.as_array(dtype, count=available)
         
-        # إنشاء الصورة
-        image = Image.fromarray(array, mode='L')
-        safe_print(f"✅ تم إنشاء الصورة: {image.size}")
-        return image
+        return render_pixel_array(array, rows, cols, bits_allocated, bits_stored,
+                                  pixel_representation, photometric, samples_per_pixel)
         
     except Exception as e:
-        safe_print(f"❌ فشل في إنشاء الصورة: {e}")
+        safe_print(f"❌ فشل في إنشاء الصورة: {e}", level=logging.ERROR)
         return None
 
-def create_print_job_image(image, job_info):
-    """إنشاء صورة الطباعة النهائية مع المعلومات"""
+@tracing.spanned('window')
+def render_pixel_array(array, rows, cols, bits_allocated=8, bits_stored=None,
+                       pixel_representation=0, photometric='MONOCHROME2', samples_per_pixel=1):
+    """صورة PIL من مصفوفة بكسل (خام أو مفكوكة من صيغة مضغوطة)"""
+    # صور ملونة (Color Image Box): RGB متداخل بـ 8 بت
+    if samples_per_pixel == 3:
+        if bits_allocated == 16:
+            array = window_array(array, bits_stored=bits_stored)
+        image = Image.fromarray(array.reshape((rows, cols, 3)), mode='RGB')
+        debug_print(f"✅ تم إنشاء الصورة: {image.size}")
+        return image
+    array = array.reshape((rows, cols))
+    
+    # تحويل 16-bit (أو عكس MONOCHROME1) عبر جدول LUT واحد
+    if bits_allocated == 16:
+        array = window_array(
+            array,
+            bits_stored=bits_stored,
+            signed=bool(pixel_representation),
+            invert=photometric == 'MONOCHROME1',
+        )
+    elif photometric == 'MONOCHROME1':
+        array = window_array(array, value_range=(0, 255), invert=True)
+    
+    # إنشاء الصورة
+    image = Image.fromarray(array, mode='L')
+    debug_print(f"✅ تم إنشاء الصورة: {image.size}")
+    return image
+
+HEADER_HEIGHT = 60
+HEADER_LINE_STEP = 20
+
+@lru_cache(maxsize=4)
+def load_header_font(size=14):
+    """تحميل الخط مرة واحدة فقط"""
     try:
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=32)
+def render_header_strip(width, printer_name, paper_size, dpi):
+    """رسم الأجزاء الثابتة من رأس الطباعة مرة واحدة كشريط L
+
+    تعيد (الشريط، مواضع الحقول المتغيرة): الوقت وأبعاد الصورة فقط تُرسم لكل مهمة.
+    """
+    font = load_header_font()
+    strip = Image.new('L', (width, HEADER_HEIGHT), 255)
+    draw = ImageDraw.Draw(strip)
+    
+    line1 = "DICOM Print Job - "
+    line2 = f"Printer: {printer_name or 'Default'} | Image: "
+    line3 = f"Paper: {paper_size} | DPI: {dpi}"
+    
+    y_offset = 10
+    draw.text((10, y_offset), line1, fill=0, font=font)
+    timestamp_pos = (10 + int(draw.textlength(line1, font=font)), y_offset)
+    y_offset += HEADER_LINE_STEP
+    draw.text((10, y_offset), line2, fill=0, font=font)
+    dimensions_pos = (10 + int(draw.textlength(line2, font=font)), y_offset)
+    y_offset += HEADER_LINE_STEP
+    draw.text((10, y_offset), line3, fill=0, font=font)
+    
+    strip.readonly = 1
+    return strip, timestamp_pos, dimensions_pos
+
+def create_print_job_image(image, job_info, page_size=None):
+    """إنشاء صورة الطباعة النهائية مع المعلومات
+
+    أبعاد الصفحة تُحسب أولًا، فتُصغَّر الصورة مرة واحدة إلى حجمها النهائي
+    وتبقى بنمط L (الرمادي) بدل نسخة RGB كاملة الدقة.
+    """
+    try:
+        original_width, original_height = image.size
         
         # إضافة هامش للمعلومات
-        margin = 60
-        new_width = image.width
-        new_height = image.height + margin
+        margin = HEADER_HEIGHT
+        page_width, page_height = page_size or print_manager.calculate_print_dimensions(*image.size)
+        target = fit_size(image.size, (page_width, page_height - margin), max_scale=1.0)
+        image = resize_once(image, target)
         
-        new_image = Image.new('RGB', (new_width, new_height), 'white')
+        mode = 'RGB' if image.mode == 'RGB' else 'L'
+        if image.mode != mode:
+            image = image.convert(mode)
+        new_image = Image.new(mode, (image.width, image.height + margin), 'white')
         new_image.paste(image, (0, margin))
         
-        draw = ImageDraw.Draw(new_image)
+        # الشريط الثابت من الكاش + الحقول المتغيرة فقط
+        strip, timestamp_pos, dimensions_pos = render_header_strip(
+            image.width, print_manager.printer_name, print_manager.paper_size, print_manager.dpi
+        )
+        new_image.paste(strip, (0, 0))
         
-        try:
-            font = ImageFont.truetype("arial.ttf", 14)
-        except:
-            font = ImageFont.load_default()
-        
-        # معلومات الطباعة
-        info_lines = [
-            f"DICOM Print Job - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            f"Image: {image.width}x{image.height} | Printer: {print_manager.printer_name or 'Default'}",
-            f"Paper: {print_manager.paper_size} | DPI: {print_manager.dpi}"
-        ]
-        
-        y_offset = 10
-        for line in info_lines:
-            draw.text((10, y_offset), line, fill="black", font=font)
-            y_offset += 20
+        draw = ImageDraw.Draw(new_image)
+        font = load_header_font()
+        draw.text(timestamp_pos, datetime.now().strftime('%Y-%m-%d %H:%M'), fill="black", font=font)
+        draw.text(dimensions_pos, f"{original_width}x{original_height}", fill="black", font=font)
         
         return new_image
         
     except Exception as e:
-        safe_print(f"⚠️ فشل في إضافة معلومات الطباعة: {e}")
+        safe_print(f"⚠️ فشل في إضافة معلومات الطباعة: {e}", level=logging.WARNING)
         return image
 
+def image_from_box(image_data):
+    """صورة PIL من بيانات صندوق صورة مخزن (مرحلة decode في المقاييس والتتبع)"""
+    with stage('decode', transfer_syntax=image_data.get('transfer_syntax')):
+        return _image_from_box(image_data)
+
+def _image_from_box(image_data):
+    decoded = image_data.get('decoded')
+    if decoded is not None:
+        # صندوق مضغوط: ننتظر نتيجة الفك (بدأ منذ N-SET) ثم نفس مسار النافذة
+        try:
+            array = decoded.result()
+        except Exception as e:
+            safe_print(f"❌ فشل فك صيغة النقل المضغوطة: {e}", level=logging.ERROR,
+                       transfer_syntax=image_data.get('transfer_syntax'))
+            return None
+        return render_pixel_array(
+            array,
+            image_data['rows'],
+            image_data['cols'],
+            image_data['bits_allocated'],
+            bits_stored=image_data.get('bits_stored'),
+            pixel_representation=image_data.get('pixel_representation', 0),
+            photometric=image_data.get('photometric', 'MONOCHROME2'),
+            samples_per_pixel=image_data.get('samples_per_pixel', 1),
+        )
+    return create_image_from_pixel_data(
+        image_data['pixel_data'],
+        image_data['rows'],
+        image_data['cols'],
+        image_data['bits_allocated'],
+        bits_stored=image_data.get('bits_stored'),
+        pixel_representation=image_data.get('pixel_representation', 0),
+        photometric=image_data.get('photometric', 'MONOCHROME2'),
+        samples_per_pixel=image_data.get('samples_per_pixel', 1),
+    )
+
+def restore_image_box(sop_instance_uid, image_data):
+    """إعادة صندوق الصورة للمخزن بعد فشل الطباعة ليُعاد بـ N-ACTION لاحق"""
+    if ('image_boxes', sop_instance_uid) in state:
+        return
+    # نفس الحجم المحسوب في N-SET (مع حجم الإطار المفكوك للصناديق المضغوطة)
+    nbytes = image_data.get('nbytes', len(image_data['pixel_data']))
+    if not state.put('image_boxes', sop_instance_uid, image_data, nbytes=nbytes):
+        safe_print("⚠️ لا مكان لإعادة صندوق الصورة بعد فشل الطباعة - تحريره", level=logging.WARNING,
+                   uid=sop_instance_uid)
+        image_data['pixel_data'].close()
+
+@tracing.traced_job
 def process_print_job(sop_instance_uid):
     """معالجة مهمة الطباعة - المحور الرئيسي"""
+    success = False
+    try:
+        success = print_image_box(sop_instance_uid)
+        return success
+    finally:
+        finish_job(sop_instance_uid, success)
+
+def print_image_box(sop_instance_uid):
+    """طباعة صندوق صورة مفرد - True عند النجاح، وإلا يعود الصندوق للمخزن"""
+    debug_print(f"🖨️ معالجة مهمة الطباعة: {sop_instance_uid}")
+    
+    # حجز بيانات الصورة حتى لا يطبعها عامل آخر (N-SET ثم N-ACTION لنفس الصندوق)
+    image_data = state.pop('image_boxes', sop_instance_uid)
+    if not image_data:
+        safe_print("⚠️ لا توجد بيانات صورة للطباعة", level=logging.WARNING)
+        return False
+    
+    success = False
     try:
-        safe_print(f"🖨️ معالجة مهمة الطباعة: {sop_instance_uid}")
-        
-        # البحث عن بيانات الصورة
-        image_data = image_boxes.get(sop_instance_uid)
-        if not image_data:
-            safe_print("⚠️ لا توجد بيانات صورة للطباعة")
-            return False
-        
         # إنشاء الصورة من بيانات البكسل
-        image = create_image_from_pixel_data(
-            image_data['pixel_data'],
-            image_data['rows'], 
-            image_data['cols'],
-            image_data['bits_allocated']
-        )
+        set_stage('rendering')
+        image = image_from_box(image_data)
         
         if not image:
-            safe_print("❌ فشل في إنشاء الصورة من البيانات")
+            safe_print("❌ فشل في إنشاء الصورة من البيانات", level=logging.ERROR)
             return False
         
         # إنشاء صورة الطباعة النهائية
-        printable_image = create_print_job_image(image, {
-            'sop_instance_uid': sop_instance_uid,
-            'timestamp': datetime.now()
-        })
+        with stage('render'):
+            printable_image = create_print_job_image(image, {
+                'sop_instance_uid': sop_instance_uid,
+                'timestamp': datetime.now()
+            })
         
         # الطباعة باستخدام النظام المتقدم
-        success = print_manager.print_image_advanced(printable_image, "DICOM Print from Weasis")
+        set_stage('spooling')
+        with stage('spool'):
+            success = print_manager.print_image_advanced(printable_image, "DICOM Print from Weasis")
         
         if success:
             safe_print("✅ تمت معالجة مهمة الطباعة بنجاح")
-            # تنظيف البيانات بعد الطباعة الناجحة
-            if sop_instance_uid in image_boxes:
-                del image_boxes[sop_instance_uid]
         else:
-            safe_print("❌ فشل في معالجة مهمة الطباعة")
-        
+            safe_print("❌ فشل في معالجة مهمة الطباعة", level=logging.ERROR)
         return success
         
     except Exception as e:
-        safe_print(f"❌ خطأ في معالجة مهمة الطباعة: {e}")
+        safe_print(f"❌ خطأ في معالجة مهمة الطباعة: {e}", level=logging.ERROR)
         return False
+    finally:
+        if success:
+            image_data['pixel_data'].close()
+        else:
+            # إعادة البيانات ليتمكن N-ACTION لاحق من إعادة المحاولة (أو تحريرها إن لم يتسع المخزن)
+            restore_image_box(sop_instance_uid, image_data)
+
+@tracing.traced_job
+def process_film_box_job(film_box_uid):
+    """تركيب كل صناديق الصور في Film Box على صفحة واحدة وطباعتها، ثم حذف الفيلم المطبوع"""
+    success = False
+    try:
+        success = print_film_box(film_box_uid)
+        return success
+    finally:
+        finish_job(film_box_uid, success, film_box=True)
+
+def print_film_box(film_box_uid):
+    """تركيب الصناديق المحجوزة وطباعتها - True عند النجاح، وإلا تعود الصناديق للمخزن"""
+    film_box = state.get('film_boxes', film_box_uid)
+    if not film_box:
+        safe_print(f"⚠️ Film Box غير موجود: {film_box_uid}", level=logging.WARNING)
+        return False
+    
+    # حجز بيانات الصناديق حتى لا تُطبع مرتين
+    claimed = {}
+    for box_uid in list(film_box['image_boxes']):
+        image_data = state.pop('image_boxes', box_uid)
+        if image_data:
+            claimed[box_uid] = image_data
+    if not claimed:
+        safe_print("⚠️ لا توجد صور في Film Box للطباعة", level=logging.WARNING)
+        return False
+    
+    success = False
+    try:
+        set_stage('rendering')
+        images = {}
+        for box_uid, image_data in claimed.items():
+            image = image_from_box(image_data)
+            if image:
+                position = image_data.get('position') or film_box['image_boxes'][box_uid]
+                images[position] = image
+        
+        page_size = page_size_pixels(film_box['film_size_id'], film_box['film_orientation'], print_manager.dpi)
+        with stage('render', images=len(images)):
+            page = compose_film(images, film_box['image_display_format'], page_size)
+        debug_print(f"🎞️ تركيب {len(images)} صورة على صفحة {page_size[0]}x{page_size[1]}")
+        
+        set_stage('spooling')
+        with stage('spool'):
+            success = print_manager.print_image_advanced(page, "DICOM Film Print", page_size=page_size)
+        return success
+    finally:
+        for box_uid, image_data in claimed.items():
+            if success:
+                image_data['pixel_data'].close()
+            else:
+                restore_image_box(box_uid, image_data)
 
 # =================================================================
 #                 معالجات إضافية للتوافق
 # =================================================================
 
+@track_dimse('C-ECHO')
 def handle_verification(event):
     """معالجة طلب التحقق"""
-    safe_print("✅ تم استقبال طلب التحقق (C-ECHO)")
+    debug_print("✅ تم استقبال طلب التحقق (C-ECHO)")
     return 0x0000
 
+# كاتب خلفي واحد لحفظ C-STORE على القرص (اختياري) بعيدًا عن خيط الاتصال
+store_spool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-spool")
+
+def persist_store_dataset(encoded, sop_instance_uid):
+    """كتابة الملف المستلم كما هو (مع Meta) إلى StoreSpoolDir"""
+    try:
+        spool_dir = config["StoreSpoolDir"]
+        os.makedirs(spool_dir, exist_ok=True)
+        path = os.path.join(spool_dir, f"{sop_instance_uid}.dcm")
+        with open(path, "wb") as f:
+            f.write(encoded)
+        safe_print(f"💾 تم حفظ C-STORE في: {path}")
+    except Exception as e:
+        safe_print(f"⚠️ فشل حفظ C-STORE: {e}", level=logging.WARNING)
+
+@tracing.traced_job
+def process_store_job(sop_instance_uid, ds):
+    """فك صورة C-STORE من الذاكرة وطباعتها - تعمل على عامل الطابور"""
+    set_stage('rendering')
+    with stage('decode'):
+        arr = ds.pixel_array
+        
+        # النافذة و Rescale و MONOCHROME1 عبر جدول LUT واحد
+        with tracing.span('window'):
+            arr = window_dataset(ds, arr)
+            image = Image.fromarray(arr).convert('L')
+    
+    # طباعة الصورة
+    with stage('render'):
+        printable_image = create_print_job_image(image, {
+            'source': 'C-STORE',
+            'sop_instance': sop_instance_uid
+        })
+    
+    set_stage('spooling')
+    with stage('spool'):
+        return print_manager.print_image_advanced(printable_image, "DICOM Store Print")
+
+@track_dimse('C-STORE')
 def handle_store(event):
-    """معالجة C-STORE للصور المباشرة"""
+    """معالجة C-STORE للصور المباشرة - فك في الذاكرة بدون ملف مؤقت"""
     try:
-        safe_print(f"📥 [C-STORE] استقبال صورة: {event.request.AffectedSOPClassUID}")
+        sop_instance_uid = event.request.AffectedSOPInstanceUID
+        safe_print("📥 [C-STORE] استقبال صورة", uid=sop_instance_uid,
+                   sop_class=event.request.AffectedSOPClassUID, assoc=association_key(event))
         
-        if hasattr(event, 'dataset'):
-            # حفظ الصورة مؤقتًا ومعالجتها
-            temp_path = f"temp_store_{event.request.AffectedSOPInstanceUID}.dcm"
-            event.dataset.save_as(temp_path)
-            
-            # محاولة تحويل الصورة
-            try:
-                ds = dcmread(temp_path)
-                arr = ds.pixel_array
-                
-                if arr is not None:
-                    # تطبيع الصورة
-                    if arr.dtype != np.uint8:
-                        arr = arr.astype(np.float32)
-                        arr -= arr.min()
-                        if arr.max() > 0:
-                            arr = arr / arr.max() * 255.0
-                        arr = arr.astype(np.uint8)
-                    
-                    image = Image.fromarray(arr).convert('L')
-                    
-                    # طباعة الصورة
-                    printable_image = create_print_job_image(image, {
-                        'source': 'C-STORE',
-                        'sop_instance': event.request.AffectedSOPInstanceUID
-                    })
-                    
-                    print_manager.print_image_advanced(printable_image, "DICOM Store Print")
-                    
-            except Exception as e:
-                safe_print(f"⚠️ فشل في معالجة C-STORE: {e}")
-            
-            # التنظيف
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+        ds = event.dataset
+        ds.file_meta = event.file_meta
+        
+        # الحفظ على القرص اختياري وغير متزامن
+        if config["StoreSpoolDir"]:
+            store_spool_executor.submit(
+                persist_store_dataset, event.encoded_dataset(include_meta=True), sop_instance_uid
+            )
+        
+        tracing.start(sop_instance_uid, 'store', uid=sop_instance_uid, assoc=association_key(event))
+        trace = queue_trace(sop_instance_uid)
+        job_id = print_queue.submit(process_store_job, sop_instance_uid, ds)
+        if not job_id:
+            tracing.pop(sop_instance_uid)
+            return STATUS_OUT_OF_RESOURCES
+        tag_trace(trace, job_id)
+        print_queue.annotate(job_id, kind='store', uid=sop_instance_uid)
         
         return 0x0000
         
     except Exception as e:
-        safe_print(f"❌ خطأ في C-STORE: {e}")
+        safe_print(f"❌ خطأ في C-STORE: {e}", level=logging.ERROR)
         return 0x0110
 
+@track_dimse('N-GET')
 def handle_n_get(event):
     """معالجة N-GET"""
     try:
         req = event.request
-        safe_print(f"📋 [N-GET] طلب معلومات: {req.RequestedSOPClassUID}")
+        debug_print(f"📋 [N-GET] طلب معلومات: {req.RequestedSOPClassUID}")
         
         if req.RequestedSOPClassUID == Printer:
             ds = Dataset()
@@ -605,67 +935,132 @@ def handle_n_get(event):
         return 0x0000, None
         
     except Exception as e:
-        safe_print(f"❌ خطأ في N-GET: {e}")
+        safe_print(f"❌ خطأ في N-GET: {e}", level=logging.ERROR)
         return 0x0000, None
 
 # =================================================================
 #                 إعدادات الخادم الرئيسية
 # =================================================================
 
+# =================================================================
+#                 إعدادات الشبكة وصيغ النقل
+# =================================================================
+
+# الأصناف التي نقبلها - المفاتيح هي الأسماء المستخدمة في TransferSyntaxes بالإعدادات
+SUPPORTED_SOP_CLASSES = {
+    'BasicGrayscalePrintManagementMeta': BASIC_GRAYSCALE_PRINT_META_SOP_CLASS,
+    'BasicColorPrintManagementMeta': BASIC_COLOR_PRINT_META_SOP_CLASS,
+    'BasicFilmSession': BasicFilmSession,
+    'BasicFilmBox': BasicFilmBox,
+    'BasicGrayscaleImageBox': BasicGrayscaleImageBox,
+    'BasicColorImageBox': BasicColorImageBox,
+    'Printer': Printer,
+    'Verification': Verification,
+    'CTImageStorage': CTImageStorage,
+}
+
+def resolve_transfer_syntax(name):
+    """اسم صيغة النقل (ExplicitVRLittleEndian) أو UID رقمي -> UID"""
+    name = str(name).strip()
+    if name[:1].isdigit():
+        return UID(name)
+    uid = getattr(pydicom.uid, name, None)
+    if not isinstance(uid, UID) or not uid.is_transfer_syntax:
+        raise ValueError(f"صيغة نقل غير معروفة: {name}")
+    return uid
+
+def transfer_syntaxes_for(name, sop_class):
+    """قائمة صيغ النقل لصنف معين - بالاسم أو UID، وإلا default
+
+    الصيغ المضغوطة التي لا تتوفر لها إضافة فك في هذه البيئة تُستبعد بدل قبول بيانات لا يمكن طباعتها.
+    """
+    table = config["TransferSyntaxes"]
+    names = table.get(name) or table.get(str(sop_class)) or table.get("default")
+    syntaxes = []
+    for ts in (resolve_transfer_syntax(n) for n in names):
+        if can_decode(ts):
+            syntaxes.append(ts)
+        else:
+            safe_print(f"⚠️ لا توجد إضافة لفك {ts.name} - استبعادها من {name}", level=logging.WARNING)
+    return syntaxes
+
+def create_ae():
+    """تهيئة AE حسب الإعدادات: حجم PDU، المهل، وصيغ النقل لكل صنف"""
+    ae = AE(ae_title=config["AETitle"])
+    # 0 = بلا حد: المرسل يرسل صندوق الصورة بأقل عدد من PDU
+    ae.maximum_pdu_length = int(config["MaxPDULength"])
+    ae.acse_timeout = config["ACSETimeout"]
+    ae.dimse_timeout = config["DIMSETimeout"]
+    ae.network_timeout = config["NetworkTimeout"]
+
+    for name, sop_class in SUPPORTED_SOP_CLASSES.items():
+        syntaxes = transfer_syntaxes_for(name, sop_class)
+        ae.add_supported_context(sop_class, syntaxes, scp_role=True, scu_role=False)
+        debug_print(f"🔗 {name}: {', '.join(ts.name for ts in syntaxes)}")
+
+    safe_print("🔧 إعدادات الشبكة", max_pdu=ae.maximum_pdu_length or "unlimited",
+               acse=ae.acse_timeout, dimse=ae.dimse_timeout, network=ae.network_timeout)
+    return ae
+
+def event_handlers():
+    """معالجات أحداث الخادم (DIMSE + انتهاء الاتصال + القياس الاختياري)"""
+    handlers = [
+        (evt.EVT_N_CREATE, handle_n_create),
+        (evt.EVT_N_SET, handle_n_set),
+        (evt.EVT_N_ACTION, handle_n_action),
+        (evt.EVT_N_DELETE, handle_n_delete),
+        (evt.EVT_N_GET, handle_n_get),
+        (evt.EVT_C_ECHO, handle_verification),
+        (evt.EVT_C_STORE, handle_store),
+        (evt.EVT_RELEASED, handle_association_closed),
+        (evt.EVT_ABORTED, handle_association_closed),
+    ]
+    if config["MeasureThroughput"]:
+        handlers += ThroughputMeter().handlers()
+        safe_print("📶 وضع القياس مفعّل: تسجيل معدل الاستقبال لكل اتصال")
+    return handlers
+
+def start_workers():
+    """تشغيل طابور الطباعة ومنظف المخزن (main هنا و service.py)"""
+    print_queue.start()
+    state.start_reaper(config["SessionSweepInterval"])
+    safe_print(f"🖨️ واجهة الطباعة: {print_manager.get_backend().name}")
+
+def stop_workers(timeout=None):
+    """إغلاق مرتب: تنفيذ المهام المنتظرة أولًا ثم إيقاف المنظف والكاتب ومجمع الفك والطابعة"""
+    print_queue.stop(drain=True, timeout=timeout)
+    state.stop_reaper()
+    store_spool_executor.shutdown(wait=True)
+    decode_pool.shutdown()
+    print_manager.get_backend().close()
+
 def main():
     """الدالة الرئيسية لتشغيل الخادم المتوافق مع Weasis"""
     
     safe_print("========================================")
     safe_print("🚀 تشغيل DICOM Print SCP (متوافق مع Weasis)")
-    safe_print("📍 العنوان: DICOM_PRINT_SCP")
-    safe_print("🔌 المنفذ: 11112")
+    safe_print(f"📍 العنوان: {config['AETitle']}")
+    safe_print(f"🔌 المنفذ: {config['Port']}")
     safe_print("✅ متوافق مع Weasis بالكامل")
     safe_print("✅ محاكاة لخادم PrintSCP الناجح")
     safe_print("✅ طباعة متقدمة بإعدادات A4/300DPI")
     safe_print("✅ دعم كامل لتسلسل Weasis الطباعي")
     safe_print("========================================")
     
-    # تهيئة خادم DICOM
-    ae = AE(ae_title=b"DICOM_PRINT_SCP")
-    ae.maximum_pdu_length = 16384  # زيادة لاستيعاب بيانات الصور
-    
-    supported_ts = [
-        UID('1.2.840.10008.1.2'),      # Implicit VR Little Endian
-        UID('1.2.840.10008.1.2.1'),    # Explicit VR Little Endian  
-    ]
-    
-    # إضافة السياقات المدعومة - مطابقة لـ Weasis
-    ae.add_supported_context(BASIC_GRAYSCALE_PRINT_META_SOP_CLASS, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(BASIC_COLOR_PRINT_META_SOP_CLASS, supported_ts, scp_role=True, scu_role=False)
-    
-    ae.add_supported_context(BasicFilmSession, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(BasicFilmBox, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(BasicGrayscaleImageBox, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(BasicColorImageBox, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(Printer, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(Verification, supported_ts, scp_role=True, scu_role=False)
-    ae.add_supported_context(CTImageStorage, supported_ts, scp_role=True, scu_role=False)
-    
-    # معالجات الأحداث
-    handlers = [
-        (evt.EVT_N_CREATE, handle_n_create),
-        (evt.EVT_N_SET, handle_n_set),
-        (evt.EVT_N_ACTION, handle_n_action),
-        (evt.EVT_N_DELETE, handle_n_delete),
-        (evt.EVT_N_GET, handle_n_get),
-        (evt.EVT_C_ECHO, handle_verification),
-        (evt.EVT_C_STORE, handle_store),
-    ]
+    ae = create_ae()
+    handlers = event_handlers()
+    start_workers()
     
     try:
         safe_print("🟢 الخادم جاهز لاستقبال اتصالات Weasis...")
-        ae.start_server(('', 11112), evt_handlers=handlers, block=True)
+        ae.start_server(('', int(config['Port'])), evt_handlers=handlers, block=True)
         
     except KeyboardInterrupt:
         safe_print("🛑 تم إيقاف الخادم بواسطة المستخدم")
     except Exception as e:
-        safe_print(f"❌ خطأ في الخادم: {e}")
+        safe_print(f"❌ خطأ في الخادم: {e}", level=logging.ERROR)
     finally:
+        stop_workers()
         safe_print("📊 الخادم متوقف")
 
 if __name__ == "__main__":
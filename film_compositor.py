@@ -0,0 +1,128 @@
+# film_compositor.py
+# تركيب صفحة الفيلم: وضع كل صناديق الصور في خلايا ImageDisplayFormat بدقة الصفحة (DPI)
+# كل صورة يُغيَّر حجمها مرة واحدة مباشرة إلى حجم خليتها وتُطبع الصفحة كاملة كمهمة واحدة
+
+from PIL import Image
+
+# مقاسات الأفلام بالبوصة (عرض، ارتفاع) بالاتجاه العمودي
+FILM_SIZES_INCH = {
+    'A4': (8.27, 11.69),
+    'A3': (11.69, 16.54),
+    '8INX10IN': (8.0, 10.0),
+    '8_5INX11IN': (8.5, 11.0),
+    '10INX12IN': (10.0, 12.0),
+    '10INX14IN': (10.0, 14.0),
+    '11INX14IN': (11.0, 14.0),
+    '11INX17IN': (11.0, 17.0),
+    '14INX14IN': (14.0, 14.0),
+    '14INX17IN': (14.0, 17.0),
+    '24CMX24CM': (9.45, 9.45),
+    '24CMX30CM': (9.45, 11.81),
+}
+
+def parse_image_display_format(format_str):
+    boxes = []
+    if not format_str:
+        return boxes
+    parts = format_str.split('\\')
+    mode = parts[0]
+    if mode == "STANDARD" and len(parts) == 2:
+        try:
+            cols, rows = map(int, parts[1].split(','))
+            for r in range(rows):
+                for c in range(cols):
+                    boxes.append((r, c))
+        except: pass
+    elif mode in ["ROW", "COL"] and len(parts) == 2:
+        try:
+            counts = list(map(int, parts[1].split(',')))
+            for i, count in enumerate(counts):
+                for j in range(count):
+                    if mode == "ROW": boxes.append((i, j))
+                    else: boxes.append((j, i))
+        except: pass
+    return boxes
+
+def page_size_pixels(film_size_id='A4', orientation='PORTRAIT', dpi=300):
+    """أبعاد الصفحة بالبكسل حسب FilmSizeID و FilmOrientation"""
+    width_in, height_in = FILM_SIZES_INCH.get(str(film_size_id).upper(), FILM_SIZES_INCH['A4'])
+    width, height = round(width_in * dpi), round(height_in * dpi)
+    if str(orientation).upper() == 'LANDSCAPE':
+        width, height = height, width
+    return width, height
+
+def layout_cells(format_str, page_size, margin=0):
+    """مستطيلات الخلايا (x0, y0, x1, y1) مرتبة حسب ImageBoxPosition (1..N)
+
+    STANDARD و ROW تقسم الصفحة إلى صفوف وكل صف إلى عدد خلاياه،
+    و COL تقسمها إلى أعمدة وكل عمود إلى عدد خلاياه.
+    """
+    positions = parse_image_display_format(format_str) or [(0, 0)]
+    column_major = str(format_str).split('\\')[0] == 'COL'
+    page_w, page_h = page_size
+
+    # عدد الخلايا في كل صف (أو عمود في وضع COL)
+    groups = {}
+    for r, c in positions:
+        key = c if column_major else r
+        groups[key] = groups.get(key, 0) + 1
+    n_groups = len(groups)
+
+    cells = []
+    for r, c in positions:
+        group, index = (c, r) if column_major else (r, c)
+        count = groups[group]
+        if column_major:
+            x0 = page_w * group // n_groups
+            x1 = page_w * (group + 1) // n_groups
+            y0 = page_h * index // count
+            y1 = page_h * (index + 1) // count
+        else:
+            y0 = page_h * group // n_groups
+            y1 = page_h * (group + 1) // n_groups
+            x0 = page_w * index // count
+            x1 = page_w * (index + 1) // count
+        cells.append((x0 + margin, y0 + margin, x1 - margin, y1 - margin))
+    return cells
+
+def fit_size(image_size, cell_size, max_scale=None):
+    """أكبر حجم يحافظ على النسبة داخل الخلية (max_scale=1.0 يمنع التكبير)"""
+    img_w, img_h = image_size
+    cell_w, cell_h = cell_size
+    scale = min(cell_w / img_w, cell_h / img_h)
+    if max_scale is not None:
+        scale = min(scale, max_scale)
+    return max(1, int(img_w * scale)), max(1, int(img_h * scale))
+
+def resize_once(image, size, reducing_gap=2.0):
+    """تصغير بعامل صحيح (reduce = متوسط صناديق رخيص) ثم فلتر LANCZOS واحد للحجم النهائي
+
+    بدل تشغيل LANCZOS على الصورة الكاملة، يبقى للفلتر نسبة تصغير لا تتجاوز reducing_gap.
+    """
+    if image.size == tuple(size):
+        return image
+    factor = int(min(image.width / size[0], image.height / size[1]) / reducing_gap)
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != tuple(size):
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+def compose_film(images, format_str, page_size, margin=8, background=255):
+    """تركيب صفحة واحدة من {ImageBoxPosition: صورة PIL}"""
+    cells = layout_cells(format_str, page_size, margin)
+    color = any(img.mode == 'RGB' for img in images.values())
+    page = Image.new('RGB' if color else 'L', page_size, (background,) * 3 if color else background)
+
+    for position, image in sorted(images.items()):
+        if not 1 <= position <= len(cells):
+            continue
+        x0, y0, x1, y1 = cells[position - 1]
+        target = fit_size(image.size, (x1 - x0, y1 - y0))
+        # تغيير الحجم مرة واحدة مباشرة إلى حجم الخلية
+        image = resize_once(image, target)
+        if image.mode != page.mode:
+            image = image.convert(page.mode)
+        page.paste(image, (x0 + (x1 - x0 - target[0]) // 2, y0 + (y1 - y0 - target[1]) // 2))
+
+    return page
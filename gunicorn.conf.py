@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# إعدادات gunicorn لـ wsgi:application (تُقرأ تلقائيًا عند التشغيل من مجلد المشروع):
+#     gunicorn -b 0.0.0.0:8080 wsgi:application
+# عامل واحد فقط: طابور الرفع وجدول المهام وفهرس /metrics في ذاكرة العملية (انظر wsgi.py) - التوازي بالخيوط
+
+from config import load_config
+
+_config = load_config()
+
+workers = 1
+worker_class = "gthread"
+threads = int(_config["HttpThreads"])
+keepalive = int(_config["HttpKeepAlive"])
+
+def on_starting(server):
+    """رفض التشغيل بعدة عمال (-w N) بدل /jobs/<id> يعيد 404 من العمال الآخرين"""
+    if server.cfg.workers > 1:
+        raise RuntimeError(
+            f"wsgi:application requires a single worker (got -w {server.cfg.workers}); "
+            "job state lives in the process - scale with --threads instead"
+        )
@@ -1,26 +1,252 @@
 # http_server.py
-# واجهة HTTP بسيطة لاستقبال ملفات عبر /upload
+# واجهة HTTP لاستقبال ملفات عبر /upload
+# الرفع يُكتب مباشرة على القرص قطعة بقطعة (مع sha256 وحد أقصى للحجم)، ثم يُسلَّم الملف
+# لطابور في الخلفية يحوّله ويطبعه، والطلب يعود فورًا بمعرف المهمة
+# التشغيل عبر make_http_server / serve: waitress (keep-alive، خيوط محدودة) إن وُجد وإلا werkzeug متعدد الخيوط
+# (تحت gunicorn: gunicorn wsgi:application مع gunicorn.conf.py - عامل واحد، المهام في ذاكرة العملية، انظر wsgi.py)
 
-from flask import Flask, request, jsonify
-from utils import save_uploaded_file
+import logging
+import os
+import shutil
+import threading
+
+from flask import Flask, Request, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+from config import load_config
+from converter import convert_outputs
 from log import safe_print
+from metrics import render as render_metrics
+from print_queue import PrintJobQueue, all_queues, find_job, set_stage
+from printer import print_file
+from utils import RECEIVED_DIR, UploadSpool, UploadTooLarge
+
+config = load_config()
+
+UPLOAD_DIR = config["UploadSpoolDir"] or RECEIVED_DIR
+UPLOAD_MAX_BYTES = config["UploadMaxBytes"]
+UPLOAD_CHUNK_BYTES = config["UploadChunkBytes"]
+UPLOAD_KEEP_FILES = bool(config["UploadKeepFiles"])
+
+HTTP_SERVER = config["HttpServer"]
+HTTP_THREADS = int(config["HttpThreads"])
+HTTP_KEEPALIVE = config["HttpKeepAlive"]
+
+upload_queue = PrintJobQueue("http-upload", config["UploadQueueSize"], config["UploadWorkers"])
+
+def use_queue(queue):
+    """تشغيل الرفع على طابور مشترك (طابور الطباعة في service.py) بدل طابوره الخاص"""
+    global upload_queue
+    upload_queue = queue
+
+class SpoolingRequest(Request):
+    """أجزاء multipart تُكتب مباشرة في UploadSpool بدل الذاكرة/ملف مؤقت مجهول الاسم"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spools = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool(UPLOAD_DIR, UPLOAD_MAX_BYTES, filename)
+        self.spools.append(spool)
+        return spool
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
+# Content-Length المعلن أكبر من الحد يُرفض قبل قراءة أي بايت
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES or None
+# send_file / send_from_directory: ترويسة X-Sendfile بدل قراءة الملف في بايثون (يتطلب خادمًا أماميًا يدعمها)
+app.config['USE_X_SENDFILE'] = bool(config["HttpXSendfile"])
+
+def process_upload(path, sha256=None):
+    """مهمة الخلفية: تحويل الملف المرفوع ثم طباعة كل المخرجات، ثم حذف الملف ومخرجاته"""
+    # المخرجات في مجلد خاص بالرفع (روابط من الكاش) - إخلاء الكاش لا يمسها أثناء الطباعة
+    out_dir = f"{path}.out"
+    try:
+        set_stage('rendering')
+        outputs = convert_outputs(path, content_hash=sha256, out_dir=out_dir)
+        if not outputs:
+            safe_print("❌ فشل تحويل الملف المرفوع", level=logging.ERROR, path=path)
+            return False
+        set_stage('spooling')
+        # الواجهة تأخذ كل مخرج وتحذفه حين تنتهي منه (دفعة lp قد تُرسل لاحقًا)
+        printed = [print_file(p, temporary=not UPLOAD_KEEP_FILES) for p in outputs]
+        return all(printed)
+    finally:
+        if not UPLOAD_KEEP_FILES:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _receive_upload():
+    """UploadSpool للملف المرفوع (multipart 'file' أو جسم الطلب الخام) أو None"""
+    content_type = request.mimetype or ''
+    if content_type.startswith('multipart/') or content_type == 'application/x-www-form-urlencoded':
+        storage = request.files.get('file')
+        if storage is None:
+            return None
+        return storage.stream
+    filename = request.args.get('filename') or request.headers.get('X-Filename')
+    spool = UploadSpool(UPLOAD_DIR, UPLOAD_MAX_BYTES, filename)
+    request.spools.append(spool)
+    spool.copy_from(request.stream, UPLOAD_CHUNK_BYTES)
+    if not spool.size:
+        return None
+    return spool
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({'status': 'error', 'message': 'no file provided'}), 400
-    f = request.files['file']
-    saved = save_uploaded_file(f)
-    safe_print(f"📥 استلمنا ملفاً عبر HTTP: {saved}")
-    return jsonify({'status': 'received', 'path': saved})
+    try:
+        spool = _receive_upload()
+        if spool is None:
+            return jsonify({'status': 'error', 'message': 'no file provided'}), 400
+        path = spool.finish()
+        request.spools.remove(spool)
+    except (UploadTooLarge, RequestEntityTooLarge):
+        safe_print("⛔ ملف مرفوع أكبر من الحد", level=logging.WARNING, max_bytes=UPLOAD_MAX_BYTES)
+        return jsonify({'status': 'error', 'message': 'file too large', 'max_bytes': UPLOAD_MAX_BYTES}), 413
+    finally:
+        # أجزاء غير مستخدمة أو رفع غير مكتمل
+        for leftover in request.spools:
+            leftover.discard()
+        request.spools.clear()
+
+    job_id = upload_queue.submit(process_upload, path, spool.sha256)
+    if job_id is None:
+        spool.discard()
+        return jsonify({'status': 'error', 'message': 'print queue full'}), 503
+    upload_queue.annotate(job_id, kind='upload', path=path)
+    safe_print(f"📥 استلمنا ملفاً عبر HTTP: {path}", job=job_id, bytes=spool.size, sha256=spool.sha256)
+    return jsonify({
+        'status': 'queued',
+        'job_id': job_id,
+        'path': path,
+        'bytes': spool.size,
+        'sha256': spool.sha256,
+    }), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """مهام كل الطوابير في هذه العملية (طباعة DICOM، رفع HTTP...) - ?status= و ?queue= للتصفية"""
+    status = request.args.get('status')
+    queue_name = request.args.get('queue')
+    queues = {}
+    jobs = []
+    for q in all_queues():
+        if queue_name and q.name != queue_name:
+            continue
+        queues[q.name] = {'pending': q.pending(), 'workers': q.workers, 'maxsize': q.maxsize, **q.counts()}
+        jobs.extend(j for j in q.jobs() if not status or j['status'] == status)
+    jobs.sort(key=lambda j: j['submitted_at'], reverse=True)
+    return jsonify({'queues': queues, 'jobs': jobs})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
 
+# =================================================================
+#                 التشغيل: waitress أو werkzeug متعدد الخيوط
+# =================================================================
+
+class WaitressServer:
+    """waitress بنفس واجهة خادم werkzeug (serve_forever / shutdown / server_close)
+
+    الاتصالات و keep-alive وإرسال الملفات (wsgi.file_wrapper) في حلقة I/O واحدة، والتطبيق في HttpThreads خيط فقط.
+    الإيقاف عبر الواجهة العامة فقط: الطلبات الجديدة 503، انتظار الجارية، ثم server.close().
+    """
+
+    def __init__(self, app, host, port):
+        from waitress.server import create_server
+        self._active = 0
+        self._draining = False
+        self._idle = threading.Condition()
+        self._stopped = threading.Event()
+        self._server = create_server(self._track, host=host, port=port, threads=HTTP_THREADS,
+                                     channel_timeout=HTTP_KEEPALIVE, ident="rcp")
+        self._app = app
+
+    def _track(self, environ, start_response):
+        """عداد الطلبات الجارية - حتى نهاية إرسال الجسم (close على الاستجابة)"""
+        with self._idle:
+            if self._draining:
+                start_response("503 Service Unavailable", [("Content-Type", "text/plain"), ("Connection", "close")])
+                return [b"shutting down\n"]
+            self._active += 1
+        try:
+            body = self._app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return ClosingIterator(body, self._done)
+
+    def _done(self):
+        with self._idle:
+            self._active -= 1
+            self._idle.notify_all()
+
+    def serve_forever(self):
+        try:
+            self._server.run()
+        finally:
+            self._stopped.set()
+
+    def shutdown(self, timeout=5):
+        """الطلبات الجارية تكتمل (حتى timeout) ثم close(): لا استقبال، والحلقة تنتهي مع آخر اتصال
+
+        اتصال keep-alive خامل قد يبقي الحلقة حية؛ خيط الخادم daemon فلا يمنع الخروج.
+        """
+        with self._idle:
+            self._draining = True
+            if not self._idle.wait_for(lambda: self._active == 0, timeout):
+                safe_print("⚠️ طلبات HTTP لم تكتمل ضمن مهلة الإيقاف", level=logging.WARNING, active=self._active)
+        self._server.close()
+        self._stopped.wait(timeout)
+
+    def server_close(self):
+        pass
+
+def make_http_server(flask_app, host, port):
+    """خادم HTTP للتطبيق حسب HttpServer - serve_forever في خيط و shutdown للإيقاف"""
+    if HTTP_SERVER in ("auto", "waitress"):
+        try:
+            server = WaitressServer(flask_app, host, port)
+            safe_print("🌐 خادم HTTP: waitress", threads=HTTP_THREADS, keepalive=HTTP_KEEPALIVE)
+            return server
+        except ImportError:
+            if HTTP_SERVER == "waitress":
+                raise
+        safe_print("⚠️ waitress غير مثبت - استخدام werkzeug", level=logging.WARNING)
+    # werkzeug يغلق الاتصال بعد كل طلب (بلا keep-alive) - للتطوير أو عند غياب waitress فقط
+    server = make_server(host, port, flask_app, threaded=True)
+    safe_print("🌐 خادم HTTP: werkzeug (خيط لكل طلب)")
+    return server
+
+def serve(flask_app, host='0.0.0.0', port=8080):
+    """تشغيل التطبيق حتى Ctrl+C (بدل app.run وخادم التطوير)"""
+    server = make_http_server(flask_app, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        safe_print("🛑 تم إيقاف خادم HTTP")
+    finally:
+        server.server_close()
+
 def start_http_server(host='0.0.0.0', port=8080):
     safe_print(f"🌐 بدء خادم HTTP على http://{host}:{port}")
-    # نستخدم use_reloader=False للمنع من تشغيل الخادم مرتين داخل Thread
-    app.run(host=host, port=port, debug=False, use_reloader=False)
+    upload_queue.start()
+    serve(app, host, port)
@@ -1,14 +1,135 @@
 # log.py
-# دوال بسيطة للطباعة الآمنة مع طابع زمني
+# تسجيل منظم غير متزامن: خيوط الاتصالات تضع السجل في طابور فقط، وخيط خلفي واحد (QueueListener) يكتبه
+# لكل وحدة مستوى خاص قابل للتغيير أثناء التشغيل (rcp.<module>, pynetdicom...)، والحقول الإضافية تُكتب key=value
 
-from datetime import datetime
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
 import threading
 
+from config import load_config
+
+ROOT_LOGGER = "rcp"
+
+_queue = queue.SimpleQueue()
+_listener = None
 _lock = threading.Lock()
+_loggers = {}
+_forked = False
+
+class KeyValueFormatter(logging.Formatter):
+    """يضيف الحقول المنظمة (job, assoc, bytes, ms...) إلى نهاية السطر بصيغة key=value"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+class _DirectWriter:
+    """بديل QueueListener في العمليات الابنة بعد fork: الكتابة مباشرة في خيط المستدعي"""
 
-def _now():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def __init__(self, handler):
+        self.handlers = (handler,)
 
-def safe_print(*args, **kwargs):
+    def stop(self):
+        self.handlers[0].flush()
+
+def _start_listener(stream=None):
+    global _listener
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(KeyValueFormatter(
+        "[%(asctime)s] %(levelname)s %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    ))
+    root = logging.getLogger()
+    if _forked:
+        _listener = _DirectWriter(handler)
+        root.handlers[:] = [handler]
+        return
+    _listener = logging.handlers.QueueListener(_queue, handler, respect_handler_level=True)
+    _listener.start()
+    root.handlers[:] = [logging.handlers.QueueHandler(_queue)]
+
+def configure_logging(levels=None, stream=None):
+    """تشغيل الكاتب الخلفي مرة واحدة وضبط المستويات من levels أو من LogLevels في الإعدادات"""
     with _lock:
-        print(f"[{_now()}]", *args, **kwargs)
+        if _listener is None:
+            _start_listener(stream)
+            logging.getLogger().setLevel(logging.WARNING)
+            atexit.register(stop_logging)
+    if levels is None:
+        levels = load_config().get("LogLevels", {})
+    for name, level in levels.items():
+        set_level(name, level)
+
+def stop_logging():
+    """تفريغ الطابور وإيقاف الكاتب الخلفي"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def _after_fork_in_child():
+    """خيط الكاتب لا ينتقل مع fork، وعمال التحويل الجماعي يخرجون بـ os._exit دون atexit
+
+    لذلك تكتب العملية الابنة سجلها مباشرة (StreamHandler يفرّغ بعد كل سطر) بدل كاتب خلفي
+    قد تضيع سجلاته المنتظرة عند الخروج.
+    """
+    global _lock, _queue, _listener, _forked
+    _lock = threading.Lock()
+    _queue = queue.SimpleQueue()
+    _forked = True
+    if _listener is not None:
+        _start_listener(_listener.handlers[0].stream)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def set_level(name, level):
+    """تغيير مستوى وحدة أثناء التشغيل - مثل set_level('pynetdicom', 'DEBUG')"""
+    logging.getLogger(name).setLevel(str(level).upper() if isinstance(level, str) else level)
+
+def get_levels():
+    """المستويات المضبوطة حاليًا لكل الوحدات المعروفة"""
+    names = [ROOT_LOGGER, "pynetdicom", "pydicom"] + sorted(
+        n for n in logging.root.manager.loggerDict if n.startswith(ROOT_LOGGER + ".")
+    )
+    return {n: logging.getLevelName(logging.getLogger(n).getEffectiveLevel()) for n in names}
+
+def get_logger(module):
+    """مسجل الوحدة rcp.<module>"""
+    logger = _loggers.get(module)
+    if logger is None:
+        if _listener is None:
+            configure_logging()
+        logger = _loggers.setdefault(module, logging.getLogger(f"{ROOT_LOGGER}.{module}"))
+    return logger
+
+def _caller_module(frame):
+    name = frame.f_globals.get("__name__", "app")
+    if name == "__main__":
+        name = os.path.splitext(os.path.basename(frame.f_globals.get("__file__", "main")))[0]
+    return name
+
+def safe_print(*args, level=logging.INFO, **fields):
+    """تسجيل رسالة باسم الوحدة المستدعية؛ الحقول الإضافية تُكتب key=value
+
+    لا تنسيق ولا قفل على خيط المستدعي إن كان المستوى معطلًا، والكتابة تتم في الخيط الخلفي.
+    """
+    logger = get_logger(_caller_module(sys._getframe(1)))
+    if not logger.isEnabledFor(level):
+        return
+    message = " ".join(str(a) for a in args)
+    logger.log(level, message, extra={"fields": fields} if fields else None)
+
+def debug_print(*args, **fields):
+    """مثل safe_print بمستوى DEBUG - للتفاصيل خطوة بخطوة"""
+    logger = get_logger(_caller_module(sys._getframe(1)))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(" ".join(str(a) for a in args), extra={"fields": fields} if fields else None)
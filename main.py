@@ -1,21 +1,41 @@
+import html
 import os
 from datetime import datetime
+from urllib.parse import urlencode
 from pynetdicom import AE, evt
 from pynetdicom.sop_class import (
-    BasicFilmSessionSOPClass,
-    BasicFilmBoxSOPClass,
-    BasicGrayscaleImageBoxSOPClass,
+    BasicFilmSession,
+    BasicFilmBox,
+    BasicGrayscaleImageBox,
 )
-from flask import Flask, send_from_directory
-from fpdf import FPDF
-import numpy as np
+from flask import Blueprint, Flask, jsonify, make_response, request, send_from_directory
 from PIL import Image
-import pydicom
+
+from config import load_config
+from pdf_stream import A4_POINTS, MM, StreamingPDFWriter
+from print_catalog import PrintCatalog
+from windowing import window_dataset
 
 # === إعدادات ===
 PRINT_JOBS = "print_jobs"
 os.makedirs(PRINT_JOBS, exist_ok=True)
 
+# فهرس الملفات: يُحدَّث عند كل حفظ بدل os.listdir لكل طلب
+catalog = PrintCatalog(PRINT_JOBS)
+PER_PAGE = 100
+MAX_PER_PAGE = 1000
+
+
+def use_catalog(new_catalog):
+    """عرض فهرس آخر في متصفح الطباعة (مخرجات FileBackend في service.py) بدل print_jobs"""
+    global catalog, PRINT_JOBS
+    catalog = new_catalog
+    PRINT_JOBS = os.path.abspath(new_catalog.directory)
+
+
+# نسخة PNG للمعاينة بجانب PDF (من نفس الصورة المحوَّلة، بدون فك ثانٍ)
+SAVE_PNG_PREVIEW = bool(load_config()["SavePngPreview"])
+
 AE_TITLE = "RCP-SCP"
 PORT = 104
 
@@ -28,20 +48,31 @@ def save_dicom_to_pdf(dataset, uid):
             return
 
         arr = dataset.pixel_array
-        if arr.ndim == 3:
+        frames = int(dataset.get("NumberOfFrames", 1) or 1)
+        samples = int(dataset.get("SamplesPerPixel", 1) or 1)
+        if frames > 1:
+            arr = arr[0]
+        elif arr.ndim == 3 and samples == 1:
             arr = arr[:, :, 0]
 
-        # حفظ الصورة المؤقتة
-        img = Image.fromarray(arr)
-        img_path = os.path.join(PRINT_JOBS, f"{uid}.png")
-        img.save(img_path)
+        # 8 بت بعد النافذة / Rescale / MONOCHROME1 (الصور 16 بت لا تُمرر خامًا)
+        raster = window_dataset(dataset, arr)
+        if raster.ndim == 3:
+            raster = raster[:, :, :3]
 
-        # تحويل إلى PDF
+        # PDF من الذاكرة مباشرة: نفس الموضع والعرض السابقين (10 مم، عرض 180 مم)
         pdf_path = os.path.join(PRINT_JOBS, f"{uid}.pdf")
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.image(img_path, x=10, y=10, w=180)
-        pdf.output(pdf_path)
+        with open(pdf_path, "wb") as fp:
+            writer = StreamingPDFWriter(fp, A4_POINTS)
+            writer.add_image_page(raster, x=10 * MM, top=10 * MM, width=180 * MM)
+            writer.close()
+        files = [pdf_path]
+
+        if SAVE_PNG_PREVIEW:
+            img_path = os.path.join(PRINT_JOBS, f"{uid}.png")
+            Image.fromarray(raster).save(img_path, compress_level=1)
+            files.append(img_path)
+        catalog.add(uid, files)
 
         print(f"[✅] تم حفظ الطباعة كـ PDF: {pdf_path}")
 
@@ -72,9 +103,9 @@ def handle_n_action(event):
 # === إعداد خادم DICOM ===
 def start_dicom_server():
     ae = AE(ae_title=AE_TITLE)
-    ae.add_supported_context(BasicFilmSessionSOPClass)
-    ae.add_supported_context(BasicFilmBoxSOPClass)
-    ae.add_supported_context(BasicGrayscaleImageBoxSOPClass)
+    ae.add_supported_context(BasicFilmSession)
+    ae.add_supported_context(BasicFilmBox)
+    ae.add_supported_context(BasicGrayscaleImageBox)
 
     handlers = [
         (evt.EVT_N_CREATE, handle_n_create),
@@ -87,30 +118,91 @@ def start_dicom_server():
 
 
 # === إعداد خادم HTTP لعرض الملفات ===
-app = Flask(__name__)
+# Blueprint حتى تستضيفه service.py على نفس تطبيق http_server
+prints = Blueprint("prints", __name__)
+
+def parse_date(value, end=False):
+    """YYYY-MM-DD أو ISO 8601 -> timestamp (نهاية اليوم لـ until بتاريخ فقط)"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment = moment.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return moment.timestamp()
+
 
-@app.route("/")
+@prints.route("/")
 def index():
-    files = os.listdir(PRINT_JOBS)
-    links = "".join(
-        f'<li><a href="/prints/{f}">{f}</a></li>' for f in sorted(files)
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        per_page = min(MAX_PER_PAGE, max(1, int(request.args.get("per_page", PER_PAGE))))
+        since = parse_date(request.args.get("since"))
+        until = parse_date(request.args.get("until"), end=True)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    as_json = request.args.get("format") == "json" or (
+        request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
     )
-    return f"""
+
+    # ETag من نسخة الفهرس + معاملات العرض: الاستطلاع المتكرر بدون تغيير يعيد 304 بلا جسم
+    etag = catalog.etag(page, per_page, since, until, "json" if as_json else "html")
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    entries, total = catalog.query(page, per_page, since, until)
+    pages = max(1, -(-total // per_page))
+    if as_json:
+        for entry in entries:
+            entry["created"] = datetime.fromtimestamp(entry["created"]).isoformat(timespec="seconds")
+        response = jsonify({"page": page, "per_page": per_page, "pages": pages, "total": total, "jobs": entries})
+    else:
+        query = html.escape(urlencode([(k, v) for k, v in request.args.items() if k != "page"]))
+        links = "".join(
+            f'<li>{datetime.fromtimestamp(e["created"]):%Y-%m-%d %H:%M:%S} — '
+            + " ".join(f'<a href="/prints/{html.escape(f)}">{html.escape(f)}</a>' for f in e["files"])
+            + "</li>"
+            for e in entries
+        )
+        nav = ""
+        if page > 1:
+            nav += f'<a href="/?page={page - 1}&amp;{query}">« السابق</a> '
+        nav += f"صفحة {page} من {pages} ({total} مهمة)"
+        if page < pages:
+            nav += f' <a href="/?page={page + 1}&amp;{query}">التالي »</a>'
+        response = make_response(f"""
     <h1>🖨️ ملفات الطباعة المستلمة</h1>
+    <p>{nav}</p>
     <ul>{links}</ul>
-    """
+    """)
+    response.set_etag(etag)
+    # المتصفح يعيد التحقق كل مرة (If-None-Match) بدل استخدام نسخة قديمة
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# ملفات المهام لا تتغير بعد كتابتها: ETag / If-Modified-Since / Range من send_from_directory،
+# والإرسال نفسه عبر wsgi.file_wrapper (sendfile في gunicorn) أو X-Sendfile (HttpXSendfile)
+PRINT_FILE_MAX_AGE = 3600
 
 
-@app.route("/prints/<path:filename>")
+@prints.route("/prints/<path:filename>")
 def get_file(filename):
-    return send_from_directory(PRINT_JOBS, filename)
+    return send_from_directory(PRINT_JOBS, filename, conditional=True, max_age=PRINT_FILE_MAX_AGE)
+
+
+app = Flask(__name__)
+app.register_blueprint(prints)
 
 
 # === التشغيل ===
 if __name__ == "__main__":
     import threading
 
+    from http_server import serve
+
     print("[▶️] تشغيل المكونات...")
     threading.Thread(target=start_dicom_server, daemon=True).start()
     print("[🌐] بدء خادم HTTP على http://0.0.0.0:8080")
-    app.run(host="0.0.0.0", port=8080)
+    serve(app, "0.0.0.0", 8080)
@@ -0,0 +1,192 @@
+# metrics.py
+# عدادات ومدرجات زمنية (Histograms) بصيغة Prometheus النصية بدون مكتبات إضافية
+# تُعرض عبر /metrics في http_server.py: زمن N-CREATE / N-SET / N-ACTION ومراحل الفك والرسم والإرسال للطابعة
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import tracing
+
+# حدود المدرج بالثواني (من 1 ms حتى دقيقة) - مراحل الطباعة تتراوح بين أجزاء الثانية وعدة ثوان
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_gauges = []
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """عداد تراكمي لكل مجموعة قيم labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in items]
+
+class Histogram:
+    """مدرج زمني: عدد القيم في كل حد (تراكمي عند العرض) + المجموع والعدد"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                lines.append((f'{self.name}_bucket', _labels(self.labelnames, key, [('le', _number(bound))]), cumulative))
+            lines.append((f'{self.name}_sum', _labels(self.labelnames, key), total))
+            lines.append((f'{self.name}_count', _labels(self.labelnames, key), count))
+        return lines
+
+def register_gauge(name, help, func, labelnames=()):
+    """قياس لحظي يُقرأ عند كل طلب /metrics
+
+    func تعيد رقمًا، أو قاموسًا {قيم labels (tuple أو نص): رقم} عند وجود labelnames.
+    """
+    with _lock:
+        _gauges[:] = [g for g in _gauges if g[0] != name]
+        _gauges.append((name, help, func, tuple(labelnames)))
+
+def _gauge_samples(name, func, labelnames):
+    value = func()
+    if not labelnames:
+        return [(name, '', value)]
+    samples = []
+    for key, v in sorted(value.items()):
+        key = key if isinstance(key, tuple) else (key,)
+        samples.append((name, _labels(labelnames, key), v))
+    return samples
+
+def render():
+    """كل المقاييس بصيغة Prometheus النصية (text/plain; version=0.0.4)"""
+    with _lock:
+        metrics = list(_registry)
+        gauges = list(_gauges)
+    out = []
+    for metric in metrics:
+        out.append(f'# HELP {metric.name} {metric.help}')
+        out.append(f'# TYPE {metric.name} {metric.kind}')
+        out.extend(f'{name}{labels} {_number(value)}' for name, labels, value in metric.samples())
+    for name, help, func, labelnames in gauges:
+        try:
+            samples = _gauge_samples(name, func, labelnames)
+        except Exception:
+            # مصدر القياس غير متاح حاليًا (مثلًا الكاش معطل) - لا نُفشل الصفحة كلها
+            continue
+        out.append(f'# HELP {name} {help}')
+        out.append(f'# TYPE {name} gauge')
+        out.extend(f'{n}{labels} {_number(value)}' for n, labels, value in samples)
+    return '\n'.join(out) + '\n'
+
+# =================================================================
+#                 مقاييس خادم الطباعة
+# =================================================================
+
+DIMSE_REQUESTS = Counter(
+    'rcp_dimse_requests_total', 'DIMSE requests handled by the print SCP', ('op', 'status'),
+)
+DIMSE_SECONDS = Histogram(
+    'rcp_dimse_seconds', 'Time spent in DIMSE handlers', ('op',),
+)
+STAGE_SECONDS = Histogram(
+    'rcp_stage_seconds', 'Print pipeline stage latency (decode, render, spool) - same boundaries as the trace spans', ('stage',),
+)
+JOBS_TOTAL = Counter(
+    'rcp_jobs_total', 'Finished queue jobs by final status', ('queue', 'status'),
+)
+JOB_SECONDS = Histogram(
+    'rcp_job_seconds', 'Time from job start to finish', ('queue',),
+)
+
+@contextmanager
+def stage(name, **fields):
+    """قياس زمن مرحلة: with stage('decode'): ...
+
+    نفس الحدود تُسجَّل في rcp_stage_seconds وكـ span على التتبع الحالي (fields تذهب للـ span فقط)،
+    فلا تُلف المرحلة بـ tracing.span بنفس الاسم.
+    """
+    with STAGE_SECONDS.time(stage=name), tracing.span(name, **fields):
+        yield
+
+def track_dimse(op):
+    """Decorator لمعالج DIMSE: الزمن والعدد حسب حالة الرد (رقم أو (رقم، Dataset))"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event):
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                result = handler(event)
+                code = result[0] if isinstance(result, tuple) else result
+                status = f'0x{int(code):04X}' if isinstance(code, int) else 'ok'
+                return result
+            finally:
+                DIMSE_SECONDS.observe(time.perf_counter() - started, op=op)
+                DIMSE_REQUESTS.inc(op=op, status=status)
+        return wrapper
+    return decorator
@@ -0,0 +1,214 @@
+# pdf_stream.py
+# كاتب PDF متدفق: كل صفحة تُكتب على القرص فور اكتمالها بدل بناء المستند كاملًا في الذاكرة (FPDF)
+# الذاكرة ثابتة تقريبًا (صفحة واحدة) مهما كان حجم الملف النصي، مع حد أقصى للصفحات وتقسيم اختياري لملفات
+# وصفحات الصور تُضمَّن مباشرة من مصفوفة 8 بت في الذاكرة (FlateDecode) بدون PNG وسيط
+
+import zlib
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+
+try:
+    from fpdf.fonts import fpdf_charwidths as _CORE_WIDTHS  # fpdf 1.7
+except ImportError:
+    try:
+        from fpdf.fonts import CORE_FONTS_CHARWIDTHS as _CORE_WIDTHS  # fpdf2
+    except ImportError:
+        _CORE_WIDTHS = {}
+
+# A4 بالنقاط (1/72 بوصة) وهوامش مطابقة لإعدادات FPDF السابقة (10 مم، وفاصل صفحة 15 مم)
+A4_POINTS = (595.28, 841.89)
+MM = 72 / 25.4
+
+def _helvetica_widths():
+    """عرض كل بايت (WinAnsi) بوحدات 1/1000 من حجم الخط"""
+    table = _CORE_WIDTHS.get('helvetica', {})
+    widths = []
+    for code in range(256):
+        char = bytes([code]).decode('cp1252', errors='replace')
+        widths.append(table.get(char, table.get(chr(code), 556)))
+    return widths
+
+HELVETICA_WIDTHS = _helvetica_widths()
+
+def _escape(data):
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+class StreamingPDFWriter:
+    """كتابة كائنات PDF بالتتابع مع تسجيل إزاحاتها؛ Pages و Catalog يُكتبان عند الإغلاق"""
+
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self, fileobj, page_size=A4_POINTS, compress=True):
+        self.file = fileobj
+        self.page_size = page_size
+        self.compress = compress
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.font_id = self.add_object(
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'
+        )
+
+    def _write(self, data):
+        self.file.write(data)
+
+    def _tell(self):
+        return self.file.tell()
+
+    def add_object(self, body, object_id=None):
+        if object_id is None:
+            object_id = self.next_id
+            self.next_id += 1
+        self.offsets[object_id] = self._tell()
+        self._write(b'%d 0 obj\n' % object_id + body + b'\nendobj\n')
+        return object_id
+
+    def add_stream(self, data, extra=b''):
+        """كائن stream مضغوط (FlateDecode) - extra يضيف مفاتيح للقاموس (مثل سمات الصورة)"""
+        if self.compress:
+            data = zlib.compress(data, 6)
+            extra += b' /Filter /FlateDecode'
+        elif isinstance(data, memoryview):
+            data = data.tobytes()
+        object_id = self.next_id
+        self.next_id += 1
+        self.offsets[object_id] = self._tell()
+        self._write(b'%d 0 obj\n<< /Length %d%s >>\nstream\n' % (object_id, len(data), extra))
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+        return object_id
+
+    def add_page(self, content, resources=None):
+        """إضافة صفحة من محتوى جاهز؛ تُكتب فورًا ولا يبقى منها في الذاكرة إلا رقم الكائن"""
+        content_id = self.add_stream(content)
+        width, height = self.page_size
+        resources = resources or b'<< /Font << /F1 %d 0 R >> >>' % self.font_id
+        page_id = self.add_object(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources %s /Contents %d 0 R >>'
+            % (self.PAGES, width, height, resources, content_id)
+        )
+        self.pages.append(page_id)
+        return page_id
+
+    def add_image(self, raster):
+        """Image XObject من مصفوفة uint8 (H×W رمادي أو H×W×3 RGB) بدون نسخة PNG أو ملف مؤقت"""
+        raster = np.ascontiguousarray(raster, dtype=np.uint8)
+        height, width = raster.shape[:2]
+        colorspace = b'/DeviceRGB' if raster.ndim == 3 else b'/DeviceGray'
+        return self.add_stream(
+            memoryview(raster).cast('B'),
+            b' /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8'
+            % (width, height, colorspace),
+        )
+
+    def add_image_page(self, raster, x, top, width):
+        """صفحة بصورة واحدة: x و top من الحافة اليسرى/العليا و width بالنقاط، والارتفاع حسب النسبة"""
+        image_id = self.add_image(raster)
+        rows, cols = raster.shape[:2]
+        height = width * rows / cols
+        y = self.page_size[1] - top - height
+        content = b'q %.2f 0 0 %.2f %.2f %.2f cm /Im1 Do Q' % (width, height, x, y)
+        return self.add_page(content, b'<< /XObject << /Im1 %d 0 R >> >>' % image_id)
+
+    def close(self):
+        """كتابة شجرة الصفحات و xref و trailer"""
+        kids = b' '.join(b'%d 0 R' % p for p in self.pages)
+        self.add_object(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)), self.PAGES)
+        self.add_object(b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES, self.CATALOG)
+        xref = self._tell()
+        size = self.next_id
+        self._write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for object_id in range(1, size):
+            self._write(b'%010d 00000 n \n' % self.offsets[object_id])
+        self._write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, self.CATALOG, xref))
+
+def wrap_line(data, max_width, font_size):
+    """تقسيم سطر (بايتات WinAnsi) إلى أسطر لا تتجاوز max_width نقطة - عند المسافات أولًا"""
+    limit = max_width * 1000.0 / font_size
+    cumulative = list(accumulate(map(HELVETICA_WIDTHS.__getitem__, data)))
+    if not cumulative or cumulative[-1] <= limit:
+        return [data]
+    lines = []
+    start = 0
+    base = 0
+    size = len(data)
+    while start < size:
+        # أطول مقطع يتسع في السطر (بحث ثنائي على العرض التراكمي)
+        end = bisect_right(cumulative, base + limit, start)
+        if end >= size:
+            lines.append(data[start:])
+            break
+        end = max(end, start + 1)
+        # كسر عند آخر مسافة، أو داخل الكلمة إن كانت أطول من السطر
+        space = data.rfind(b' ', start, end + 1)
+        if space > start:
+            lines.append(data[start:space])
+            start = space + 1
+        else:
+            lines.append(data[start:end])
+            start = end
+        base = cumulative[start - 1]
+    return lines
+
+def text_to_pdf_stream(lines, out_paths, font_size=12, line_height=6 * MM, max_pages=0, chunk_pages=0,
+                       page_size=A4_POINTS, margin=10 * MM, bottom_margin=15 * MM):
+    """كتابة أسطر نص (iterable) كصفحات PDF متتابعة
+
+    out_paths(index) يعيد مسار الجزء رقم index (1..) عند التقسيم كل chunk_pages صفحة،
+    و max_pages يوقف القراءة بعد هذا العدد من الصفحات (0 = بلا حد).
+    تعيد (قائمة الملفات، عدد الصفحات، هل قُطع النص).
+    """
+    width, height = page_size
+    text_width = width - 2 * margin
+    per_page = max(1, int((height - margin - bottom_margin) // line_height))
+    header = b'BT /F1 %d Tf %.2f TL %.2f %.2f Td\n' % (font_size, line_height, margin, height - margin - font_size)
+
+    outputs = []
+    writer = None
+    fileobj = None
+    page = []
+    pages = 0
+    truncated = False
+
+    def flush_page():
+        nonlocal writer, fileobj, pages
+        if writer is None:
+            path = out_paths(len(outputs) + 1)
+            fileobj = open(path, 'wb')
+            writer = StreamingPDFWriter(fileobj, page_size)
+            outputs.append(path)
+        writer.add_page(header + b''.join(b'(%s) Tj T*\n' % _escape(l) for l in page) + b'ET')
+        page.clear()
+        pages += 1
+        if chunk_pages and len(writer.pages) >= chunk_pages:
+            close_writer()
+
+    def close_writer():
+        nonlocal writer, fileobj
+        if writer is not None:
+            writer.close()
+            fileobj.close()
+            writer = fileobj = None
+
+    try:
+        for line in lines:
+            data = line.rstrip('\r\n').expandtabs(4).encode('cp1252', errors='replace')
+            for part in wrap_line(data, text_width, font_size):
+                if len(page) == per_page:
+                    if max_pages and pages >= max_pages - 1:
+                        flush_page()
+                        truncated = True
+                        break
+                    flush_page()
+                page.append(part)
+            if truncated:
+                break
+        if page or not pages:
+            flush_page()
+    finally:
+        close_writer()
+    return outputs, pages, truncated
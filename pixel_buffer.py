@@ -0,0 +1,67 @@
+# pixel_buffer.py
+# استقبال PixelData بدون نسخ: memoryview فوق البيانات المستلمة مباشرة
+# الصناديق الكبيرة تُنقل مرة واحدة إلى ملف مؤقت مُعيَّن في الذاكرة (memmap) حتى لا تبقى في RAM
+
+import io
+import tempfile
+
+import numpy as np
+
+class PixelBuffer:
+    """غلاف لبيانات البكسل: view يدعم buffer protocol بدون نسخ"""
+
+    def __init__(self, view, spill_file=None):
+        self.view = view
+        self.nbytes = view.nbytes
+        self.spill_file = spill_file
+
+    @property
+    def spilled(self):
+        return self.spill_file is not None
+
+    def __len__(self):
+        return self.nbytes
+
+    def as_array(self, dtype, count=-1):
+        """مصفوفة numpy فوق نفس الذاكرة - بدون نسخ"""
+        return np.frombuffer(self.view, dtype=dtype, count=count)
+
+    def close(self):
+        """تحرير المرجع والملف المؤقت (الذاكرة تتحرر مع آخر مصفوفة تشير إليها)"""
+        self.view = None
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+def _as_memoryview(value):
+    """memoryview فوق القيمة المستلمة بدون نسخ قدر الإمكان"""
+    if isinstance(value, io.BytesIO):
+        return value.getbuffer()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return memoryview(value).cast('B')
+    if hasattr(value, 'read'):
+        # كائن ملف آخر - لا مفر من القراءة
+        pos = value.tell()
+        value.seek(0)
+        data = value.read()
+        value.seek(pos)
+        return memoryview(data)
+    return memoryview(bytes(value))
+
+def ingest_pixel_data(value, spill_threshold=0, spill_dir=None):
+    """تحويل PixelData المستلم إلى PixelBuffer
+
+    إذا تجاوز الحجم spill_threshold (بالبايت، 0 = تعطيل) تُنسخ البيانات مرة واحدة
+    إلى ملف مؤقت ويعاد memmap فوقه، فيتحرر النسخ الأصلي بمجرد انتهاء المعالج.
+    """
+    if isinstance(value, PixelBuffer):
+        return value
+    view = _as_memoryview(value)
+    if not spill_threshold or view.nbytes < spill_threshold:
+        return PixelBuffer(view)
+
+    spill_file = tempfile.TemporaryFile(prefix="rcp_pixels_", dir=spill_dir)
+    mapped = np.memmap(spill_file, dtype=np.uint8, mode='w+', shape=(view.nbytes,))
+    mapped[:] = np.frombuffer(view, dtype=np.uint8)
+    view.release()
+    return PixelBuffer(mapped, spill_file)
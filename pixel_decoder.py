@@ -0,0 +1,184 @@
+# pixel_decoder.py
+# فك PixelData المضغوط (Encapsulated: RLE / JPEG / JPEG-LS / JPEG 2000) في صناديق صور الطباعة
+# الفك يتم في مجموعة عمليات منفصلة حتى لا يحجز GIL على خيوط الاتصالات أو عمال الطباعة
+
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import UID
+
+from log import safe_print
+
+PYDICOM_MAJOR = int(pydicom.__version__.split('.')[0])
+
+try:
+    from pydicom.pixels import get_decoder  # pydicom >= 3
+
+    def can_decode(transfer_syntax):
+        """هل تتوفر إضافة قادرة على فك صيغة النقل في هذه البيئة"""
+        transfer_syntax = UID(transfer_syntax)
+        if not transfer_syntax.is_compressed:
+            return True
+        try:
+            return get_decoder(transfer_syntax).is_available
+        except NotImplementedError:
+            return False
+except ImportError:
+    def can_decode(transfer_syntax):
+        """هل تتوفر إضافة قادرة على فك صيغة النقل في هذه البيئة"""
+        transfer_syntax = UID(transfer_syntax)
+        if not transfer_syntax.is_compressed:
+            return True
+        return any(
+            handler.is_available() and handler.supports_transfer_syntax(transfer_syntax)
+            for handler in pydicom.config.pixel_data_handlers
+        )
+
+def is_encapsulated(transfer_syntax):
+    return transfer_syntax is not None and UID(transfer_syntax).is_encapsulated
+
+def decode_pixel_data(data, transfer_syntax, rows, cols, bits_allocated=8, bits_stored=None,
+                      pixel_representation=0, photometric='MONOCHROME2', samples_per_pixel=1):
+    """فك إطار واحد مضغوط إلى مصفوفة numpy (RGB متداخل للصور الملونة)
+
+    تُستدعى في عمليات decode_worker.py؛ تبني Dataset صغيرًا
+    يحمل سمات Image Pixel فقط وتترك اختيار الإضافة لـ pydicom.
+    """
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = UID(transfer_syntax)
+    ds.Rows = rows
+    ds.Columns = cols
+    ds.BitsAllocated = bits_allocated
+    ds.BitsStored = bits_stored or bits_allocated
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = pixel_representation
+    ds.SamplesPerPixel = samples_per_pixel
+    ds.PhotometricInterpretation = photometric
+    if samples_per_pixel > 1:
+        ds.PlanarConfiguration = 0
+    ds.NumberOfFrames = 1
+    ds.PixelData = bytes(data)
+    ds['PixelData'].VR = 'OB'
+    ds['PixelData'].is_undefined_length = True
+
+    array = ds.pixel_array
+    # pydicom 3 يحول YBR إلى RGB تلقائيًا؛ الإصدارات الأقدم تحتاج تحويلًا صريحًا
+    if PYDICOM_MAJOR < 3 and samples_per_pixel == 3 and photometric.startswith('YBR'):
+        from pydicom.pixel_data_handlers.util import convert_color_space
+        array = convert_color_space(array, photometric, 'RGB')
+    return np.ascontiguousarray(array)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "decode_worker.py")
+
+class DecodePool:
+    """عمليات الفك - تبدأ عند أول صندوق مضغوط (workers=0 = فك في نفس الخيط)
+
+    كل عملية تُشغَّل من decode_worker.py (وليس multiprocessing spawn الذي يعيد استيراد __main__
+    بإعداداته وطوابيره)، ويغذيها خيط واحد في هذه العملية: يأخذ الطلب التالي، يرسله، وينتظر رده.
+    الطلبات المنتظرة Futures عادية - إلغاؤها (صندوق أُخلي أو حُذف) يمنع إرسالها.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = int(workers or 0)
+        self._requests = queue.SimpleQueue()
+        self._feeders = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._feeders:
+                return
+            for i in range(self.workers):
+                feeder = threading.Thread(target=self._feed, name=f"decode-{i}", daemon=True)
+                feeder.start()
+                self._feeders.append(feeder)
+        safe_print(f"🧩 مجموعة فك الضغط: {self.workers} عملية")
+
+    def submit(self, data, transfer_syntax, *args, **kwargs):
+        """بدء فك الإطار وإعادة Future - البيانات تُنسخ كـ bytes لأن memoryview لا يُرسل لعملية"""
+        if not self.workers:
+            return _ImmediateResult(decode_pixel_data, bytes(data), transfer_syntax, *args, **kwargs)
+        self._start()
+        future = Future()
+        self._requests.put((future, (bytes(data), transfer_syntax) + args, kwargs))
+        return future
+
+    def _feed(self):
+        worker = None
+        try:
+            while True:
+                request = self._requests.get()
+                if request is None:
+                    return
+                future, args, kwargs = request
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if worker is None:
+                        worker = subprocess.Popen([sys.executable, WORKER_SCRIPT],
+                                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                    pickle.dump((args, kwargs), worker.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                    worker.stdin.flush()
+                    ok, value = pickle.load(worker.stdout)
+                except Exception as e:
+                    # العملية ماتت (أو تعذر تشغيلها) - تُستبدل في الطلب التالي
+                    _stop_worker(worker, kill=True)
+                    worker = None
+                    future.set_exception(RuntimeError(f"عملية الفك توقفت: {e!r}"))
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+        finally:
+            _stop_worker(worker)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            feeders, self._feeders = self._feeders, []
+        if not wait:
+            # إلغاء ما لم يبدأ بعد
+            while True:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is not None:
+                    request[0].cancel()
+        for _ in feeders:
+            self._requests.put(None)
+        if wait:
+            for feeder in feeders:
+                feeder.join()
+
+def _stop_worker(worker, kill=False):
+    if worker is None:
+        return
+    if kill:
+        worker.kill()
+    else:
+        worker.stdin.close()
+    worker.wait()
+    worker.stdout.close()
+
+class _ImmediateResult:
+    """بديل Future يفك عند طلب النتيجة (في خيط عامل الطباعة)"""
+
+    def __init__(self, func, *args, **kwargs):
+        self._call = (func, args, kwargs)
+
+    def result(self, timeout=None):
+        func, args, kwargs = self._call
+        return func(*args, **kwargs)
+
+    def cancel(self):
+        return True
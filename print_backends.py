@@ -0,0 +1,345 @@
+# print_backends.py
+# واجهات الطباعة القابلة للاستبدال: Windows GDI، CUPS (دفعات lp)، ملفات PNG/PDF، ومصرف فارغ للقياس
+# يتم اختيار الواجهة من الإعدادات (PrintBackend) ويعاد استخدام مقبض الطابعة بين المهام
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from config import load_config
+from log import safe_print
+from print_catalog import PrintCatalog
+import tracing
+
+class PrintBackend:
+    """الواجهة الأساسية - كل واجهة تطبق print_image و print_file"""
+
+    name = "base"
+
+    def __init__(self, printer_name=None):
+        self.printer_name = printer_name
+
+    def open(self):
+        """فتح الموارد طويلة العمر (مقبض الطابعة...)"""
+
+    def close(self):
+        """تحرير الموارد وتفريغ أي دفعة معلقة"""
+
+    def print_image(self, image, job_name="DICOM Print", box=None):
+        """طباعة صورة PIL؛ box = (x, y, x2, y2) بإحداثيات الصفحة إن وجد"""
+        raise NotImplementedError
+
+    def print_file(self, path, job_name=None, temporary=False):
+        """طباعة ملف جاهز (PDF/JPG...)
+
+        temporary=True: الملف ينتقل للواجهة وتحذفه حين تنتهي منه (بعد دفعة lp مثلًا)،
+        فيستطيع المستدعي حذف مجلده فور العودة.
+        """
+        raise NotImplementedError
+
+class Win32Backend(PrintBackend):
+    """طباعة GDI على Windows مع إبقاء DC الطابعة مفتوحًا بين المهام"""
+
+    name = "win32"
+
+    def __init__(self, printer_name=None):
+        super().__init__(printer_name)
+        self._hdc = None
+        self._lock = threading.Lock()
+        self._temporary = []
+
+    def open(self):
+        import win32print
+        import win32ui
+        if not self.printer_name:
+            self.printer_name = win32print.GetDefaultPrinter()
+        if self._hdc is None:
+            hdc = win32ui.CreateDC()
+            hdc.CreatePrinterDC(self.printer_name)
+            self._hdc = hdc
+            safe_print(f"🖨️ تم فتح الطابعة: {self.printer_name}")
+
+    def close(self):
+        with self._lock:
+            if self._hdc is not None:
+                try:
+                    self._hdc.DeleteDC()
+                except Exception:
+                    pass
+                self._hdc = None
+            for directory in self._temporary:
+                shutil.rmtree(directory, ignore_errors=True)
+            self._temporary.clear()
+
+    def print_image(self, image, job_name="DICOM Print", box=None):
+        from PIL import ImageWin
+        with self._lock:
+            self.open()
+            hdc = self._hdc
+            if box is None:
+                box = (0, 0, image.width, image.height)
+            try:
+                with tracing.span('encode'):
+                    dib = ImageWin.Dib(image)
+                with tracing.span('submit', backend=self.name):
+                    hdc.StartDoc(job_name)
+                    hdc.StartPage()
+                    dib.draw(hdc.GetHandleOutput(), box)
+                    hdc.EndPage()
+                    hdc.EndDoc()
+                return True
+            except Exception as e:
+                safe_print(f"❌ فشل الطباعة عبر GDI: {e}")
+                # قد يكون DC تالفًا - نعيد فتحه في المهمة التالية
+                try:
+                    hdc.AbortDoc()
+                except Exception:
+                    pass
+                self._hdc = None
+                return False
+
+    def print_file(self, path, job_name=None, temporary=False):
+        if temporary:
+            # ShellExecute يطبع لاحقًا من تطبيق آخر - ننقل الملف لمجلد خاص ونحذفه عند close
+            directory = tempfile.mkdtemp(prefix="rcp_print_")
+            path = shutil.move(path, directory)
+            self._temporary.append(directory)
+        safe_print(f"🖨️ طباعة على Windows: {path}")
+        os.startfile(path, 'print')
+        return True
+
+class CupsBackend(PrintBackend):
+    """طباعة عبر lp/lpr مع تجميع الملفات في دفعة واحدة بدل عملية لكل ملف
+
+    بدون PrinterName يُرسل الأمر بلا -d / -P فتختار CUPS الطابعة الافتراضية للنظام.
+    """
+
+    name = "cups"
+
+    def __init__(self, printer_name=None, batch_size=1, batch_timeout=2.0, spool_dir=None):
+        super().__init__(printer_name)
+        self.batch_size = max(1, int(batch_size))
+        self.batch_timeout = float(batch_timeout)
+        self.spool_dir = spool_dir
+        self.command = 'lpr' if platform.system().lower() == 'darwin' else 'lp'
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._closed = False
+        self.default_name = None
+
+    def system_default(self):
+        """اسم الطابعة الافتراضية من lpstat -d (للعرض فقط) أو None"""
+        try:
+            out = subprocess.run(['lpstat', '-d'], capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        _, sep, name = out.partition(':')
+        return (name.strip() or None) if sep else None
+
+    def open(self):
+        with self._cond:
+            if not self.printer_name and self.default_name is None:
+                self.default_name = self.system_default() or ""
+                safe_print(f"🖨️ CUPS بدون PrinterName - الطابعة الافتراضية للنظام: {self.default_name or 'غير معروفة'}")
+            if self.spool_dir is None:
+                self.spool_dir = tempfile.mkdtemp(prefix="rcp_spool_")
+            os.makedirs(self.spool_dir, exist_ok=True)
+            if self.batch_size > 1 and self._flusher is None:
+                self._closed = False
+                self._flusher = threading.Thread(target=self._flush_loop, name="cups-flusher", daemon=True)
+                self._flusher.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def print_image(self, image, job_name="DICOM Print", box=None):
+        self.open()
+        path = os.path.join(self.spool_dir, f"{datetime.now():%Y%m%d_%H%M%S_%f}.png")
+        with tracing.span('encode'):
+            image.save(path, format="PNG", compress_level=1)
+        with tracing.span('submit', backend=self.name):
+            return self._enqueue(path, temporary=True)
+
+    def print_file(self, path, job_name=None, temporary=False):
+        self.open()
+        if temporary:
+            # الدفعة قد تُرسل بعد عودة المستدعي - الملف ينتقل لمجلد الانتظار ويُحذف بعد lp
+            path = shutil.move(path, os.path.join(self.spool_dir, f"{time.monotonic_ns()}_{os.path.basename(path)}"))
+        return self._enqueue(path, temporary=temporary)
+
+    def _enqueue(self, path, temporary):
+        with self._cond:
+            self._pending.append((path, temporary, time.monotonic()))
+            ready = len(self._pending) >= self.batch_size
+            self._cond.notify_all()
+        if ready:
+            return self.flush()
+        return True
+
+    def flush(self):
+        """إرسال كل الملفات المعلقة في أمر lp واحد"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return True
+        cmd = [self.command]
+        if self.printer_name:
+            cmd += ['-d' if self.command == 'lp' else '-P', self.printer_name]
+        cmd += [path for path, _, _ in batch]
+        try:
+            safe_print(f"🖨️ إرسال دفعة من {len(batch)} ملف عبر {self.command}")
+            subprocess.run(cmd, check=True)
+            return True
+        except Exception as e:
+            safe_print(f"❌ فشل أثناء الطباعة: {e}")
+            return False
+        finally:
+            for path, temporary, _ in batch:
+                if temporary:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                oldest = self._pending[0][2]
+                remaining = self.batch_timeout - (time.monotonic() - oldest)
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()
+
+class FileBackend(PrintBackend):
+    """حفظ الصفحات كملفات PNG أو PDF في مجلد - للخوادم بدون طابعة
+
+    كل ملف يُسجَّل في فهرس المجلد (PrintCatalog) فيعرضه متصفح الطباعة في service.py.
+    """
+
+    name = "file"
+
+    def __init__(self, printer_name=None, output_dir="print_output", fmt="png", dpi=300):
+        super().__init__(printer_name or "FILE")
+        self.output_dir = output_dir
+        self.fmt = fmt.lower()
+        self.dpi = dpi
+        self.catalog = PrintCatalog(output_dir)
+
+    def _record(self, path):
+        self.catalog.add(os.path.splitext(os.path.basename(path))[0], [path])
+
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _target(self, job_name, ext):
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in job_name)
+        return os.path.join(self.output_dir, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_name}.{ext}")
+
+    def print_image(self, image, job_name="DICOM Print", box=None):
+        self.open()
+        path = self._target(job_name, self.fmt)
+        # الترميز والكتابة خطوة واحدة هنا: الملف هو المخرج النهائي
+        with tracing.span('encode', backend=self.name):
+            if self.fmt == "pdf":
+                image.save(path, format="PDF", resolution=self.dpi)
+            else:
+                image.save(path, format="PNG", compress_level=1, dpi=(self.dpi, self.dpi))
+        self._record(path)
+        safe_print(f"💾 تم حفظ الصفحة: {path}")
+        return True
+
+    def print_file(self, path, job_name=None, temporary=False):
+        self.open()
+        dest = os.path.join(self.output_dir, os.path.basename(path))
+        if temporary:
+            shutil.move(path, dest)
+        else:
+            shutil.copyfile(path, dest)
+        self._record(dest)
+        safe_print(f"💾 تم نسخ الملف: {dest}")
+        return True
+
+class NullBackend(PrintBackend):
+    """مصرف فارغ - يحسب المهام فقط، مفيد لقياس الأداء بدون طابعة"""
+
+    name = "null"
+
+    def __init__(self, printer_name=None):
+        super().__init__(printer_name or "NULL")
+        self.jobs = 0
+        self._lock = threading.Lock()
+
+    def print_image(self, image, job_name="DICOM Print", box=None):
+        with self._lock:
+            self.jobs += 1
+        return True
+
+    def print_file(self, path, job_name=None, temporary=False):
+        with self._lock:
+            self.jobs += 1
+        if temporary:
+            os.remove(path)
+        return True
+
+def create_backend(config=None):
+    """إنشاء الواجهة المحددة في PrintBackend (auto/win32/cups/file/null)"""
+    config = config or load_config()
+    name = str(config.get("PrintBackend", "auto")).lower()
+    printer_name = config.get("PrinterName") or None
+    if name == "auto":
+        name = "win32" if platform.system().lower() == "windows" else "cups"
+    if name == "win32":
+        return Win32Backend(printer_name)
+    if name == "cups":
+        return CupsBackend(
+            printer_name,
+            batch_size=config.get("CupsBatchSize", 1),
+            batch_timeout=config.get("CupsBatchTimeout", 2.0),
+            spool_dir=config.get("PrintSpoolDir"),
+        )
+    if name == "file":
+        return FileBackend(
+            printer_name,
+            output_dir=config.get("PrintOutputDir", "print_output"),
+            fmt=config.get("PrintOutputFormat", "png"),
+        )
+    if name == "null":
+        return NullBackend(printer_name)
+    raise ValueError(f"واجهة طباعة غير معروفة: {name}")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """الواجهة المشتركة للعملية - تنشأ مرة واحدة من الإعدادات"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+def set_backend(backend):
+    """استبدال الواجهة المشتركة (مثلًا NullBackend للقياس)"""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    if old is not None and old is not backend:
+        old.close()
+    return backend
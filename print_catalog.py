@@ -0,0 +1,140 @@
+# print_catalog.py
+# فهرس ملفات الطباعة (print_jobs) يُحدَّث عند كل حفظ بدل os.listdir لكل طلب
+# الفهرس سطر JSON لكل مهمة في ملف .catalog.jsonl داخل المجلد، ويُحمَّل مرة واحدة في الذاكرة
+# مرتبًا بالوقت: الصفحات والتصفية بالتاريخ بحث ثنائي، و ETag يتغير فقط عند إضافة مهمة
+
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+
+from log import safe_print
+
+CATALOG_NAME = ".catalog.jsonl"
+
+class PrintCatalog:
+    """مهام الطباعة في مجلد واحد: uid -> الملفات (PDF / PNG) ووقت الإنشاء والحجم"""
+
+    def __init__(self, directory, catalog_name=CATALOG_NAME):
+        self.directory = str(directory)
+        self.path = os.path.join(self.directory, catalog_name)
+        self._lock = threading.Lock()
+        self._entries = []   # مرتبة حسب created
+        self._times = []     # created لكل مدخل (للبحث الثنائي)
+        self._by_uid = {}
+        self._loaded = False
+        # يتغير عند كل إضافة؛ الرمز العشوائي يميز إعادة التشغيل أو إعادة البناء
+        self.generation = 0
+        self._token = uuid.uuid4().hex[:8]
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    try:
+                        self._insert(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue  # سطر ناقص من كتابة مقطوعة
+        else:
+            self._rebuild()
+        self._loaded = True
+
+    def _insert(self, entry):
+        """إضافة أو دمج مدخل في الذاكرة مع الحفاظ على الترتيب"""
+        existing = self._by_uid.get(entry['uid'])
+        if existing is not None:
+            existing['files'] = sorted(set(existing['files']) | set(entry['files']))
+            existing['bytes'] = entry.get('bytes', existing['bytes'])
+            return existing
+        index = bisect_right(self._times, entry['created'])
+        self._entries.insert(index, entry)
+        self._times.insert(index, entry['created'])
+        self._by_uid[entry['uid']] = entry
+        return entry
+
+    def _rebuild(self):
+        """بناء الفهرس من محتوى المجلد (أول تشغيل أو حذف ملف الفهرس) - مسح واحد فقط"""
+        started = time.perf_counter()
+        groups = {}
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.startswith('.') or not item.is_file():
+                    continue
+                uid = os.path.splitext(item.name)[0]
+                stat = item.stat()
+                entry = groups.setdefault(uid, {'uid': uid, 'created': stat.st_mtime, 'files': [], 'bytes': 0})
+                entry['created'] = min(entry['created'], stat.st_mtime)
+                entry['files'].append(item.name)
+                entry['bytes'] += stat.st_size
+        entries = sorted(groups.values(), key=lambda e: e['created'])
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            for entry in entries:
+                entry['files'].sort()
+                fp.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+        for entry in entries:
+            self._insert(entry)
+        safe_print(f"🗂️ بناء فهرس الطباعة: {len(entries)} مهمة", directory=self.directory,
+                   ms=round((time.perf_counter() - started) * 1000, 1))
+
+    def rebuild(self):
+        with self._lock:
+            self._entries, self._times, self._by_uid = [], [], {}
+            self._loaded = True
+            os.makedirs(self.directory, exist_ok=True)
+            self._rebuild()
+            self.generation += 1
+            self._token = uuid.uuid4().hex[:8]
+
+    def add(self, uid, files, created=None):
+        """تسجيل ملفات مهمة بعد كتابتها (أسماء داخل المجلد)"""
+        files = [os.path.basename(f) for f in files]
+        size = 0
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        entry = {'uid': str(uid), 'created': created or time.time(), 'files': sorted(files), 'bytes': size}
+        with self._lock:
+            self._load()
+            entry = self._insert(entry)
+            with open(self.path, 'a', encoding='utf-8') as fp:
+                fp.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.generation += 1
+        return entry
+
+    def etag(self, *parts):
+        """ETag لعرض معين من الفهرس (الصفحة والتصفية ضمن parts)"""
+        with self._lock:
+            self._load()
+            key = f"{self._token}-{self.generation}-{len(self._entries)}"
+        return '-'.join([key, *map(str, parts)])
+
+    def query(self, page=1, per_page=100, since=None, until=None):
+        """صفحة من المهام الأحدث أولًا، مع تصفية اختيارية بالوقت (timestamps)
+
+        تعيد (المدخلات، العدد الكلي بعد التصفية).
+        """
+        page = max(1, int(page))
+        per_page = max(1, int(per_page))
+        with self._lock:
+            self._load()
+            lo = bisect_left(self._times, since) if since is not None else 0
+            hi = bisect_right(self._times, until) if until is not None else len(self._times)
+            total = max(0, hi - lo)
+            end = hi - (page - 1) * per_page
+            start = max(lo, end - per_page)
+            entries = [dict(e) for e in reversed(self._entries[start:end])] if end > lo else []
+        return entries, total
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
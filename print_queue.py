@@ -0,0 +1,220 @@
+# print_queue.py
+# طابور مهام طباعة محدود الحجم مع مجموعة عمال في الخلفية
+# المعالجات (N-SET / N-ACTION) تضيف المهمة وتعود فورًا، والعمال ينفذون الفك والرسم والطباعة
+
+import itertools
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from log import safe_print
+from metrics import JOB_SECONDS, JOBS_TOTAL, register_gauge
+
+# حالات المهمة: queued -> running (أو rendering -> spooling عبر set_stage) -> done / failed
+JOB_STATUSES = ("queued", "running", "rendering", "spooling", "done", "failed")
+
+# عدد المهام المنتهية التي نحتفظ بحالتها للاستعلام
+HISTORY_LIMIT = 1000
+
+_ids = itertools.count(1)
+
+# كل الطوابير المنشأة في العملية - لواجهة /jobs و /metrics
+_queues = weakref.WeakValueDictionary()
+# المهمة التي ينفذها خيط العامل الحالي (لـ set_stage)
+_current = threading.local()
+
+def all_queues():
+    return list(_queues.values())
+
+def find_job(job_id):
+    """حالة مهمة من أي طابور - None إن لم توجد"""
+    for q in all_queues():
+        job = q.status(job_id)
+        if job is not None:
+            return job
+    return None
+
+def set_stage(status):
+    """تحديث حالة المهمة الجارية من داخلها (rendering / spooling) - لا شيء خارج العمال"""
+    job = getattr(_current, "job", None)
+    if job is not None:
+        queue_, job_id = job
+        queue_.set_status(job_id, status)
+
+class PrintJobQueue:
+    """طابور مهام محدود: submit يعيد None عند امتلاء الطابور (ضغط عكسي)"""
+
+    def __init__(self, name="print", maxsize=32, workers=2):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # submit / submit_many: فحص السعة والإضافة خطوة واحدة
+        self._submit_lock = threading.Lock()
+        self._started = False
+        _queues[name] = self
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i + 1}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        safe_print(f"🧵 طابور {self.name}: {self.workers} عامل، سعة {self.maxsize}")
+
+    def _new_job(self, job_id):
+        job_id = job_id or f"{self.name}-{next(_ids)}"
+        job = {
+            "id": job_id,
+            "queue": self.name,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        return job_id
+
+    def _forget(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs.pop(job_id, None)
+
+    def submit(self, func, *args, job_id=None, **kwargs):
+        """إضافة مهمة - تعيد معرف المهمة أو None إذا كان الطابور ممتلئًا"""
+        if not self._started:
+            self.start()
+        job_id = self._new_job(job_id)
+        try:
+            with self._submit_lock:
+                self._queue.put_nowait((job_id, func, args, kwargs))
+        except queue.Full:
+            self._forget([job_id])
+            safe_print(f"⛔ طابور {self.name} ممتلئ ({self.maxsize}) - رفض المهمة")
+            return None
+        return job_id
+
+    def submit_many(self, func, args_list):
+        """إضافة عدة مهام معًا أو لا شيء - قائمة المعرفات أو None إذا لم يتسع الطابور لها كلها"""
+        if not self._started:
+            self.start()
+        args_list = [tuple(args) for args in args_list]
+        with self._submit_lock:
+            # كل إضافة تمر بهذا القفل والعمال يسحبون فقط، فالمساحة المتاحة لا تقل بين الفحص والإضافة
+            free = self.maxsize - self._queue.qsize() if self.maxsize > 0 else len(args_list)
+            if free < len(args_list):
+                safe_print(f"⛔ طابور {self.name} لا يتسع لـ {len(args_list)} مهمة ({free} متاح) - رفضها كلها")
+                return None
+            job_ids = [self._new_job(None) for _ in args_list]
+            for job_id, args in zip(job_ids, args_list):
+                self._queue.put_nowait((job_id, func, args, {}))
+        return job_ids
+
+    def set_status(self, job_id, status, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["status"] = status
+                job.update(fields)
+
+    def annotate(self, job_id, **fields):
+        """إضافة معلومات للمهمة (uid، النوع...) بدون تغيير حالتها"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def counts(self):
+        """عدد المهام في كل حالة"""
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, drain=True, timeout=None):
+        """إيقاف العمال؛ مع drain=True تُنفذ المهام المنتظرة أولًا"""
+        if not self._started:
+            return
+        if not drain:
+            try:
+                while True:
+                    job_id, _, _, _ = self._queue.get_nowait()
+                    self.set_status(job_id, "failed", error="cancelled", finished_at=time.time())
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in self._threads:
+            self._queue.put((None, None, None, None))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        self._threads = []
+        self._started = False
+
+    def _worker(self):
+        while True:
+            job_id, func, args, kwargs = self._queue.get()
+            try:
+                if job_id is None:
+                    return
+                started = time.perf_counter()
+                self.set_status(job_id, "running", started_at=time.time())
+                _current.job = (self, job_id)
+                try:
+                    ok = func(*args, **kwargs)
+                    status = "failed" if ok is False else "done"
+                    self.set_status(job_id, status, finished_at=time.time())
+                except Exception as e:
+                    status = "failed"
+                    safe_print(f"❌ فشل المهمة: {e}", level=logging.ERROR, job=job_id)
+                    self.set_status(job_id, "failed", error=str(e), finished_at=time.time())
+                finally:
+                    _current.job = None
+                elapsed = time.perf_counter() - started
+                JOBS_TOTAL.inc(queue=self.name, status=status)
+                JOB_SECONDS.observe(elapsed, queue=self.name)
+                safe_print("🏁 انتهت المهمة", job=job_id, status=status, ms=round(elapsed * 1000, 1))
+                self._trim_history()
+            finally:
+                self._queue.task_done()
+
+    def _trim_history(self):
+        with self._lock:
+            finished = [k for k, j in self._jobs.items() if j["finished_at"] is not None]
+            for k in finished[:max(0, len(finished) - HISTORY_LIMIT)]:
+                del self._jobs[k]
+
+register_gauge(
+    'rcp_queue_jobs', 'Jobs tracked per queue and status',
+    lambda: {(q.name, st): n for q in all_queues() for st, n in q.counts().items()},
+    ('queue', 'status'),
+)
+register_gauge(
+    'rcp_queue_pending', 'Jobs waiting for a worker',
+    lambda: {q.name: q.pending() for q in all_queues()},
+    ('queue',),
+)
@@ -1,30 +1,16 @@
 # printer.py
-# أوامر بسيطة للطباعة حسب النظام
+# أوامر بسيطة للطباعة عبر الواجهة المحددة في الإعدادات (win32 / cups / file / null)
 
-import platform
-import subprocess
-import os
 from log import safe_print
+from print_backends import get_backend
 
-def print_file(path):
+def print_file(path, temporary=False):
+    """طباعة ملف عبر الواجهة الحالية؛ temporary=True ينقل الملف للواجهة فتحذفه حين تنتهي منه"""
     if path is None:
         safe_print("⚠️ ملف للطباعة غير موجود (None)")
         return False
-    system = platform.system().lower()
     try:
-        if system == 'windows':
-            safe_print(f"🖨️ طباعة على Windows: {path}")
-            os.startfile(path, 'print')
-        elif system == 'linux':
-            safe_print(f"🖨️ طباعة على Linux عبر lp: {path}")
-            subprocess.run(['lp', path], check=True)
-        elif system == 'darwin':
-            safe_print(f"🖨️ طباعة على macOS عبر lpr: {path}")
-            subprocess.run(['lpr', path], check=True)
-        else:
-            safe_print("❌ نظام غير مدعوم للطباعة التلقائية")
-            return False
-        return True
+        return get_backend().print_file(path, temporary=temporary)
     except Exception as e:
         safe_print(f"❌ فشل أثناء الطباعة: {e}")
         return False
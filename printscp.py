@@ -4,9 +4,9 @@ import logging
 
 from pydicom.dataset import Dataset
 from pydicom.uid import UID
-from pydicom.pixel_data_handlers.util import apply_voi_lut
 from PIL import Image
-import numpy as np
+
+from windowing import window_dataset
 
 from pynetdicom import AE, evt
 from pynetdicom.sop_class import (
@@ -64,10 +64,7 @@ def on_data_received(event):
 # ====================================
 def convert_to_png(ds, uid):
     try:
-        arr = apply_voi_lut(ds.pixel_array, ds)
-        if ds.PhotometricInterpretation == "MONOCHROME1":
-            arr = np.max(arr) - arr
-        arr = arr.astype(np.uint8)
+        arr = window_dataset(ds, ds.pixel_array)
         img = Image.fromarray(arr)
         path = os.path.join(OUTPUT_DIR, f"{uid}.png")
         img.save(path)
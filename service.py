@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# service.py
+# نقطة تشغيل واحدة للعقدة: خادم DICOM Print SCP وواجهة HTTP (الرفع، المهام، /metrics، متصفح الطباعة) في عملية واحدة
+# الطرفان يتشاركان طابور الطباعة نفسه، مجمع فك PixelData، ومخزن الجلسات من dicom_print_scp
+# SIGTERM / SIGINT: إيقاف استقبال الاتصالات والطلبات، انتظار الاتصالات الجارية، تنفيذ المهام المنتظرة ثم الخروج
+#
+# أمثلة:
+#     python service.py
+#     python service.py --port 11112 --http-port 8080
+#     python service.py --no-http
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+import time
+
+import dicom_print_scp as scp
+import http_server
+import main as print_browser
+from log import safe_print
+from print_backends import FileBackend
+
+config = scp.config
+
+class PrintService:
+    """DICOM + HTTP فوق بنية عمال واحدة، مع إغلاق مرتب"""
+
+    def __init__(self, dicom_port=None, http_host=None, http_port=None, enable_http=True):
+        self.dicom_port = int(dicom_port or config["Port"])
+        self.http_host = http_host or config["HttpHost"]
+        self.http_port = int(http_port or config["HttpPort"])
+        self.enable_http = enable_http
+        self.stopping = threading.Event()
+        self._dicom = None
+        self._http = None
+        self._http_thread = None
+
+    def start(self):
+        # الرفع عبر HTTP يمر بطابور الطباعة نفسه: حد واحد للذاكرة والعمال وضغط عكسي واحد
+        http_server.use_queue(scp.print_queue)
+        scp.start_workers()
+
+        ae = scp.create_ae()
+        self._dicom = ae.start_server(('', self.dicom_port), evt_handlers=scp.event_handlers(), block=False)
+        safe_print("🟢 DICOM Print SCP جاهز", ae=config["AETitle"], port=self.dicom_port)
+
+        if self.enable_http:
+            app = http_server.app
+            self.mount_print_browser(app)
+            self._http = http_server.make_http_server(app, self.http_host, self.http_port)
+            self._http_thread = threading.Thread(target=self._http.serve_forever, name="http", daemon=True)
+            self._http_thread.start()
+            safe_print(f"🌐 واجهة HTTP جاهزة على http://{self.http_host}:{self.http_port}")
+
+    def mount_print_browser(self, app):
+        """متصفح الطباعة (/ و /prints) على مخرجات FileBackend - الطابعات الفعلية لا تترك ملفات لعرضها"""
+        backend = scp.print_manager.get_backend()
+        if not isinstance(backend, FileBackend):
+            safe_print("ℹ️ متصفح الطباعة غير مفعّل: يعرض مخرجات PrintBackend=file فقط", backend=backend.name)
+            return
+        print_browser.use_catalog(backend.catalog)
+        if "prints" not in app.blueprints:
+            app.register_blueprint(print_browser.prints)
+        safe_print("🗂️ متصفح الطباعة", directory=print_browser.PRINT_JOBS)
+
+    def wait(self):
+        """انتظار إشارة الإيقاف (بمهلة قصيرة حتى تصل الإشارات للخيط الرئيسي)"""
+        while not self.stopping.wait(0.5):
+            pass
+
+    def request_stop(self, signum=None, frame=None):
+        if not self.stopping.is_set():
+            safe_print("🛑 طلب إيقاف الخدمة", signal=signum)
+        self.stopping.set()
+
+    def shutdown(self, timeout=None):
+        """1) لا اتصالات ولا طلبات جديدة 2) انتظار الجارية 3) تنفيذ المهام المنتظرة 4) إيقاف العمال"""
+        timeout = config["ShutdownTimeout"] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.perf_counter()
+
+        if self._http is not None:
+            # إيقاف الاستقبال؛ waitress ينتظر الطلبات الجارية (حتى 5 ثوانٍ)، أما werkzeug فخيوط طلباته daemon
+            # و server_close لا ينتظرها - الرفع الجاري يُقطع عند الخروج ويبقى ملفه .part (خادم التطوير فقط)
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+        if self._dicom is not None:
+            active = self._dicom.active_associations
+            self._dicom.shutdown()
+            # الاتصالات المفتوحة تكمل N-ACTION / C-STORE حتى تدخل مهامها الطابور
+            for assoc in active:
+                assoc.join(max(0, deadline - time.monotonic()))
+                if assoc.is_alive():
+                    safe_print("⚠️ اتصال لم ينته ضمن مهلة الإغلاق - قطعه", level=logging.WARNING)
+                    assoc.abort()
+            self._dicom = None
+
+        pending = scp.print_queue.pending()
+        if pending:
+            safe_print(f"⏳ تنفيذ {pending} مهمة منتظرة قبل الإيقاف")
+        scp.stop_workers(timeout=max(0, deadline - time.monotonic()))
+        safe_print("📊 الخدمة متوقفة", ms=round((time.perf_counter() - started) * 1000, 1),
+                   unfinished=scp.print_queue.pending())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DICOM print SCP and HTTP API in one process")
+    parser.add_argument('--port', type=int, help='DICOM port (default: Port)')
+    parser.add_argument('--http-host', help='HTTP bind address (default: HttpHost)')
+    parser.add_argument('--http-port', type=int, help='HTTP port (default: HttpPort)')
+    parser.add_argument('--no-http', action='store_true', help='DICOM only')
+    parser.add_argument('--shutdown-timeout', type=float, help='seconds to drain on stop (default: ShutdownTimeout)')
+    args = parser.parse_args(argv)
+
+    service = PrintService(args.port, args.http_host, args.http_port, enable_http=not args.no_http)
+    signal.signal(signal.SIGTERM, service.request_stop)
+    signal.signal(signal.SIGINT, service.request_stop)
+    try:
+        service.start()
+        service.wait()
+    except Exception as e:
+        safe_print(f"❌ خطأ في الخدمة: {e}", level=logging.ERROR)
+        return 1
+    finally:
+        service.shutdown(args.shutdown_timeout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
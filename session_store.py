@@ -0,0 +1,190 @@
+# session_store.py
+# مخزن حالة جلسات الطباعة (Film Session / Film Box / Image Box) آمن بين خيوط الاتصالات
+# كل عنصر مرتبط بالاتصال الذي أنشأه، ويُحرر عند انتهاء الاتصال أو انتهاء مهلته أو تجاوز ميزانية الذاكرة
+# العناصر المسلَّمة لطابور الطباعة (disown) لا تُخلى ولا تنتهي مهلتها: المرسل تلقى 0x0000 وينتظر الطباعة
+
+import threading
+import time
+from collections import OrderedDict
+
+from log import safe_print
+
+KINDS = ('film_sessions', 'film_boxes', 'image_boxes', 'print_jobs')
+
+def _release(data):
+    """إغلاق أي مخزن بكسل داخل العنصر (PixelBuffer / memmap) وإلغاء فك الضغط المنتظر (Future)"""
+    if isinstance(data, dict):
+        for value in data.values():
+            for method in ('close', 'cancel'):
+                func = getattr(value, method, None)
+                if callable(func):
+                    try:
+                        func()
+                    except Exception:
+                        pass
+
+class PrintSessionStore:
+    """مخزن بقفل واحد؛ image_boxes مرتبة LRU وتُقاس بالبايت"""
+
+    def __init__(self, max_bytes=0, ttl=0):
+        self.max_bytes = int(max_bytes or 0)
+        self.ttl = float(ttl or 0)
+        self._lock = threading.RLock()
+        self._entries = {kind: OrderedDict() for kind in KINDS}
+        self.bytes_held = 0
+        self.evicted = 0
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def put(self, kind, uid, data, owner=None, nbytes=0):
+        """تخزين العنصر - False (بدون تخزين) إذا كانت الميزانية محجوزة بعناصر في طابور الطباعة"""
+        with self._lock:
+            self._discard(kind, uid)
+            if not self._fits(int(nbytes)):
+                return False
+            self._entries[kind][uid] = {
+                'data': data,
+                'owner': owner,
+                'nbytes': int(nbytes),
+                'touched': time.monotonic(),
+                'queued': False,
+            }
+            self.bytes_held += int(nbytes)
+            self._enforce_budget(keep=uid)
+            return True
+
+    def get(self, kind, uid, default=None):
+        with self._lock:
+            entry = self._entries[kind].get(uid)
+            if entry is None:
+                return default
+            entry['touched'] = time.monotonic()
+            self._entries[kind].move_to_end(uid)
+            return entry['data']
+
+    def pop(self, kind, uid, default=None):
+        """إخراج العنصر من المخزن بدون تحريره - المسؤولية تنتقل للمستدعي"""
+        with self._lock:
+            entry = self._entries[kind].pop(uid, None)
+            if entry is None:
+                return default
+            self.bytes_held -= entry['nbytes']
+            return entry['data']
+
+    def __contains__(self, key):
+        kind, uid = key
+        with self._lock:
+            return uid in self._entries[kind]
+
+    def items(self, kind):
+        with self._lock:
+            return [(uid, e['data']) for uid, e in self._entries[kind].items()]
+
+    def disown(self, kind, uid):
+        """تسليم العنصر لطابور الطباعة: لا يُحرر بانتهاء الاتصال ولا بالمهلة ولا بميزانية الذاكرة"""
+        with self._lock:
+            entry = self._entries[kind].get(uid)
+            if entry is not None:
+                entry['owner'] = None
+                entry['queued'] = True
+
+    def unqueue(self, kind, uid):
+        """المهمة فشلت والعنصر باقٍ لإعادة المحاولة: تعود له المهلة (TTL) كأي عنصر بلا اتصال"""
+        with self._lock:
+            entry = self._entries[kind].get(uid)
+            if entry is not None:
+                entry['queued'] = False
+                entry['touched'] = time.monotonic()
+
+    def queued_bytes(self):
+        with self._lock:
+            return sum(e['nbytes'] for entries in self._entries.values() for e in entries.values() if e['queued'])
+
+    def delete(self, uid):
+        """حذف المعرف من كل الأنواع (N-DELETE)"""
+        with self._lock:
+            for kind in KINDS:
+                self._discard(kind, uid)
+
+    def release_owner(self, owner):
+        """تحرير كل ما أنشأه اتصال انتهى (EVT_RELEASED / EVT_ABORTED)"""
+        freed = count = 0
+        with self._lock:
+            for kind in KINDS:
+                for uid in [u for u, e in self._entries[kind].items() if e['owner'] == owner]:
+                    freed += self._entries[kind][uid]['nbytes']
+                    self._discard(kind, uid)
+                    count += 1
+        if count:
+            safe_print(f"🧹 تحرير {count} عنصر ({freed} بايت) من اتصال منتهٍ")
+        return count
+
+    def sweep(self):
+        """حذف العناصر التي تجاوزت المهلة ttl منذ آخر استخدام"""
+        if not self.ttl:
+            return 0
+        deadline = time.monotonic() - self.ttl
+        count = 0
+        with self._lock:
+            for kind in KINDS:
+                for uid in [u for u, e in self._entries[kind].items()
+                            if e['touched'] < deadline and not e['queued']]:
+                    self._discard(kind, uid)
+                    count += 1
+            self.evicted += count
+        if count:
+            safe_print(f"⏱️ حذف {count} عنصر منتهي المهلة")
+        return count
+
+    def stats(self):
+        with self._lock:
+            gauges = {kind: len(entries) for kind, entries in self._entries.items()}
+            gauges['bytes_held'] = self.bytes_held
+            gauges['bytes_queued'] = self.queued_bytes()
+            gauges['evicted'] = self.evicted
+            return gauges
+
+    def start_reaper(self, interval=60):
+        if self._reaper is not None or not self.ttl:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.sweep()
+
+        self._reaper = threading.Thread(target=loop, name="session-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+
+    def _discard(self, kind, uid):
+        entry = self._entries[kind].pop(uid, None)
+        if entry is not None:
+            self.bytes_held -= entry['nbytes']
+            _release(entry['data'])
+
+    def _fits(self, nbytes):
+        """العناصر المنتظرة في الطابور لا تُخلى: إن تجاوزت الميزانية وحدها مع الجديد نرفضه"""
+        if not self.max_bytes or not nbytes:
+            return True
+        queued = self.queued_bytes()
+        return not queued or queued + nbytes <= self.max_bytes
+
+    def _enforce_budget(self, keep=None):
+        """إخلاء أقدم صناديق الصور (LRU) غير المسلَّمة للطابور حتى نعود تحت max_bytes"""
+        if not self.max_bytes:
+            return
+        boxes = self._entries['image_boxes']
+        for uid in list(boxes):
+            if self.bytes_held <= self.max_bytes:
+                break
+            if uid == keep or boxes[uid]['queued']:
+                continue
+            safe_print(f"⚠️ تجاوز ميزانية الذاكرة - إخلاء صندوق الصورة {uid}")
+            self._discard('image_boxes', uid)
+            self.evicted += 1
@@ -0,0 +1,68 @@
+# test_conversion_cache.py
+# كاش التحويل: المفتاح من المحتوى والمعاملات، الإخلاء LRU، التثبيت، و checkout الذي يبقى بعد الإخلاء
+
+import io
+import os
+
+import pytest
+
+from conversion_cache import ConversionCache
+
+def writer(name, data):
+    def build(out_dir):
+        path = os.path.join(out_dir, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return [path]
+    return build
+
+@pytest.fixture
+def cache(tmp_path):
+    return ConversionCache(tmp_path / "cache", max_bytes=150)
+
+def test_key_depends_on_content_and_params():
+    a = ConversionCache.make_key(io.BytesIO(b"same"), {'format': 'jpg'})
+    assert a == ConversionCache.make_key(io.BytesIO(b"same"), {'format': 'jpg'})
+    assert a != ConversionCache.make_key(io.BytesIO(b"other"), {'format': 'jpg'})
+    assert a != ConversionCache.make_key(io.BytesIO(b"same"), {'format': 'png'})
+
+def test_precomputed_hash_matches_reading_the_file():
+    source = io.BytesIO(b"payload")
+    digest = ConversionCache.content_hash(source)
+    assert source.tell() == 0
+    assert ConversionCache.make_key(None, {}, digest) == ConversionCache.make_key(source, {})
+
+def test_store_then_lookup_hits(cache):
+    assert cache.lookup('k') is None
+    stored = cache.store('k', writer('out.pdf', b'x' * 10))
+    assert cache.lookup('k') == stored
+    assert cache.stats()['hits'] == 1
+
+def test_failed_build_is_not_cached(cache):
+    assert cache.store('k', lambda out_dir: []) == []
+    assert cache.lookup('k') is None
+
+def test_eviction_drops_least_recently_used(cache):
+    cache.store('a', writer('a', b'x' * 60))
+    cache.store('b', writer('b', b'x' * 60))
+    cache.lookup('a')
+    cache.store('c', writer('c', b'x' * 60))
+    assert cache.lookup('b') is None
+    assert cache.lookup('a') is not None
+    assert cache.lookup('c') is not None
+
+def test_pinned_entries_are_not_evicted(cache):
+    cache.store('a', writer('a', b'x' * 100))
+    with cache.pinned('a'):
+        cache.store('b', writer('b', b'x' * 100))
+        assert cache.lookup('a') is not None
+    cache.store('c', writer('c', b'x' * 100))
+    assert cache.lookup('a') is None
+
+def test_checkout_survives_eviction(cache, tmp_path):
+    outputs = cache.store('a', writer('a.pdf', b'pdf data'))
+    copies = cache.checkout(outputs, tmp_path / "job")
+    cache.store('b', writer('b', b'x' * 200))
+    assert cache.lookup('a') is None
+    with open(copies[0], 'rb') as fp:
+        assert fp.read() == b'pdf data'
@@ -0,0 +1,37 @@
+# test_converter.py
+# تحديد نوع الملف من أول البايتات: التواقيع، ترويسة BMP، DICOM بدون Preamble، والامتداد كتلميح
+
+import io
+
+import pytest
+from PIL import Image
+
+from converter import (FILE_DICOM, FILE_IMAGE, FILE_PDF, FILE_TEXT, SNIFF_BYTES,
+                       detect_file_type, sniff_file)
+
+def encoded(image_format):
+    buf = io.BytesIO()
+    Image.new('L', (4, 4)).save(buf, format=image_format)
+    return buf.getvalue()[:SNIFF_BYTES]
+
+@pytest.mark.parametrize('image_format', ['PNG', 'JPEG', 'GIF', 'BMP', 'TIFF'])
+def test_image_signatures(image_format):
+    assert detect_file_type(encoded(image_format)) == FILE_IMAGE
+
+def test_text_starting_with_bm_is_text():
+    assert detect_file_type(b'BMI report for 2024\npatient,weight\n', '.csv') == FILE_TEXT
+    assert detect_file_type(b'BM' + b'\x00' * 30, '.txt') == FILE_TEXT
+
+def test_pdf_and_dicom():
+    assert detect_file_type(b'%PDF-1.4\n') == FILE_PDF
+    assert detect_file_type(b'\x00' * 128 + b'DICM' + b'\x02\x00') == FILE_DICOM
+    assert detect_file_type(b'\x08\x00\x05\x00CS') == FILE_DICOM
+    assert detect_file_type(b'anything', '.dcm') == FILE_DICOM
+
+def test_signature_wins_over_extension():
+    assert detect_file_type(encoded('PNG'), '.txt') == FILE_IMAGE
+
+def test_sniff_file_uses_extension(tmp_path):
+    path = tmp_path / 'notes.LOG'
+    path.write_bytes(b'BM scan finished\n')
+    assert sniff_file(str(path)) == FILE_TEXT
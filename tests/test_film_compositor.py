@@ -0,0 +1,54 @@
+# test_film_compositor.py
+# تخطيط ImageDisplayFormat وتركيب صفحة الفيلم
+
+from PIL import Image
+
+from film_compositor import compose_film, fit_size, layout_cells, page_size_pixels, parse_image_display_format
+
+def test_standard_format_positions_are_row_major():
+    assert parse_image_display_format("STANDARD\\2,3") == [
+        (0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 1),
+    ]
+
+def test_invalid_format_is_empty():
+    assert parse_image_display_format("STANDARD\\x") == []
+    assert parse_image_display_format("") == []
+
+def test_standard_cells_tile_the_page():
+    cells = layout_cells("STANDARD\\2,2", (200, 100))
+    assert cells == [(0, 0, 100, 50), (100, 0, 200, 50), (0, 50, 100, 100), (100, 50, 200, 100)]
+
+def test_row_format_has_a_cell_count_per_row():
+    cells = layout_cells("ROW\\1,2", (200, 100))
+    assert cells == [(0, 0, 200, 50), (0, 50, 100, 100), (100, 50, 200, 100)]
+
+def test_col_format_splits_columns_first():
+    cells = layout_cells("COL\\2,1", (200, 100))
+    assert cells == [(0, 0, 100, 50), (0, 50, 100, 100), (100, 0, 200, 100)]
+
+def test_margin_shrinks_every_cell():
+    (x0, y0, x1, y1), = layout_cells("STANDARD\\1,1", (100, 100), margin=5)
+    assert (x0, y0, x1, y1) == (5, 5, 95, 95)
+
+def test_fit_size_keeps_aspect_and_caps_scale():
+    assert fit_size((400, 200), (100, 100)) == (100, 50)
+    assert fit_size((50, 25), (100, 100), max_scale=1.0) == (50, 25)
+
+def test_landscape_swaps_page_size():
+    width, height = page_size_pixels('A4', 'PORTRAIT', dpi=100)
+    assert page_size_pixels('A4', 'LANDSCAPE', dpi=100) == (height, width)
+
+def test_compose_film_places_each_box_in_its_cell():
+    black = Image.new('L', (50, 50), 0)
+    page = compose_film({1: black, 4: black}, "STANDARD\\2,2", (200, 200), margin=0, background=255)
+    assert page.mode == 'L'
+    assert page.size == (200, 200)
+    assert page.getpixel((50, 50)) == 0      # الخلية 1
+    assert page.getpixel((150, 50)) == 255   # الخلية 2 فارغة
+    assert page.getpixel((150, 150)) == 0    # الخلية 4
+
+def test_compose_film_switches_to_rgb_for_color_boxes():
+    page = compose_film({1: Image.new('RGB', (10, 10), (255, 0, 0)), 2: Image.new('L', (10, 10), 0)},
+                        "STANDARD\\2,1", (100, 50), margin=0)
+    assert page.mode == 'RGB'
+    assert page.getpixel((25, 25)) == (255, 0, 0)
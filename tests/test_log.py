@@ -0,0 +1,43 @@
+# test_log.py
+# السجل غير المتزامن: لا يضيع أي سطر عند الخروج، ولا في العمليات الابنة بعد fork (os._exit)
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(script):
+    result = subprocess.run([sys.executable, "-c", textwrap.dedent(script)], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.splitlines()
+
+def test_records_flushed_at_exit():
+    lines = run("""
+        from log import safe_print
+        for i in range(500):
+            safe_print("line", i=i)
+    """)
+    assert len(lines) == 500
+    assert lines[-1].endswith("i=499")
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork غير متاح")
+def test_forked_child_records_survive_os_exit():
+    lines = run("""
+        import os
+        from log import safe_print
+        safe_print("parent")
+        pid = os.fork()
+        if pid == 0:
+            for i in range(300):
+                safe_print("child", i=i)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        safe_print("parent done")
+    """)
+    assert sum(" - child" in line for line in lines) == 300
+    assert lines[-1].endswith("parent done")
@@ -0,0 +1,86 @@
+# test_metrics.py
+# صيغة Prometheus النصية: العدادات، المدرجات التراكمية، القياسات اللحظية، track_dimse، stage (مدرج + span واحد)، و /jobs و /metrics
+
+import time
+
+import http_server
+import tracing
+from metrics import Counter, Histogram, register_gauge, render, stage, track_dimse
+from print_queue import PrintJobQueue
+
+def lines_for(name):
+    return [line for line in render().splitlines() if line.startswith(name)]
+
+def test_counter_samples_per_label_set():
+    c = Counter('test_requests_total', 'help', ('op',))
+    c.inc(op='a')
+    c.inc(2, op='a')
+    c.inc(op='b')
+    assert lines_for('test_requests_total') == [
+        'test_requests_total{op="a"} 3',
+        'test_requests_total{op="b"} 1',
+    ]
+    assert '# TYPE test_requests_total counter' in render()
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram('test_latency_seconds', 'help', buckets=(0.1, 1.0))
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(5)
+    assert lines_for('test_latency_seconds') == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1"} 2',
+        'test_latency_seconds_bucket{le="+Inf"} 3',
+        'test_latency_seconds_sum 5.55',
+        'test_latency_seconds_count 3',
+    ]
+
+def test_label_values_are_escaped():
+    c = Counter('test_escape_total', 'help', ('path',))
+    c.inc(path='a"b\\c\nd')
+    assert lines_for('test_escape_total') == ['test_escape_total{path="a\\"b\\\\c\\nd"} 1']
+
+def test_gauges_are_read_at_render_time_and_failures_skipped():
+    value = {'x': 1}
+    register_gauge('test_gauge', 'help', lambda: dict(value), ('kind',))
+    register_gauge('test_broken_gauge', 'help', lambda: 1 / 0)
+    assert lines_for('test_gauge') == ['test_gauge{kind="x"} 1']
+    value['x'] = 7
+    assert lines_for('test_gauge') == ['test_gauge{kind="x"} 7']
+    assert 'test_broken_gauge' not in render()
+
+def test_track_dimse_records_status_code():
+    @track_dimse('N-TEST')
+    def handler(event):
+        return 0xC600, None
+
+    handler(None)
+    assert 'rcp_dimse_requests_total{op="N-TEST",status="0xC600"} 1' in render()
+    assert any(l.startswith('rcp_dimse_seconds_count{op="N-TEST"}') for l in render().splitlines())
+
+def test_stage_records_histogram_and_one_span():
+    trace = tracing.Trace("job")
+    with tracing.activate(trace):
+        with stage('test-stage', images=2):
+            pass
+    assert [(name, fields) for name, _, _, _, fields in trace.spans] == [('test-stage', {'images': 2})]
+    assert 'rcp_stage_seconds_count{stage="test-stage"} 1' in render()
+
+def test_jobs_and_metrics_endpoints():
+    queue = PrintJobQueue("test-api", maxsize=4, workers=1)
+    try:
+        job_id = queue.submit(lambda: True)
+        while queue.status(job_id)["status"] != "done":
+            time.sleep(0.01)
+        client = http_server.app.test_client()
+        listing = client.get('/jobs?queue=test-api').get_json()
+        assert list(listing['queues']) == ['test-api']
+        assert [j['id'] for j in listing['jobs']] == [job_id]
+        assert client.get('/jobs?queue=test-api&status=failed').get_json()['jobs'] == []
+        assert client.get(f'/jobs/{job_id}').get_json()['status'] == 'done'
+        assert client.get('/jobs/unknown').status_code == 404
+        rsp = client.get('/metrics')
+        assert rsp.mimetype == 'text/plain'
+        assert 'rcp_jobs_total{queue="test-api",status="done"} 1' in rsp.get_data(as_text=True)
+    finally:
+        queue.stop()
@@ -0,0 +1,122 @@
+# test_n_action.py
+# N-ACTION على Film Session: رفض الجلسة الفارغة، وإضافة كل الأفلام للطابور أو لا شيء
+# مهمة الفيلم: حذف الفيلم المطبوع وسجل print_jobs، وإبقاء الفاشل لإعادة المحاولة (والصندوق المفرد عند استثناء)
+# N-SET: رفض الصندوق (0xA700) إذا كانت ذاكرة الجلسات محجوزة بصناديق في الطابور
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from pydicom.dataset import Dataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+import dicom_print_scp as scp
+from print_queue import PrintJobQueue
+from session_store import PrintSessionStore
+
+def n_action(uid):
+    event = SimpleNamespace(request=SimpleNamespace(RequestedSOPInstanceUID=uid), assoc=object())
+    status, _ = scp.handle_n_action(event)
+    return status
+
+@pytest.fixture
+def store(monkeypatch):
+    store = PrintSessionStore()
+    monkeypatch.setattr(scp, 'state', store)
+    return store
+
+@pytest.fixture
+def busy_queue(monkeypatch):
+    """طابور بعامل مشغول وسعة 1 - المهام المقبولة تبقى منتظرة"""
+    release = threading.Event()
+    q = PrintJobQueue("test-n-action", maxsize=1, workers=1)
+    q.submit(release.wait)
+    while q.pending():
+        time.sleep(0.01)
+    monkeypatch.setattr(scp, 'print_queue', q)
+    yield q
+    q.stop(drain=False, timeout=0)
+    release.set()
+
+def add_session(store, session_uid, films):
+    store.put('film_sessions', session_uid, {})
+    for uid in films:
+        store.put('film_boxes', uid, {'session_uid': session_uid, 'image_boxes': {}})
+
+def test_empty_film_session_is_a_failure(store, busy_queue):
+    add_session(store, 'session', [])
+    assert n_action('session') == scp.STATUS_NO_FILM_BOXES
+    assert busy_queue.pending() == 0
+
+def test_session_that_does_not_fit_queues_nothing(store, busy_queue):
+    add_session(store, 'session', ['film-1', 'film-2'])
+    assert n_action('session') == scp.STATUS_RESOURCE_LIMITATION
+    assert busy_queue.pending() == 0
+    assert ('print_jobs', 'film-1') not in store
+
+def test_session_that_fits_queues_every_film(store, busy_queue):
+    add_session(store, 'session', ['film-1'])
+    assert n_action('session') == 0x0000
+    assert busy_queue.pending() == 1
+    assert ('print_jobs', 'film-1') in store
+
+def n_set(uid, size=16):
+    image = Dataset()
+    image.Rows = image.Columns = size
+    image.BitsAllocated = 8
+    image.PixelData = bytes(size * size)
+    mod = Dataset()
+    mod.BasicGrayscaleImageSequence = [image]
+    event = SimpleNamespace(
+        request=SimpleNamespace(RequestedSOPClassUID='1.2.840.10008.5.1.1.4', RequestedSOPInstanceUID=uid),
+        modification_list=mod, context=SimpleNamespace(transfer_syntax=ExplicitVRLittleEndian), assoc=object(),
+    )
+    status, _ = scp.handle_n_set(event)
+    return status
+
+def test_n_set_refused_when_budget_is_held_by_queued_boxes(monkeypatch, busy_queue):
+    store = PrintSessionStore(max_bytes=300)
+    monkeypatch.setattr(scp, 'state', store)
+    store.put('film_boxes', 'film', {'session_uid': 's', 'image_boxes': {'box-1': 1, 'box-2': 2}})
+    assert n_set('box-1') == 0x0000
+    assert scp.enqueue_film_boxes(['film'])
+    assert n_set('box-2') == scp.STATUS_OUT_OF_RESOURCES
+    assert ('image_boxes', 'box-1') in store
+    assert ('image_boxes', 'box-2') not in store
+
+@pytest.fixture
+def idle_queue(monkeypatch):
+    q = PrintJobQueue("test-film-job", maxsize=4, workers=1)
+    monkeypatch.setattr(scp, 'print_queue', q)
+    yield q
+    q.stop(drain=True, timeout=5)
+
+@pytest.mark.parametrize('printed', [True, False])
+def test_film_job_cleans_up_after_itself(store, idle_queue, monkeypatch, printed):
+    monkeypatch.setattr(scp.print_manager, 'print_image_advanced', lambda *a, **k: printed)
+    store.put('film_boxes', 'film', {'session_uid': 's', 'image_boxes': {'box': 1}, 'film_size_id': '8INX10IN',
+                                     'film_orientation': 'PORTRAIT', 'image_display_format': 'STANDARD\\1,1'})
+    assert n_set('box') == 0x0000
+    job_id, = scp.enqueue_film_boxes(['film'])
+    while idle_queue.status(job_id)['status'] not in ('done', 'failed'):
+        time.sleep(0.01)
+    assert ('print_jobs', 'film') not in store
+    assert (('film_boxes', 'film') in store) is not printed
+    assert (('image_boxes', 'box') in store) is not printed
+    assert store.queued_bytes() == 0
+
+def test_image_box_restored_when_rendering_raises(store, idle_queue, monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("render failed")
+    monkeypatch.setattr(scp, 'create_print_job_image', boom)
+    assert n_set('box') == 0x0000   # صندوق مستقل يُطبع فورًا
+    while idle_queue.pending() or idle_queue.counts().get('done', 0) + idle_queue.counts().get('failed', 0) == 0:
+        time.sleep(0.01)
+    assert ('image_boxes', 'box') in store
+    assert ('print_jobs', 'box') not in store
+
+def test_restored_box_keeps_its_accounted_size(store):
+    # صندوق مضغوط: البايتات المستلمة + حجم الإطار المفكوك كما حُسب في N-SET
+    scp.restore_image_box('box', {'pixel_data': b'x' * 10, 'nbytes': 10 + 64 * 64})
+    assert store.bytes_held == 10 + 64 * 64
@@ -0,0 +1,61 @@
+# test_pdf_stream.py
+# كاتب PDF المتدفق: تقسيم الأسطر بالعرض، حد الصفحات، التقسيم لملفات، وبنية الملف (xref)
+
+import re
+
+from pdf_stream import HELVETICA_WIDTHS, MM, text_to_pdf_stream, wrap_line
+
+def width(data, font_size):
+    return sum(HELVETICA_WIDTHS[b] for b in data) * font_size / 1000.0
+
+def test_short_line_is_not_wrapped():
+    assert wrap_line(b"hello world", 500, 12) == [b"hello world"]
+
+def test_wrap_prefers_spaces_and_respects_width():
+    data = b" ".join([b"word"] * 50)
+    lines = wrap_line(data, 100, 12)
+    assert len(lines) > 1
+    assert all(width(line, 12) <= 100 for line in lines)
+    assert all(not line.startswith(b" ") and line.split(b" ")[0] == b"word" for line in lines)
+    assert b" ".join(lines) == data
+
+def test_long_word_is_split_inside():
+    lines = wrap_line(b"x" * 200, 50, 12)
+    assert b"".join(lines) == b"x" * 200
+    assert all(width(line, 12) <= 50 for line in lines)
+
+def test_empty_line_is_kept():
+    assert wrap_line(b"", 100, 12) == [b""]
+
+def pages_in(path):
+    with open(path, 'rb') as fp:
+        return len(re.findall(rb"/Type /Page\b", fp.read()))
+
+def test_max_pages_truncates(tmp_path):
+    lines = (f"line {i}\n" for i in range(10000))
+    outputs, pages, truncated = text_to_pdf_stream(lines, lambda i: str(tmp_path / f"out{i}.pdf"),
+                                                   line_height=6 * MM, max_pages=3)
+    assert (pages, truncated) == (3, True)
+    assert len(outputs) == 1
+    assert pages_in(outputs[0]) == 3
+
+def test_chunk_pages_splits_files(tmp_path):
+    lines = [f"line {i}\n" for i in range(200)]
+    outputs, pages, truncated = text_to_pdf_stream(lines, lambda i: str(tmp_path / f"out{i}.pdf"), chunk_pages=2)
+    assert not truncated
+    assert len(outputs) == -(-pages // 2)
+    assert sum(pages_in(p) for p in outputs) == pages
+
+def test_empty_input_gives_one_blank_page(tmp_path):
+    outputs, pages, _ = text_to_pdf_stream([], lambda i: str(tmp_path / "empty.pdf"))
+    assert pages == 1
+    assert pages_in(outputs[0]) == 1
+
+def test_xref_offsets_point_at_objects(tmp_path):
+    outputs, _, _ = text_to_pdf_stream(["a\n", "b\n"], lambda i: str(tmp_path / "x.pdf"))
+    data = open(outputs[0], 'rb').read()
+    assert data.startswith(b"%PDF-1.4") and data.rstrip().endswith(b"%%EOF")
+    xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+    assert data[xref:xref + 4] == b"xref"
+    for number, offset in enumerate(re.findall(rb"(\d{10}) 00000 n", data), start=1):
+        assert data[int(offset):].startswith(b"%d 0 obj" % number)
@@ -0,0 +1,65 @@
+# test_pixel_decoder.py
+# مجموعة الفك: عمليات decode_worker.py تفك RLE، الأخطاء تصل كاستثناء، والطلبات الملغاة لا تُرسل
+
+import threading
+
+import numpy as np
+import pytest
+from pydicom.encaps import encapsulate
+from pydicom.pixels.encoders import RLELosslessEncoder
+from pydicom.uid import RLELossless
+
+from pixel_decoder import DecodePool
+
+SIZE = 32
+
+@pytest.fixture(scope="module")
+def frame():
+    array = (np.arange(SIZE * SIZE) % 251).astype(np.uint8).reshape(SIZE, SIZE)
+    encoded = RLELosslessEncoder.encode(
+        array.tobytes(), rows=SIZE, columns=SIZE, samples_per_pixel=1, bits_allocated=8, bits_stored=8,
+        pixel_representation=0, photometric_interpretation='MONOCHROME2', number_of_frames=1,
+    )
+    return array, encapsulate([encoded])
+
+@pytest.fixture
+def pool():
+    pool = DecodePool(1)
+    yield pool
+    pool.shutdown()
+
+def test_worker_decodes_rle(pool, frame):
+    array, data = frame
+    futures = [pool.submit(data, RLELossless, SIZE, SIZE) for _ in range(3)]
+    for future in futures:
+        assert (future.result(timeout=60) == array).all()
+
+def test_decode_error_is_raised(pool):
+    with pytest.raises(RuntimeError):
+        pool.submit(b"not rle", RLELossless, SIZE, SIZE).result(timeout=60)
+
+def test_cancelled_request_is_skipped(pool, frame):
+    array, data = frame
+    gate = threading.Event()
+    # العملية الوحيدة مشغولة حتى يُفتح gate: الطلبات التالية تبقى منتظرة
+    pool._requests.put((_Blocking(gate), (), {}))
+    queued = pool.submit(data, RLELossless, SIZE, SIZE)
+    kept = pool.submit(data, RLELossless, SIZE, SIZE)
+    assert queued.cancel()
+    gate.set()
+    assert (kept.result(timeout=60) == array).all()
+    assert queued.cancelled()
+
+def test_inline_pool_without_workers(frame):
+    array, data = frame
+    assert (DecodePool(0).submit(data, RLELossless, SIZE, SIZE).result() == array).all()
+
+class _Blocking:
+    """Future وهمي يحجز خيط التغذية حتى يُفتح gate، ثم يُتجاهل كطلب ملغى"""
+
+    def __init__(self, gate):
+        self.gate = gate
+
+    def set_running_or_notify_cancel(self):
+        self.gate.wait(10)
+        return False
@@ -0,0 +1,97 @@
+# test_print_catalog.py
+# فهرس الطباعة: الصفحات (الأحدث أولًا)، التصفية بالوقت، ETag، إعادة البناء من المجلد، فهرس / مع 304،
+# وتسجيل مخرجات save_dicom_to_pdf (PDF + معاينة PNG حسب SavePngPreview)
+
+import os
+
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ImplicitVRLittleEndian
+
+import main
+from print_catalog import CATALOG_NAME, PrintCatalog
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = PrintCatalog(tmp_path)
+    for i in range(1, 8):
+        catalog.add(f"job{i}", [f"job{i}.pdf"], created=1000.0 + i)
+    return catalog
+
+def uids(entries):
+    return [e['uid'] for e in entries]
+
+def test_pages_are_newest_first(catalog):
+    entries, total = catalog.query(page=1, per_page=3)
+    assert total == 7
+    assert uids(entries) == ['job7', 'job6', 'job5']
+    assert uids(catalog.query(page=3, per_page=3)[0]) == ['job1']
+    assert catalog.query(page=4, per_page=3)[0] == []
+
+def test_since_and_until_are_inclusive(catalog):
+    entries, total = catalog.query(since=1003.0, until=1005.0)
+    assert total == 3
+    assert uids(entries) == ['job5', 'job4', 'job3']
+
+def test_etag_changes_only_when_catalog_changes(catalog):
+    before = catalog.etag(1, 100)
+    assert catalog.etag(1, 100) == before
+    assert catalog.etag(2, 100) != before
+    catalog.add("job8", ["job8.pdf"])
+    assert catalog.etag(1, 100) != before
+
+def test_same_uid_merges_files(catalog):
+    catalog.add("job7", ["job7.png"])
+    assert len(catalog) == 7
+    assert catalog.query(per_page=1)[0][0]['files'] == ['job7.pdf', 'job7.png']
+
+def test_reload_from_catalog_file(catalog, tmp_path):
+    reloaded = PrintCatalog(tmp_path)
+    assert len(reloaded) == 7
+    assert uids(reloaded.query(per_page=2)[0]) == ['job7', 'job6']
+
+def test_rebuild_groups_existing_files(tmp_path):
+    for name in ("a.pdf", "a.png", "b.pdf", ".hidden"):
+        (tmp_path / name).write_bytes(b"x")
+    catalog = PrintCatalog(tmp_path)
+    entries, total = catalog.query()
+    assert total == 2
+    assert sorted(e['files'] for e in entries) == [['a.pdf', 'a.png'], ['b.pdf']]
+    assert os.path.exists(tmp_path / CATALOG_NAME)
+
+def test_index_returns_json_and_304(catalog, monkeypatch):
+    monkeypatch.setattr(main, "catalog", catalog)
+    client = main.app.test_client()
+    rsp = client.get('/?format=json&per_page=2&page=2')
+    assert rsp.status_code == 200
+    body = rsp.get_json()
+    assert (body['page'], body['pages'], body['total']) == (2, 4, 7)
+    assert uids(body['jobs']) == ['job5', 'job4']
+    etag = rsp.headers['ETag']
+    cached = client.get('/?format=json&per_page=2&page=2', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert client.get('/?since=not-a-date').status_code == 400
+
+def film_dataset():
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+    ds.Rows = ds.Columns = 16
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.PixelData = np.arange(256, dtype=np.uint8).tobytes()
+    return ds
+
+@pytest.mark.parametrize('preview, expected', [(True, ['f1.pdf', 'f1.png']), (False, ['f1.pdf'])])
+def test_saved_film_is_catalogued(tmp_path, monkeypatch, preview, expected):
+    monkeypatch.setattr(main, "catalog", PrintCatalog(tmp_path))
+    monkeypatch.setattr(main, "PRINT_JOBS", str(tmp_path))
+    monkeypatch.setattr(main, "SAVE_PNG_PREVIEW", preview)
+    main.save_dicom_to_pdf(film_dataset(), "f1")
+    entries, _ = main.catalog.query()
+    assert [os.path.basename(f) for f in entries[0]['files']] == expected
+    assert (tmp_path / "f1.pdf").read_bytes().startswith(b"%PDF")
@@ -0,0 +1,96 @@
+# test_print_queue.py
+# طابور المهام: الحالات، الضغط العكسي عند الامتلاء، الإضافة الجماعية الذرية، والإيقاف مع التفريغ
+
+import threading
+import time
+
+import pytest
+
+from print_queue import PrintJobQueue, find_job, set_stage
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+@pytest.fixture
+def blocked_queue():
+    """طابور بعامل واحد مشغول حتى release.set()"""
+    release = threading.Event()
+    q = PrintJobQueue("test-blocked", maxsize=2, workers=1)
+    first = q.submit(release.wait)
+    wait_for(lambda: q.status(first)["status"] == "running")
+    yield q, release
+    release.set()
+    q.stop(drain=False, timeout=5)
+
+def test_job_status_done_and_failed():
+    q = PrintJobQueue("test-status", maxsize=4, workers=1)
+    try:
+        ok = q.submit(lambda: True)
+        failed = q.submit(lambda: False)
+        raised = q.submit(lambda: 1 / 0)
+        wait_for(lambda: all(q.status(j)["finished_at"] for j in (ok, failed, raised)))
+        assert q.status(ok)["status"] == "done"
+        assert q.status(failed)["status"] == "failed"
+        assert q.status(raised)["status"] == "failed"
+        assert "division" in q.status(raised)["error"]
+        assert find_job(ok)["queue"] == "test-status"
+    finally:
+        q.stop()
+
+def test_submit_returns_none_when_full(blocked_queue):
+    q, _ = blocked_queue
+    assert q.submit(lambda: True) is not None
+    assert q.submit(lambda: True) is not None
+    assert q.submit(lambda: True) is None
+    # المهمة المرفوضة لا تبقى في جدول المهام
+    assert len(q.jobs()) == 3
+
+def test_submit_many_is_all_or_nothing(blocked_queue):
+    q, _ = blocked_queue
+    assert q.submit_many(lambda uid: True, [("a",), ("b",), ("c",)]) is None
+    assert q.pending() == 0
+    assert len(q.jobs()) == 1
+    job_ids = q.submit_many(lambda uid: True, [("a",), ("b",)])
+    assert len(job_ids) == 2
+    assert q.pending() == 2
+
+def test_stop_with_drain_runs_pending_jobs(blocked_queue):
+    q, release = blocked_queue
+    ran = []
+    q.submit(ran.append, 1)
+    q.submit(ran.append, 2)
+    release.set()
+    q.stop(drain=True, timeout=5)
+    assert ran == [1, 2]
+
+def test_stop_without_drain_cancels_pending(blocked_queue):
+    q, release = blocked_queue
+    pending = q.submit(lambda: True)
+    threading.Timer(0.1, release.set).start()
+    q.stop(drain=False, timeout=5)
+    assert q.status(pending)["status"] == "failed"
+    assert q.status(pending)["error"] == "cancelled"
+
+def test_set_stage_updates_running_job():
+    q = PrintJobQueue("test-stage", maxsize=2, workers=1)
+    seen = threading.Event()
+    proceed = threading.Event()
+
+    def job():
+        set_stage("rendering")
+        seen.set()
+        proceed.wait(5)
+
+    try:
+        job_id = q.submit(job)
+        assert seen.wait(5)
+        assert q.status(job_id)["status"] == "rendering"
+        proceed.set()
+        wait_for(lambda: q.status(job_id)["status"] == "done")
+    finally:
+        proceed.set()
+        q.stop()
@@ -0,0 +1,124 @@
+# test_session_store.py
+# مخزن جلسات الطباعة: ميزانية الذاكرة (LRU)، المهلة (TTL)، تحرير عناصر الاتصال، إلغاء الفك، و disown
+
+import time
+from concurrent.futures import Future
+
+from session_store import PrintSessionStore
+
+class Buffer:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_budget_evicts_least_recently_used_image_box():
+    store = PrintSessionStore(max_bytes=250)
+    store.put('image_boxes', 'a', {}, nbytes=100)
+    store.put('image_boxes', 'b', {}, nbytes=100)
+    store.get('image_boxes', 'a')  # a أحدث استخدامًا من b
+    store.put('image_boxes', 'c', {}, nbytes=100)
+    assert ('image_boxes', 'b') not in store
+    assert ('image_boxes', 'a') in store
+    assert ('image_boxes', 'c') in store
+    assert store.bytes_held == 200
+    assert store.stats()['evicted'] == 1
+
+def test_budget_never_evicts_the_box_being_added():
+    store = PrintSessionStore(max_bytes=50)
+    store.put('image_boxes', 'big', {}, nbytes=100)
+    assert ('image_boxes', 'big') in store
+
+def test_eviction_releases_pixel_buffers():
+    store = PrintSessionStore(max_bytes=100)
+    buf = Buffer()
+    store.put('image_boxes', 'a', {'pixels': buf}, nbytes=100)
+    store.put('image_boxes', 'b', {}, nbytes=100)
+    assert buf.closed
+
+def test_ttl_sweep_removes_idle_entries():
+    store = PrintSessionStore(ttl=0.05)
+    store.put('film_sessions', 'old', {})
+    time.sleep(0.1)
+    store.put('film_sessions', 'fresh', {})
+    assert store.sweep() == 1
+    assert ('film_sessions', 'old') not in store
+    assert ('film_sessions', 'fresh') in store
+
+def test_release_owner_frees_only_that_association():
+    store = PrintSessionStore()
+    buf = Buffer()
+    store.put('film_boxes', 'fb1', {}, owner=1)
+    store.put('image_boxes', 'ib1', {'pixels': buf}, owner=1, nbytes=10)
+    store.put('image_boxes', 'ib2', {}, owner=2, nbytes=10)
+    assert store.release_owner(1) == 2
+    assert buf.closed
+    assert ('image_boxes', 'ib2') in store
+    assert store.bytes_held == 10
+
+def test_disowned_entries_survive_release():
+    store = PrintSessionStore()
+    store.put('image_boxes', 'queued', {}, owner=1, nbytes=10)
+    store.disown('image_boxes', 'queued')
+    assert store.release_owner(1) == 0
+    assert ('image_boxes', 'queued') in store
+
+def test_pop_hands_over_without_release():
+    store = PrintSessionStore()
+    buf = Buffer()
+    store.put('image_boxes', 'a', {'pixels': buf}, nbytes=10)
+    data = store.pop('image_boxes', 'a')
+    assert data['pixels'] is buf
+    assert not buf.closed
+    assert store.bytes_held == 0
+
+def test_discarded_image_boxes_cancel_pending_decode():
+    store = PrintSessionStore(max_bytes=100)
+    evicted, deleted, released = Future(), Future(), Future()
+    store.put('image_boxes', 'a', {'decoded': evicted}, nbytes=100)
+    store.put('image_boxes', 'b', {'decoded': deleted}, nbytes=100)
+    store.delete('b')
+    store.put('image_boxes', 'c', {'decoded': released}, owner=1)
+    store.release_owner(1)
+    assert evicted.cancelled() and deleted.cancelled() and released.cancelled()
+
+def test_popped_decode_is_not_cancelled():
+    store = PrintSessionStore()
+    future = Future()
+    store.put('image_boxes', 'a', {'decoded': future})
+    assert store.pop('image_boxes', 'a')['decoded'] is future
+    assert not future.cancelled()
+
+def test_queued_boxes_survive_budget_and_sweep():
+    store = PrintSessionStore(max_bytes=250, ttl=0.05)
+    queued = Buffer()
+    store.put('image_boxes', 'queued', {'pixels': queued}, owner=1, nbytes=100)
+    store.disown('image_boxes', 'queued')
+    store.put('film_boxes', 'film', {}, owner=1)
+    store.disown('film_boxes', 'film')
+    store.put('image_boxes', 'idle', {}, nbytes=100)
+    assert store.put('image_boxes', 'new', {}, nbytes=100)
+    assert ('image_boxes', 'idle') not in store
+    time.sleep(0.1)
+    assert store.sweep() == 1   # new فقط
+    assert ('image_boxes', 'queued') in store and ('film_boxes', 'film') in store
+    assert not queued.closed
+    assert store.stats()['bytes_queued'] == 100
+
+def test_put_refused_when_queued_boxes_fill_budget():
+    store = PrintSessionStore(max_bytes=150)
+    store.put('image_boxes', 'queued', {}, nbytes=100)
+    store.disown('image_boxes', 'queued')
+    assert not store.put('image_boxes', 'new', {}, nbytes=100)
+    assert ('image_boxes', 'new') not in store
+    assert store.bytes_held == 100
+    assert store.put('image_boxes', 'small', {}, nbytes=50)
+
+def test_unqueue_restores_ttl():
+    store = PrintSessionStore(ttl=0.05)
+    store.put('film_boxes', 'film', {})
+    store.disown('film_boxes', 'film')
+    store.unqueue('film_boxes', 'film')
+    time.sleep(0.1)
+    assert store.sweep() == 1
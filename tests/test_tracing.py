@@ -0,0 +1,94 @@
+# test_tracing.py
+# التتبع: spans ومجاميعها، traced_job (الطابور، التفعيل، الحالة)، span خارج مهمة، وملف Chrome Trace
+
+import json
+
+import pytest
+
+import tracing
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    monkeypatch.setattr(tracing, "_writer", None)
+    monkeypatch.setitem(tracing._config, "TraceFile", "")
+    finished = []
+    original = tracing.Trace.finish
+
+    def finish(self, status="done", **fields):
+        finished.append((self, status))
+        original(self, status, **fields)
+
+    monkeypatch.setattr(tracing.Trace, "finish", finish)
+    yield finished
+    tracing._open.clear()
+
+def test_totals_sum_spans_per_stage():
+    trace = tracing.Trace("job")
+    trace.add("decode", 0, 2_000_000)
+    trace.add("decode", 10_000_000, 11_000_000)
+    trace.add("compose", 0, 500_000)
+    trace.mark("queued")
+    assert trace.totals() == {"decode_ms": 3.0, "compose_ms": 0.5}
+
+def test_span_outside_trace_is_noop():
+    assert tracing.current() is None
+    with tracing.span("decode"):
+        pass
+
+def test_start_is_none_when_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", False)
+    assert tracing.start("uid", "film_box") is None
+    assert tracing.get("uid") is None
+
+def test_traced_job_closes_queue_and_reports_status(enabled):
+    @tracing.traced_job
+    def job(uid, ok):
+        with tracing.span("compose"):
+            pass
+        return ok
+
+    for uid, ok, status in (("a", True, "done"), ("b", False, "failed")):
+        trace = tracing.start(uid, "film_box")
+        trace.begin("queue")
+        assert job(uid, ok) is ok
+        assert tracing.get(uid) is None
+        assert {"queue_ms", "compose_ms"} <= set(trace.totals())
+        assert enabled[-1] == (trace, status)
+    assert tracing.current() is None
+
+def test_traced_job_marks_exception_failed(enabled):
+    @tracing.traced_job
+    def job(uid):
+        raise RuntimeError("boom")
+
+    trace = tracing.start("c", "film_box")
+    with pytest.raises(RuntimeError):
+        job("c")
+    assert enabled == [(trace, "failed")]
+    assert trace.finished
+
+def test_traced_job_without_trace_just_runs(enabled):
+    calls = []
+    tracing.traced_job(lambda uid: calls.append(uid))("untracked")
+    assert calls == ["untracked"] and enabled == []
+
+def test_open_traces_are_bounded(enabled, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_OPEN_TRACES", 3)
+    for i in range(5):
+        tracing.start(i, "film_box")
+    assert list(tracing._open) == [2, 3, 4]
+
+def test_chrome_trace_file_is_valid_json(tmp_path):
+    path = tmp_path / "trace.json"
+    writer = tracing.ChromeTraceWriter(str(path))
+    for name in ("first", "second"):
+        trace = tracing.Trace("film_box", uid=name)
+        trace.add("decode", tracing.now(), tracing.now() + 1000)
+        trace.mark("spooled")
+        writer.write(trace, "done")
+    tracing.ChromeTraceWriter(str(path))   # إعادة الفتح لا تكرر '['
+    text = path.read_text(encoding="utf-8")
+    events = json.loads(text.rstrip().rstrip(",") + "]")
+    assert [e["ph"] for e in events] == ["X", "X", "i"] * 2
+    assert {e["args"]["uid"] for e in events} == {"first", "second"}
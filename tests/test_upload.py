@@ -0,0 +1,131 @@
+# test_upload.py
+# رفع HTTP: UploadSpool (الحجم، sha256، الحد الأقصى، الاسم النهائي)، ورموز /upload: 202 / 413 / 503 / 400
+# process_upload: حذف الملف المرفوع ومخرجاته بعد الطباعة (إلا مع UploadKeepFiles)
+
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import http_server
+import print_backends
+from print_backends import CupsBackend, FileBackend
+from print_queue import PrintJobQueue
+from utils import UploadSpool, UploadTooLarge, safe_filename
+
+def test_safe_filename_strips_paths_and_symbols():
+    assert safe_filename("../../etc/passwd") == "passwd"
+    assert safe_filename("C:\\scans\\my scan (1).dcm") == "my_scan_1_.dcm"
+    assert safe_filename("") == "upload"
+
+def test_spool_hashes_and_finishes(tmp_path):
+    spool = UploadSpool(tmp_path, filename="a b.txt")
+    spool.copy_from(io.BytesIO(b"x" * 5000), chunk_size=1024)
+    path = spool.finish()
+    assert spool.size == 5000
+    assert spool.sha256 == hashlib.sha256(b"x" * 5000).hexdigest()
+    assert path.endswith("_a_b.txt")
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+def test_spool_rejects_past_limit(tmp_path):
+    spool = UploadSpool(tmp_path, max_bytes=10)
+    with pytest.raises(UploadTooLarge):
+        spool.write(b"x" * 11)
+    spool.discard()
+    assert os.listdir(tmp_path) == []
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_server, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(http_server, "process_upload", lambda path, sha256=None: True)
+    queue = PrintJobQueue("test-upload", maxsize=4, workers=1)
+    monkeypatch.setattr(http_server, "upload_queue", queue)
+    yield http_server.app.test_client()
+    queue.stop(drain=False, timeout=5)
+
+def test_raw_body_upload_is_queued(client, tmp_path):
+    rsp = client.post("/upload?filename=report.txt", data=b"hello", content_type="application/octet-stream")
+    assert rsp.status_code == 202
+    body = rsp.get_json()
+    assert body["status"] == "queued"
+    assert body["bytes"] == 5
+    assert body["sha256"] == hashlib.sha256(b"hello").hexdigest()
+    assert os.path.exists(body["path"]) and body["path"].endswith("_report.txt")
+
+def test_multipart_upload_is_queued(client):
+    rsp = client.post("/upload", data={"file": (io.BytesIO(b"data"), "scan.dcm")},
+                      content_type="multipart/form-data")
+    assert rsp.status_code == 202
+    assert rsp.get_json()["path"].endswith("_scan.dcm")
+
+def test_oversize_upload_is_413_and_leaves_nothing(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_server, "UPLOAD_MAX_BYTES", 10)
+    rsp = client.post("/upload", data={"file": (io.BytesIO(b"x" * 100), "big.bin")},
+                      content_type="multipart/form-data")
+    assert rsp.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+def test_missing_file_is_400(client):
+    rsp = client.post("/upload", data={"other": "value"}, content_type="multipart/form-data")
+    assert rsp.status_code == 400
+
+def test_full_queue_is_503_and_discards_upload(client, tmp_path, monkeypatch):
+    release = threading.Event()
+    queue = PrintJobQueue("test-upload-full", maxsize=1, workers=1)
+    running = queue.submit(release.wait)
+    while queue.status(running)["status"] != "running":
+        time.sleep(0.01)
+    queue.submit(release.wait)
+    monkeypatch.setattr(http_server, "upload_queue", queue)
+    try:
+        rsp = client.post("/upload?filename=a.txt", data=b"hello", content_type="application/octet-stream")
+        assert rsp.status_code == 503
+        assert os.listdir(tmp_path) == []
+    finally:
+        release.set()
+        queue.stop(timeout=5)
+
+@pytest.fixture
+def file_backend(tmp_path, monkeypatch):
+    backend = FileBackend(output_dir=str(tmp_path / "printed"))
+    monkeypatch.setattr(print_backends, "_backend", backend)
+    return backend
+
+def fake_convert(path, content_hash=None, out_dir=None):
+    os.makedirs(out_dir)
+    pages = [os.path.join(out_dir, f"page{i}.pdf") for i in (1, 2)]
+    for page in pages:
+        with open(page, "wb") as fp:
+            fp.write(b"%PDF-1.4\n")
+    return pages
+
+@pytest.mark.parametrize("keep", [False, True])
+def test_process_upload_removes_upload_and_outputs(tmp_path, monkeypatch, file_backend, keep):
+    monkeypatch.setattr(http_server, "convert_outputs", fake_convert)
+    monkeypatch.setattr(http_server, "UPLOAD_KEEP_FILES", keep)
+    upload = tmp_path / "scan.txt"
+    upload.write_bytes(b"text")
+    assert http_server.process_upload(str(upload))
+    assert sorted(os.listdir(tmp_path / "printed")) == [".catalog.jsonl", "page1.pdf", "page2.pdf"]
+    assert upload.exists() is keep
+    assert os.path.exists(f"{upload}.out") is keep
+
+def test_process_upload_cleans_up_after_failed_conversion(tmp_path, monkeypatch, file_backend):
+    monkeypatch.setattr(http_server, "convert_outputs", lambda *a, **k: [])
+    upload = tmp_path / "broken.bin"
+    upload.write_bytes(b"?")
+    assert not http_server.process_upload(str(upload))
+    assert not upload.exists()
+
+def test_cups_takes_temporary_files_out_of_caller_directory(tmp_path):
+    backend = CupsBackend(batch_size=10, batch_timeout=60, spool_dir=str(tmp_path / "spool"))
+    source = tmp_path / "page.pdf"
+    source.write_bytes(b"%PDF")
+    assert backend.print_file(str(source), temporary=True)
+    assert not source.exists()
+    (pending, temporary, _), = backend._pending
+    assert temporary and os.path.dirname(pending) == str(tmp_path / "spool")
+    backend.close()
@@ -0,0 +1,58 @@
+# test_windowing.py
+# محرك النافذة: النافذة الخطية، Rescale، MONOCHROME1، إهمال البتات فوق BitsStored، والقيم الموقعة
+
+import numpy as np
+from pydicom.dataset import Dataset
+
+from windowing import build_lut, window_array, window_dataset
+
+def test_linear_window_endpoints():
+    arr = np.array([0, 1000, 2000, 4095], dtype=np.uint16)
+    out = window_array(arr, bits_stored=12, window=(2048, 4096))
+    assert out.dtype == np.uint8
+    assert out[0] == 0
+    assert out[-1] == 255
+    assert list(out) == sorted(out)
+
+def test_values_outside_window_are_clipped():
+    arr = np.array([0, 99, 100, 200, 300], dtype=np.uint16)
+    out = window_array(arr, window=(150, 101))
+    assert out[0] == out[1] == 0
+    assert out[-1] == 255
+
+def test_rescale_slope_and_intercept_are_applied_before_window():
+    # CT: القيمة المخزنة 1024 مع Intercept -1024 = 0 HU في مركز النافذة
+    arr = np.array([1024], dtype=np.uint16)
+    out = window_array(arr, slope=1.0, intercept=-1024.0, window=(0, 400))
+    assert abs(int(out[0]) - 128) <= 1
+
+def test_monochrome1_is_inverted():
+    ds = Dataset()
+    ds.BitsStored = 8
+    ds.PixelRepresentation = 0
+    ds.WindowCenter = 128
+    ds.WindowWidth = 256
+    arr = np.array([[0, 255]], dtype=np.uint8)
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    normal = window_dataset(ds, arr)
+    ds.PhotometricInterpretation = "MONOCHROME1"
+    inverted = window_dataset(ds, arr)
+    assert (inverted == 255 - normal).all()
+    assert inverted[0, 0] == 255
+
+def test_bits_above_bits_stored_are_ignored():
+    # overlay في البتات العليا لا يغير الناتج
+    arr = np.array([100, 100 | 0xF000], dtype=np.uint16)
+    out = window_array(arr, bits_stored=12, window=(2048, 4096))
+    assert out[0] == out[1]
+
+def test_signed_values_use_sign_extension():
+    lut = build_lut(16, 12, signed=True, window=(0, 4096))
+    # 0x800 في 12 بت موقعة = -2048 (أدنى قيمة)، و 0x7FF = 2047 (أعلى قيمة)
+    assert lut[0x800] == 0
+    assert lut[0x7FF] == 255
+
+def test_default_range_uses_actual_min_max():
+    arr = np.array([500, 750, 1000], dtype=np.uint16)
+    out = window_array(arr)
+    assert (out[0], out[-1]) == (0, 255)
@@ -0,0 +1,62 @@
+# test_wsgi.py
+# نشر WSGI: عملية واحدة فقط (gunicorn.conf.py و wsgi.multiprocess)، وإيقاف waitress بعد اكتمال الطلبات الجارية
+
+import http.client
+import importlib.util
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from werkzeug.test import Client
+
+import http_server
+import wsgi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_single_process_is_served():
+    assert Client(wsgi.application).get("/jobs").status_code == 200
+
+def test_multiprocess_server_is_refused():
+    rsp = Client(wsgi.application).get("/jobs", environ_overrides={"wsgi.multiprocess": True})
+    assert rsp.status_code == 500
+
+def load_gunicorn_conf():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(ROOT, "gunicorn.conf.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_gunicorn_conf_rejects_several_workers():
+    conf = load_gunicorn_conf()
+    assert conf.workers == 1 and conf.worker_class == "gthread"
+    conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=1)))
+    with pytest.raises(RuntimeError):
+        conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=4)))
+
+def test_waitress_shutdown_waits_for_running_request():
+    pytest.importorskip("waitress")
+    app = Flask("slow")
+    app.add_url_rule("/slow", "slow", lambda: time.sleep(0.5) or "done")
+    server = http_server.WaitressServer(app, "127.0.0.1", 0)
+    port = server._server.effective_port
+    loop = threading.Thread(target=server.serve_forever, daemon=True)
+    loop.start()
+    result = {}
+
+    def request():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("GET", "/slow")
+        result["body"] = conn.getresponse().read()
+        conn.close()
+
+    client = threading.Thread(target=request)
+    client.start()
+    time.sleep(0.2)
+    server.shutdown(timeout=5)
+    client.join()
+    assert result["body"] == b"done"
+    assert not loop.is_alive()
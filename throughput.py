@@ -0,0 +1,62 @@
+# throughput.py
+# وضع القياس: عدّ البايتات المستلمة لكل اتصال DICOM وتسجيل معدل الاستقبال (بايت/ثانية) عند انتهائه
+# يُستخدم لضبط حجم PDU وصيغ النقل لكل جهاز (Modality) حسب AE Title المرسل
+
+import threading
+import time
+
+from pynetdicom import evt
+
+from log import safe_print
+
+class ThroughputMeter:
+    """عدادات استقبال لكل اتصال مفتوح - تُربط بأحداث pynetdicom عبر handlers()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assocs = {}
+
+    def handlers(self):
+        """معالجات الأحداث التي تُضاف إلى evt_handlers في start_server"""
+        return [
+            (evt.EVT_ACCEPTED, self.on_accepted),
+            (evt.EVT_DATA_RECV, self.on_data),
+            (evt.EVT_RELEASED, self.on_closed),
+            (evt.EVT_ABORTED, self.on_closed),
+        ]
+
+    def on_accepted(self, event):
+        with self._lock:
+            self._assocs[id(event.assoc)] = {'bytes': 0, 'pdus': 0, 'start': time.perf_counter(), 'first': None}
+
+    def on_data(self, event):
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._assocs.get(id(event.assoc))
+            if entry is None:
+                return
+            entry['bytes'] += len(event.data)
+            entry['pdus'] += 1
+            if entry['first'] is None:
+                entry['first'] = now
+            entry['last'] = now
+
+    def on_closed(self, event):
+        with self._lock:
+            entry = self._assocs.pop(id(event.assoc), None)
+        if entry is None or not entry['pdus']:
+            return
+        # المدة من أول PDU حتى آخر PDU حتى لا يُحتسب وقت الخمول قبل الإغلاق
+        seconds = max(entry['last'] - entry['first'], 1e-6)
+        requestor = event.assoc.requestor
+        safe_print(
+            "📶 معدل الاستقبال",
+            peer=str(requestor.ae_title).strip(),
+            address=requestor.address,
+            bytes=entry['bytes'],
+            pdus=entry['pdus'],
+            avg_pdu=entry['bytes'] // entry['pdus'],
+            peer_max_pdu=requestor.maximum_length,
+            seconds=round(seconds, 3),
+            bytes_per_sec=int(entry['bytes'] / seconds),
+        )
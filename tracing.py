@@ -0,0 +1,226 @@
+# tracing.py
+# تتبع خفيف لكل مهمة طباعة: معرف واحد من N-CREATE حتى الإرسال للطابعة
+# كل مرحلة (receive / decode / window / render / resize / encode / submit / spool) تُسجَّل كـ span بتوقيت رتيب
+# (decode / render / spool تأتي من metrics.stage فتطابق rcp_stage_seconds؛ الباقي مراحل فرعية داخلها)
+# (perf_counter_ns)، وعند انتهاء المهمة: سطر سجل منظم بمجموع كل مرحلة، وأحداث Chrome Trace اختيارية
+# (TraceFile) تُفتح في chrome://tracing أو Perfetto للتحليل لاحقًا
+
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from config import load_config
+from log import safe_print
+
+# أقصى عدد تتبعات مفتوحة (Film Box أُنشئ ولم يُطبع) قبل حذف الأقدم
+MAX_OPEN_TRACES = 1000
+
+_config = load_config()
+ENABLED = bool(_config["Tracing"])
+
+_lock = threading.Lock()
+_open = OrderedDict()   # مفتاح (UID) -> Trace
+_local = threading.local()
+_writer = None
+
+def now():
+    """توقيت رتيب بالنانوثانية (نفس مرجع كل spans)"""
+    return time.perf_counter_ns()
+
+class Trace:
+    """spans مهمة واحدة: (الاسم، البداية، النهاية، الخيط، الحقول) بالنانوثانية"""
+
+    def __init__(self, name, **fields):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.fields = fields
+        self.start_ns = now()
+        self.spans = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.finished = False
+
+    def add(self, name, start_ns, end_ns=None, **fields):
+        end_ns = now() if end_ns is None else end_ns
+        with self._lock:
+            self.spans.append((name, start_ns, end_ns, threading.get_ident(), fields))
+
+    def begin(self, name):
+        """بداية span ينتهي في خيط أو دالة أخرى (مثل الانتظار في الطابور)"""
+        with self._lock:
+            self._pending[name] = now()
+
+    def end(self, name, **fields):
+        with self._lock:
+            started = self._pending.pop(name, None)
+        if started is not None:
+            self.add(name, started, **fields)
+
+    def mark(self, name, **fields):
+        """حدث لحظي (بدون مدة)"""
+        moment = now()
+        self.add(name, moment, moment, **fields)
+
+    @contextmanager
+    def span(self, name, **fields):
+        started = now()
+        try:
+            yield self
+        finally:
+            self.add(name, started, **fields)
+
+    def totals(self):
+        """مجموع مدة كل مرحلة بالمللي ثانية (المراحل المتداخلة تُحسب كل على حدة)"""
+        totals = {}
+        with self._lock:
+            for name, start, end, _, _ in self.spans:
+                if end > start:
+                    totals[name] = totals.get(name, 0) + (end - start)
+        return {f"{name}_ms": round(ns / 1e6, 2) for name, ns in totals.items()}
+
+    def finish(self, status="done", **fields):
+        """سطر سجل منظم + أحداث Chrome Trace - مرة واحدة فقط"""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        self.fields.update(fields)
+        total_ms = round((now() - self.start_ns) / 1e6, 2)
+        safe_print("🧭 تتبع المهمة", trace=self.id, kind=self.name, status=status,
+                   total_ms=total_ms, **self.totals(), **self.fields)
+        writer = _get_writer()
+        if writer is not None:
+            writer.write(self, status)
+
+# =================================================================
+#                 تصدير Chrome Trace
+# =================================================================
+
+class ChromeTraceWriter:
+    """ملف JSON Array Format: '[' ثم حدث لكل سطر - القوس الختامي اختياري في عارض Chrome/Perfetto"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.write("[\n")
+
+    def write(self, trace, status):
+        # الصف 0 يحمل المهمة كاملة، وبقية spans على خيوطها الفعلية (الاتصال، عامل الطابور)
+        args = {"trace": trace.id, "kind": trace.name, **{k: str(v) for k, v in trace.fields.items()}}
+        events = [{
+            "name": f"{trace.name} {trace.id}", "cat": "job", "ph": "X", "pid": self._pid, "tid": 0,
+            "ts": trace.start_ns / 1000, "dur": (now() - trace.start_ns) / 1000,
+            "args": {**args, "status": status},
+        }]
+        with trace._lock:
+            spans = list(trace.spans)
+        for name, start, end, tid, fields in spans:
+            event = {"name": name, "cat": trace.name, "pid": self._pid, "tid": tid, "ts": start / 1000,
+                     "args": {**args, **{k: str(v) for k, v in fields.items()}}}
+            if end > start:
+                event.update(ph="X", dur=(end - start) / 1000)
+            else:
+                event.update(ph="i", s="t")
+            events.append(event)
+        data = "".join(json.dumps(e, ensure_ascii=False) + ",\n" for e in events)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as fp:
+                fp.write(data)
+
+def _get_writer():
+    global _writer
+    path = _config["TraceFile"]
+    if not path:
+        return None
+    with _lock:
+        if _writer is None:
+            _writer = ChromeTraceWriter(path)
+        return _writer
+
+# =================================================================
+#                 ربط التتبع بالكائنات والخيوط
+# =================================================================
+
+def start(key, name, **fields):
+    """تتبع جديد مسجل باسم key (UID الـ Film Box أو صندوق الصورة) - None إن كان التتبع معطلًا"""
+    if not ENABLED:
+        return None
+    trace = Trace(name, **fields)
+    with _lock:
+        _open[key] = trace
+        while len(_open) > MAX_OPEN_TRACES:
+            _open.popitem(last=False)
+    return trace
+
+def get(key):
+    with _lock:
+        return _open.get(key)
+
+def get_or_start(key, name, **fields):
+    return get(key) or start(key, name, **fields)
+
+def pop(key):
+    with _lock:
+        return _open.pop(key, None)
+
+def current():
+    """التتبع النشط في هذا الخيط (داخل activate) أو None"""
+    return getattr(_local, "trace", None)
+
+@contextmanager
+def activate(trace):
+    """جعل trace هو التتبع الحالي للخيط حتى تسجل الدوال العميقة spans بدون تمريره"""
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+def span(name, **fields):
+    """span على التتبع الحالي - لا شيء خارج مهمة متتبعة"""
+    trace = current()
+    if trace is None:
+        return nullcontext()
+    return trace.span(name, **fields)
+
+def spanned(name):
+    """Decorator: تنفيذ الدالة داخل span(name) على التتبع الحالي"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced_job(func):
+    """Decorator لدالة مهمة أول معاملاتها مفتاح التتبع (UID)
+
+    يسحب التتبع المسجل، يغلق span الانتظار في الطابور، يفعّله أثناء المهمة، ثم ينهيه بحالتها.
+    """
+    @functools.wraps(func)
+    def wrapper(key, *args, **kwargs):
+        trace = pop(key)
+        if trace is None:
+            return func(key, *args, **kwargs)
+        trace.end("queue")
+        status = "failed"
+        try:
+            with activate(trace):
+                result = func(key, *args, **kwargs)
+            status = "failed" if result is False else "done"
+            return result
+        finally:
+            trace.finish(status)
+    return wrapper
@@ -1,8 +1,11 @@
 # utils.py
 # دوال مساعدة: إنشاء مجلدات، حفظ ملفات الرفع، حفظ DICOM، حفظ PixelData احتياطيًا
 
+import hashlib
 import os
 import pathlib
+import re
+import uuid
 from pydicom import dcmwrite
 from PIL import Image
 import numpy as np
@@ -22,6 +25,81 @@ def save_uploaded_file(storage_file, filename=None):
     storage_file.save(dest)
     return str(dest)
 
+class UploadTooLarge(Exception):
+    """تجاوز الملف المرفوع الحد الأقصى UploadMaxBytes"""
+
+def safe_filename(name):
+    """اسم ملف آمن من اسم العميل (بدون مسارات أو رموز خاصة) مع الإبقاء على الامتداد"""
+    name = os.path.basename(str(name or '').replace('\\', '/'))
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._')
+    return name[:100] or 'upload'
+
+class UploadSpool:
+    """ملف مؤقت فريد يُكتب قطعة بقطعة مع حساب sha256 والحجم وفرض الحد الأقصى
+
+    يعمل كـ stream لمحلل multipart في Werkzeug أو مع قراءة جسم الطلب مباشرة.
+    """
+
+    def __init__(self, directory=RECEIVED_DIR, max_bytes=0, filename=None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.max_bytes = int(max_bytes or 0)
+        self.path = self.directory / f"{self.id}.part"
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(f"{self.size} > {self.max_bytes}")
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def copy_from(self, stream, chunk_size=1024 * 1024):
+        """نسخ stream (جسم الطلب) إلى الملف قطعة بقطعة بدون تحميله في الذاكرة"""
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            self.write(chunk)
+        return self
+
+    def finish(self, filename=None):
+        """إغلاق الملف ونقله للاسم النهائي <id>_<name> - يعيد المسار"""
+        self._file.close()
+        final = self.directory / f"{self.id}_{safe_filename(filename or self.filename)}"
+        os.replace(self.path, final)
+        self.path = final
+        return str(final)
+
+    def discard(self):
+        """حذف ملف غير مكتمل أو مرفوض"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        # يستدعيه Werkzeug عند نهاية الطلب - لا يحذف الملف المكتمل
+        self._file.close()
+
 def save_dicom_dataset(ds, filename):
     """حفظ Dataset كامل كملف dcm داخل received/"""
     out = RECEIVED_DIR / filename
@@ -0,0 +1,133 @@
+# windowing.py
+# محرك نافذة موحد لكل مسارات الفك: تحويل 8/12/16 بت إلى uint8 عبر جداول LUT محسوبة مسبقًا
+# الجدول يُفهرس مباشرة بالقيمة المخزنة (uint16) فتُحوَّل الصورة بعملية take واحدة بدون مصفوفات float
+
+from functools import lru_cache
+
+import numpy as np
+
+def _first(value):
+    """أول قيمة من عنصر متعدد القيم (WindowCenter قد يكون قائمة)"""
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes, int, float)):
+        return float(value)
+    return float(value[0]) if len(value) else None
+
+def _map_values(values, window=None, value_range=None, voi_lut=None):
+    """تحويل قيم Modality (float64) إلى 0..255 حسب VOI LUT أو النافذة أو المدى"""
+    if voi_lut is not None:
+        first_mapped, lut_bits, data = voi_lut
+        data = np.asarray(data, dtype=np.float64)
+        idx = np.clip(values - first_mapped, 0, len(data) - 1).astype(np.intp)
+        return data[idx] * (255.0 / ((1 << lut_bits) - 1))
+    if window is not None:
+        center, width = window
+        if width <= 1:
+            return np.where(values < center - 0.5, 0.0, 255.0)
+        # المعادلة الخطية من DICOM PS3.3 C.11.2.1.2
+        return ((values - (center - 0.5)) / (width - 1) + 0.5) * 255.0
+    lo, hi = value_range
+    if hi <= lo:
+        return np.zeros_like(values)
+    return (values - lo) * (255.0 / (hi - lo))
+
+@lru_cache(maxsize=64)
+def build_lut(bits_allocated, bits_stored, signed=False, slope=1.0, intercept=0.0,
+              window=None, value_range=None, voi_lut=None, invert=False):
+    """جدول uint8 بطول 2**bits_allocated مفهرس بالقيمة الخام
+
+    البتات فوق BitsStored تُهمل داخل الجدول نفسه، والقيم السالبة (PixelRepresentation=1)
+    تُمد إشارتها، فلا حاجة لأي تمريرة إضافية على الصورة.
+    """
+    size = 1 << bits_allocated
+    stored = np.arange(size, dtype=np.int64) & ((1 << bits_stored) - 1)
+    if signed:
+        sign_bit = 1 << (bits_stored - 1)
+        stored = np.where(stored & sign_bit, stored - (1 << bits_stored), stored)
+    values = stored * float(slope) + float(intercept)
+    out = _map_values(values, window, value_range, voi_lut)
+    lut = np.clip(np.rint(out), 0, 255).astype(np.uint8)
+    if invert:
+        lut = 255 - lut
+    lut.flags.writeable = False
+    return lut
+
+def window_array(arr, bits_stored=None, signed=None, slope=1.0, intercept=0.0,
+                 window=None, value_range=None, voi_lut=None, invert=False):
+    """تحويل مصفوفة بكسل (أي شكل) إلى uint8
+
+    window = (center, width) بوحدات Modality، voi_lut = (first_mapped, bits, data)،
+    وإن لم يُحدد أي منهما يُستخدم مدى القيم الفعلي (min..max) كما في التطبيع القديم.
+    """
+    arr = np.asarray(arr)
+    if signed is None:
+        signed = arr.dtype.kind == 'i'
+    slope = float(slope if slope is not None else 1.0)
+    intercept = float(intercept if intercept is not None else 0.0)
+
+    if window is None and voi_lut is None and value_range is None:
+        lo, hi = arr.min(), arr.max()
+        lo, hi = sorted((float(lo) * slope + intercept, float(hi) * slope + intercept))
+        value_range = (lo, hi)
+
+    if arr.dtype.kind not in 'ui' or arr.dtype.itemsize > 2:
+        # float / 32 بت: لا يمكن فهرسة جدول - تحويل مباشر
+        values = arr.astype(np.float64) * slope + intercept
+        out = np.clip(np.rint(_map_values(values, window, value_range, voi_lut)), 0, 255).astype(np.uint8)
+        return 255 - out if invert else out
+
+    bits_allocated = arr.dtype.itemsize * 8
+    bits_stored = min(int(bits_stored or bits_allocated), bits_allocated)
+    lut = build_lut(bits_allocated, bits_stored, bool(signed), slope, intercept,
+                    window, value_range, voi_lut, bool(invert))
+    index = arr.view(np.uint16 if bits_allocated == 16 else np.uint8)
+    return lut.take(index)
+
+def voi_lut_from_dataset(ds):
+    """قراءة أول VOI LUT من VOILUTSequence كـ tuple قابل للتخزين في الكاش"""
+    seq = ds.get('VOILUTSequence')
+    if not seq:
+        return None
+    item = seq[0]
+    descriptor = item.get('LUTDescriptor')
+    data = item.get('LUTData')
+    if descriptor is None or data is None:
+        return None
+    entries, first_mapped, lut_bits = [int(v) for v in descriptor]
+    if isinstance(data, (bytes, bytearray)):
+        data = np.frombuffer(data, dtype=np.uint16 if lut_bits > 8 else np.uint8)
+    data = tuple(int(v) for v in np.asarray(data).ravel()[:entries or 65536])
+    return first_mapped, lut_bits, data
+
+def window_dataset(ds, arr=None, window=None):
+    """تطبيق النافذة حسب سمات Dataset (BitsStored, Rescale, Window, VOI LUT, MONOCHROME1)
+
+    window = (center, width) يتجاوز نافذة الملف و VOI LUT.
+    """
+    if arr is None:
+        arr = ds.pixel_array
+    if int(ds.get('SamplesPerPixel', 1) or 1) > 1:
+        # صور ملونة: بدون نافذة، فقط تحجيم المدى إن لم تكن 8 بت
+        return arr if arr.dtype == np.uint8 else window_array(arr)
+
+    voi_lut = None
+    if window is None:
+        center = _first(ds.get('WindowCenter'))
+        width = _first(ds.get('WindowWidth'))
+        if center is not None and width is not None:
+            window = (center, width)
+        voi_lut = voi_lut_from_dataset(ds)
+    else:
+        window = (float(window[0]), float(window[1]))
+
+    return window_array(
+        arr,
+        bits_stored=ds.get('BitsStored'),
+        signed=bool(ds.get('PixelRepresentation', arr.dtype.kind == 'i')),
+        slope=ds.get('RescaleSlope', 1.0),
+        intercept=ds.get('RescaleIntercept', 0.0),
+        window=window,
+        voi_lut=voi_lut,
+        invert=ds.get('PhotometricInterpretation', '') == 'MONOCHROME1',
+    )
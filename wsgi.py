@@ -0,0 +1,28 @@
+# wsgi.py
+# تطبيق WSGI واحد لواجهة HTTP (الرفع، المهام، /metrics، متصفح الطباعة) لخوادم الإنتاج:
+#     gunicorn -b 0.0.0.0:8080 wsgi:application           (gunicorn.conf.py: gthread، عامل واحد، HttpThreads خيط)
+#     waitress-serve --threads=8 --channel-timeout=30 --port=8080 wsgi:application
+# gunicorn يرسل ملفات /prints عبر os.sendfile (wsgi.file_wrapper) بدون حجز خيط بايثون أثناء النقل.
+#
+# عملية واحدة فقط والتوازي بالخيوط: طابور الرفع وجدول المهام في ذاكرة العملية، فمع عدة عمال لا يعرف
+# /jobs/<id> إلا العامل الذي استقبل الرفع (ومعرفات المهام تتكرر بينهم)، و /metrics كذلك لعامل واحد.
+# gunicorn.conf.py يرفض التشغيل بـ -w أكبر من 1، وأي خادم آخر يعلن wsgi.multiprocess يتلقى 500 بدل نتائج خاطئة.
+# خادم DICOM يبقى عملية منفصلة (service.py --no-http أو dicom_print_scp.py)
+
+import logging
+
+import http_server
+from log import safe_print
+from main import prints
+
+app = http_server.app
+if "prints" not in app.blueprints:
+    app.register_blueprint(prints)
+
+def application(environ, start_response):
+    if environ.get("wsgi.multiprocess"):
+        safe_print("❌ wsgi:application يعمل بعدة عمليات - شغّله بعامل واحد وخيوط متعددة", level=logging.ERROR,
+                   server=environ.get("SERVER_SOFTWARE"))
+        start_response("500 Internal Server Error", [("Content-Type", "text/plain")])
+        return [b"wsgi:application requires a single worker process; scale with threads\n"]
+    return app(environ, start_response)